@@ -10,6 +10,12 @@ class CloudscanConfig(AppConfig):
 
     def ready(self):
         """Connect to MongoDB on startup and log the outcome."""
+        from . import tasks  # noqa: F401  registers the scan task handlers
+        from .metrics import register_mongo_listener
+
+        # Must precede ``connect`` so the client reports command timings.
+        register_mongo_listener()
+
         mongo_uri = os.getenv("MONGODB_URI")
         if not mongo_uri:
             print("❌ MONGODB_URI not set. Skipping MongoDB connection.")
@@ -34,3 +40,9 @@ class CloudscanConfig(AppConfig):
             except Exception as exc:
                 logger.error("❌ Failed to connect to MongoDB: %s", exc)
                 print(f"❌ Failed to connect to MongoDB: {exc}")
+                return
+
+        # Pick up jobs orphaned by a crash or redeploy.
+        from .executor import start_at_boot
+
+        start_at_boot()
@@ -0,0 +1,178 @@
+"""Async versions of the dashboard read endpoints.
+
+The history, findings and scan status views here return the same JSON as
+their DRF counterparts in ``views.py``, but they are coroutines that query
+MongoDB through ``asyncdb``. Served by an ASGI server (``prow.asgi``), one
+process keeps many dashboard reads in flight on a single event loop and a
+bounded connection pool, instead of blocking a worker thread per request.
+Query building and pagination are shared with the sync views. Only legacy
+scans with embedded findings fall back to the sync code in a thread.
+"""
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.renderers import JSONRenderer
+
+from .asyncdb import get_database
+from .caching import cached_json_response, findings_etag, not_modified, not_modified_response
+from .columnar import chunk_query, fill_data
+from .findings import (
+    PAGE_PROJECTION,
+    collection_page,
+    collection_query,
+    page_cursor,
+    page_findings,
+    page_size,
+    parse_filters,
+)
+from .findings_cache import FINDINGS_CACHE
+from .history import SCAN_FIELDS, history_cursor, history_pipeline, scan_history_match, uncounted
+from .models import AWSScan, GCPScan, Finding, FindingChunk, ScanJob, DOCUMENT_STORAGES
+from .views import (
+    AWS_HISTORY_FIELDS,
+    GCP_HISTORY_FIELDS,
+    STATUS_FIELDS,
+    findings_cache_control,
+    history_data,
+    status_data,
+)
+
+
+def _json(data, status=200):
+    """Render like a DRF ``Response`` so both read paths emit the same JSON."""
+    return HttpResponse(JSONRenderer().render(data), content_type="application/json", status=status)
+
+
+async def find_scan(db, model, scan_id=None):
+    """Return a scan by ID, or the latest one, without embedded findings."""
+    collection = db[model._get_collection_name()]
+    if scan_id is None:
+        doc = await collection.find_one({}, {"findings": 0}, sort=[("date", -1)])
+    else:
+        try:
+            doc = await collection.find_one({"_id": ObjectId(scan_id)}, {"findings": 0})
+        except (InvalidId, TypeError):
+            return None
+    return model._from_son(doc) if doc else None
+
+
+async def apage_findings(db, scan, filters=None, limit=None, after=None, sort="id"):
+    """Async ``page_findings``: return ``(findings, next_cursor)``."""
+    filters = filters or {}
+    cursor = page_cursor(sort, after)
+    # Loading a scan into the cache blocks, so only scans the sync views
+    # already loaded are answered from it here.
+    columns = FINDINGS_CACHE.get(scan)
+    if columns is not None:
+        return columns.page(filters, limit, cursor, sort)
+    if scan.storage not in DOCUMENT_STORAGES:
+        return await sync_to_async(page_findings)(scan, filters, limit, after, sort)
+    query, order = collection_query(scan, filters, cursor, sort)
+    rows = db[Finding._get_collection_name()].find(query, PAGE_PROJECTION).sort(order)
+    if limit is not None:
+        rows = rows.limit(limit + 1)
+    rows, next_cursor = collection_page(await rows.to_list(None), limit, sort)
+    chunks = chunk_query(rows)
+    if chunks is not None:
+        fill_data(rows, await db[FindingChunk._get_collection_name()].find(chunks).to_list(None))
+    return [row.get("data", {}) for row in rows], next_cursor
+
+
+async def ascan_history(db, model, params, limit=None, after=None):
+    """Async ``scan_history``: return ``(rows, next_cursor)``."""
+    pipeline = history_pipeline(scan_history_match(params), SCAN_FIELDS, "date", limit, after, id_type=ObjectId)
+    cursor = await db[model._get_collection_name()].aggregate(pipeline)
+    rows, next_cursor = history_cursor(await cursor.to_list(None), "date", limit)
+    findings = db[Finding._get_collection_name()]
+    for row in rows:
+        if uncounted(row):
+            row["findingsCount"] = await findings.count_documents({"scan": row["_id"]})
+    return rows, next_cursor
+
+
+async def _findings_page(request, model, scan_id=None):
+    db = get_database()
+    scan = await find_scan(db, model, scan_id)
+    if not scan:
+        if scan_id is None:
+            return _json({"findings": [], "next": None})
+        return _json({"error": "Scan not found"}, status=404)
+    params = request.GET
+    etag = findings_etag(scan, params)
+    cache_control = findings_cache_control(immutable=scan_id is not None and etag is not None)
+    if not_modified(request, etag):
+        return not_modified_response(etag, cache_control)
+    try:
+        findings, next_cursor = await apage_findings(
+            db,
+            scan,
+            parse_filters(params),
+            limit=page_size(params.get("limit")),
+            after=params.get("after"),
+            sort=params.get("sort", "id"),
+        )
+    except ValueError as exc:
+        return _json({"error": str(exc)}, status=400)
+    return cached_json_response(request, {"findings": findings, "next": next_cursor}, etag, cache_control)
+
+
+async def _scan_history(request, model, fields):
+    params = request.GET
+    try:
+        rows, next_cursor = await ascan_history(
+            get_database(), model, params, limit=page_size(params.get("limit")), after=params.get("after")
+        )
+    except ValueError as exc:
+        return _json({"error": str(exc)}, status=400)
+    return _json({"data": history_data(rows, fields), "next": next_cursor})
+
+
+@require_GET
+async def latest_aws_findings(request):
+    """Return findings from the most recent AWS scan."""
+    return await _findings_page(request, AWSScan)
+
+
+@require_GET
+async def latest_gcp_findings(request):
+    """Return findings from the most recent GCP scan."""
+    return await _findings_page(request, GCPScan)
+
+
+@require_GET
+async def aws_findings(request, scan_id):
+    """Return findings for a specific AWS scan."""
+    return await _findings_page(request, AWSScan, scan_id)
+
+
+@require_GET
+async def gcp_findings(request, scan_id):
+    """Return findings for a specific GCP scan."""
+    return await _findings_page(request, GCPScan, scan_id)
+
+
+@require_GET
+async def aws_scan_history(request):
+    """Return a page of AWS scans with basic info."""
+    return await _scan_history(request, AWSScan, AWS_HISTORY_FIELDS)
+
+
+@require_GET
+async def gcp_scan_history(request):
+    """Return a page of GCP scans with basic info."""
+    return await _scan_history(request, GCPScan, GCP_HISTORY_FIELDS)
+
+
+@require_GET
+async def scan_status(request, scan_id):
+    """Return progress info for a running scan."""
+    # ``scan_id`` is the primary key, stored as ``_id``.
+    doc = await get_database()[ScanJob._get_collection_name()].find_one(
+        {"_id": scan_id}, {field: 1 for field in STATUS_FIELDS}
+    )
+    if not doc:
+        return _json({"error": "Not found"}, status=404)
+    return _json(status_data(ScanJob._from_son(doc)))
@@ -1,30 +1,24 @@
 """Example async scan API views using MongoEngine persistence.
 
-These views run the scan in a background thread. For high volume systems,
-consider using a task queue such as Celery instead of ``threading`` so jobs
-survive process restarts and can be distributed across workers.
+Scans are queued as ``ScanJob`` documents and run by the bounded executor in
+``cloudscan.executor``, so jobs survive process restarts and can be picked up
+by any worker process (see the ``run_scan_worker`` management command).
 """
 
-import csv
-import os
 import tempfile
 from uuid import uuid4
-from threading import Thread
-from datetime import datetime
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
-from .models import ScanJob, GCPScan
-from .views import fetch_project_ids
-from .prowler_runner import run_prowler_gcp
-
-
-def _cleanup(path):
-    """Remove a temporary file if it exists."""
-    if path and os.path.exists(path):
-        os.remove(path)
+from .executor import HOST
+from .models import ScanJob
+from .views import _incremental_params, _truthy, fetch_project_ids
+from .coalesce import discard_key, enqueue_coalesced, flight_key, key_fingerprint
+from .fanout import children, overall_progress, start_multi_project_scan
+from .findings import page_size
+from .history import history_match, history_page
 
 
 class UploadKeyView(APIView):
@@ -55,6 +49,7 @@ class UploadKeyView(APIView):
             provider="GCP",
             status="uploaded",
             result={"key_path": key_path},
+            host=HOST,
         ).save()
 
         response = {"projects": projects, "keyId": key_id}
@@ -73,52 +68,89 @@ class StartGCPScanView(APIView):
         if not key_id or not project_id:
             return Response({"error": "keyId and projectId required"}, status=400)
 
-        # Retrieve and remove the uploaded key path stored in ScanJob
-        try:
-            key_job = ScanJob.objects.get(scan_id=key_id)
-        except ScanJob.DoesNotExist:
+        # Consume the upload record: the scan job owns the key file from here on.
+        key_job = ScanJob.objects(scan_id=key_id, status="uploaded").modify(remove=True)
+        if key_job is None:
             return Response({"error": "Invalid keyId"}, status=400)
 
         key_path = key_job.result.get("key_path")
         if not key_path:
             return Response({"error": "Key file missing"}, status=400)
 
-        scan_id = str(uuid4())
-        job = ScanJob(
-            scan_id=scan_id,
-            provider="GCP",
-            projectId=project_id,
-            status="running",
+        incremental = _incremental_params(request.data)
+        scan_id, joined = enqueue_coalesced(
+            flight_key(
+                "GCP", project_id, checks=checks, credential=key_fingerprint(key_path), incremental=incremental
+            ),
+            "gcp_scan",
+            "GCP",
+            {
+                "key_path": key_path,
+                "checks": checks,
+                "remove_key": True,
+                "incremental": incremental,
+            },
+            project_id=project_id,
+            force=_truthy(request.data.get("force")),
+            host=key_job.host,
         )
-        job.save()
+        if joined:
+            discard_key(key_path, scan_id)
+        return Response({"scan_id": scan_id, "coalesced": joined})
+
+
+class StartGCPMultiScanView(APIView):
+    """Scan several projects of an uploaded key under one parent job.
+
+    ``projects`` is a list, a comma-separated string or ``"all"`` for every
+    project the key can see; ``maxParallel`` caps how many run at once.
+    """
+
+    def post(self, request):
+        key_id = request.data.get("keyId")
+        projects = request.data.get("projects")
+        if not key_id or not projects:
+            return Response({"error": "keyId and projects required"}, status=400)
 
-        def run():
+        max_parallel = request.data.get("maxParallel")
+        try:
+            max_parallel = int(max_parallel) if max_parallel not in (None, "") else None
+        except (TypeError, ValueError):
+            return Response({"error": "maxParallel must be an integer"}, status=400)
+        if max_parallel is not None and max_parallel < 1:
+            return Response({"error": "maxParallel must be positive"}, status=400)
+
+        # Consume the upload record: the fan-out owns the key file from here on.
+        key_job = ScanJob.objects(scan_id=key_id, status="uploaded").modify(remove=True)
+        if key_job is None:
+            return Response({"error": "Invalid keyId"}, status=404)
+        key_path = key_job.result.get("key_path")
+        if not key_path:
+            return Response({"error": "Key file missing"}, status=400)
+
+        if projects == "all":
             try:
-                job.update(status="running", progress=10)
-                csv_path = run_prowler_gcp(key_path, project_id=project_id, checks=checks)
-                job.update(progress=80)
-                findings = []
-                with open(csv_path, newline="") as csvfile:
-                    reader = csv.DictReader(csvfile, delimiter=";")
-                    for row in reader:
-                        findings.append(row)
-                scan = GCPScan(
-                    date=datetime.utcnow(),
-                    provider="GCP",
-                    accountId=findings[0].get("ACCOUNT_UID", "unknown"),
-                    projectId=project_id,
-                    region=findings[0].get("REGION", "global"),
-                    findings=findings,
-                )
-                scan.save()
-                job.update(progress=100, status="completed", result={"scanId": str(scan.id), "findingsCount": len(findings)})
+                projects = fetch_project_ids(key_path)
             except Exception as exc:  # pylint: disable=broad-except
-                job.update(progress=100, status="error", result={"error": str(exc)})
-            finally:
-                _cleanup(key_path)
-
-        Thread(target=run, daemon=True).start()
-        return Response({"scan_id": scan_id})
+                key_job.save(force_insert=True)  # Nothing started; keep the key usable.
+                return Response({"error": str(exc)}, status=500)
+        elif isinstance(projects, str):
+            projects = projects.split(",")
+        projects = list(dict.fromkeys(p.strip() for p in projects if p and p.strip()))
+        if not projects:
+            key_job.save(force_insert=True)
+            return Response({"error": "No projects to scan"}, status=400)
+
+        parent = start_multi_project_scan(
+            key_path,
+            projects,
+            checks=request.data.get("checks"),
+            group=request.data.get("group"),
+            max_parallel=max_parallel,
+            remove_key=True,
+            host=key_job.host,
+        )
+        return Response({"scan_id": parent.scan_id, "projects": projects})
 
 
 class JobStatusView(APIView):
@@ -134,24 +166,55 @@ class JobStatusView(APIView):
             "status": job.status,
             "progress": job.progress,
             "result": job.result,
+            "checksDone": job.checks_done,
+            "checksTotal": job.checks_total,
+            "service": job.current_service,
         }
+        if "projects" in job.params:
+            # Fan-out parent: report every project and their combined progress.
+            data["projects"] = children(job.scan_id)
+            if job.status not in ("completed", "error"):
+                data["progress"] = overall_progress(data["projects"])
         return Response(data)
 
 
 class JobHistoryView(APIView):
-    """Return basic info for past scans."""
+    """Return basic info for past scans.
+
+    Supports ``limit``/``after`` cursor pagination and ``provider``,
+    ``projectId``, ``status`` and ``from``/``to`` filters.
+    """
+
+    FIELDS = {"provider": 1, "projectId": 1, "status": 1, "created_at": 1}
 
     def get(self, request):
-        scans = ScanJob.objects.order_by("-created_at")
+        params = request.query_params
+        try:
+            match = history_match(
+                params,
+                "created_at",
+                {"provider": "provider", "projectId": "projectId", "status": "status"},
+            )
+            # Per-project jobs of a fan-out scan are listed under their parent.
+            match["parent_id"] = None
+            scans, next_cursor = history_page(
+                ScanJob,
+                match,
+                self.FIELDS,
+                "created_at",
+                limit=page_size(params.get("limit")),
+                after=params.get("after"),
+            )
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
         data = [
             {
-                "scan_id": s.scan_id,
-                "provider": s.provider,
-                "projectId": s.projectId,
-                "status": s.status,
-                "created_at": s.created_at,
+                "scan_id": s["_id"],
+                "provider": s.get("provider"),
+                "projectId": s.get("projectId"),
+                "status": s.get("status"),
+                "created_at": s.get("created_at"),
             }
             for s in scans
         ]
-        return Response({"data": data})
-
+        return Response({"data": data, "next": next_cursor})
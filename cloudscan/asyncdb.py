@@ -0,0 +1,36 @@
+"""Async MongoDB access for the read endpoints served under ASGI.
+
+MongoEngine only speaks the blocking driver, so the async views in
+``async_reads.py`` query through pymongo's ``AsyncMongoClient`` instead. A
+client is bound to the event loop it was first used on. One client, and
+its connection pool, is therefore kept per running loop. Under an ASGI
+server that means one pool per process, shared by every in-flight request.
+"""
+
+import asyncio
+import weakref
+
+from django.conf import settings
+from mongoengine.connection import get_db
+from pymongo import AsyncMongoClient
+
+_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncMongoClient
+
+
+def get_client():
+    """Return the ``AsyncMongoClient`` of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncMongoClient(
+            settings.MONGODB_URI,
+            maxPoolSize=settings.ASYNC_MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.ASYNC_MONGO_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=3000,
+        )
+    return client
+
+
+def get_database():
+    """Return the async handle of the database MongoEngine is connected to."""
+    return get_client()[get_db().name]
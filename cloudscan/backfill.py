@@ -0,0 +1,223 @@
+"""Bulk import of Prowler report files left in an output directory.
+
+``prowler_runner`` keeps every report it writes, but only scans started
+through the API reach MongoDB. ``backfill`` imports the rest. It runs in
+two passes over a process pool. The first pass hashes every file, and
+files whose content hash is already in ``ImportedReport`` are skipped. The
+second pass imports the remaining reports in worker processes. Each worker
+opens its own MongoDB client and streams its report into the database with
+the usual batched ``store_findings``, so memory stays flat however large
+the reports are and only counts travel back to the parent.
+
+The shard reports of a sharded AWS scan share the run's timestamp and are
+imported together as one scan.
+"""
+
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime
+from itertools import chain
+
+from mongoengine import connect, disconnect
+from mongoengine.errors import NotUniqueError
+
+from .ingest import iter_asff, iter_asff_merged, iter_gcp_csv, new_aws_scan, new_gcp_scan, report_hash, store_findings
+from .models import Finding, FindingChunk, ImportedReport, SearchPosting
+
+# ``prowler_runner`` names reports ``<provider>-scan-<epoch ms>[-<suffix>]``;
+# the suffix of an AWS report is its shard.
+REPORT_PATTERNS = {
+    "AWS": re.compile(r"^aws-scan-(\d+)(-.+)?\.asff\.json$"),
+    "GCP": re.compile(r"^gcp-scan-(\d+)(?:-.+)?\.csv$"),
+}
+
+
+def discover(directory, after=None):
+    """Return ``[(paths, provider, date)]`` for the scans in ``directory``.
+
+    Each report is one scan, except AWS shard reports, which are grouped by
+    their run's timestamp. ``after`` (epoch milliseconds) skips reports
+    written before it.
+    """
+    reports, shards = [], {}
+    for name in sorted(os.listdir(directory)):
+        for provider, pattern in REPORT_PATTERNS.items():
+            match = pattern.match(name)
+            if not match or (after is not None and int(match.group(1)) <= after):
+                continue
+            path = os.path.join(directory, name)
+            if provider == "AWS" and match.group(2):
+                if match.group(1) in shards:
+                    shards[match.group(1)].append(path)
+                    continue
+                paths = shards[match.group(1)] = [path]
+            else:
+                paths = [path]
+            reports.append((paths, provider, datetime.fromtimestamp(int(match.group(1)) / 1000)))
+    return reports
+
+
+def _connect_worker():
+    """Give a worker process its own MongoDB client.
+
+    A client inherited from the parent across ``fork`` is not safe to use.
+    """
+    disconnect()
+    connect(host=os.getenv("MONGODB_URI"), alias="default")
+
+
+def _claim(paths, provider, digests):
+    """Record ``digests`` as imported; return ``False`` if one already was."""
+    claimed = []
+    for path, digest in zip(paths, digests):
+        try:
+            ImportedReport(sha256=digest, path=os.path.basename(path), provider=provider).save(force_insert=True)
+        except NotUniqueError:
+            ImportedReport.objects(sha256__in=claimed).delete()
+            return False
+        claimed.append(digest)
+    return True
+
+
+def _store(paths, provider, date):
+    """Stream reports into a new scan; return ``(scan, count)``."""
+    if provider == "AWS":
+        findings = iter_asff_merged(paths) if len(paths) > 1 else iter_asff(paths[0])
+    else:
+        findings = iter_gcp_csv(paths[0])
+    first = next(findings, None)
+    if provider == "AWS":
+        scan = new_aws_scan(first, "all", date=date)
+    else:
+        scan = new_gcp_scan(first, date=date)
+    scan.save()
+    regions = set()
+
+    def track(findings):
+        for raw in findings:
+            regions.add(raw.get("Region") if isinstance(raw, dict) else None)
+            yield raw
+
+    try:
+        count = store_findings(scan, track(chain([first], findings)) if first is not None else ())
+    except Exception:
+        Finding.objects(scan=scan.id).delete()
+        FindingChunk.objects(scan=scan.id).delete()
+        SearchPosting.objects(scan=scan.id).delete()
+        scan.delete()
+        raise
+    if provider == "AWS" and len(regions) == 1 and None not in regions:
+        # An AWS scan's region is the one all its findings share.
+        type(scan).objects(id=scan.id).update_one(set__region=regions.pop())
+    return scan, count
+
+
+def import_reports(paths, provider, date, digests):
+    """Store reports as one scan; return ``(scan_id, count, error)``.
+
+    Runs in a worker process. The content hashes are claimed first, so
+    concurrent backfills never import the same report twice; ``scan_id``
+    is ``None`` if one was already taken.
+    """
+    try:
+        if not _claim(paths, provider, digests):
+            return None, 0, None
+        try:
+            scan, count = _store(paths, provider, date)
+        except Exception:
+            ImportedReport.objects(sha256__in=digests).delete()
+            raise
+        ImportedReport.objects(sha256__in=digests).update(set__scan=scan.id, set__findingsCount=count)
+    except Exception as exc:  # pylint: disable=broad-except
+        return None, 0, f"{type(exc).__name__}: {exc}"
+    return str(scan.id), count, None
+
+
+class _InlinePool:
+    """Run pool work in the calling process (``workers=1``)."""
+
+    def map(self, func, *iterables, chunksize=1):
+        return map(func, *iterables)
+
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as exc:  # pylint: disable=broad-except
+            future.set_exception(exc)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def backfill(directory, workers=None, after=None, dry_run=False, log=None):
+    """Import every new report in ``directory``; return a stats dict.
+
+    ``log(message)`` is called once per scan.
+    """
+    log = log or (lambda message: None)
+    workers = workers or os.cpu_count() or 1
+    stats = Counter()
+    start = time.perf_counter()
+    reports = discover(directory, after)
+    paths = [path for group, _, _ in reports for path in group]
+    stats["files"] = len(paths)
+    if workers == 1:
+        pool = _InlinePool()
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_connect_worker)
+    with pool:
+        digests = dict(zip(paths, pool.map(report_hash, paths, chunksize=16)))
+        known = set(ImportedReport.objects(sha256__in=list(set(digests.values()))).scalar("sha256"))
+        pending, seen = [], set()
+        for group, provider, date in reports:
+            group_digests = [digests[path] for path in group]
+            if known.intersection(group_digests) or seen.intersection(group_digests):
+                stats["skipped"] += len(group)
+                continue
+            seen.update(group_digests)
+            pending.append((group, provider, date, group_digests))
+        if dry_run:
+            stats["new"] = sum(len(group) for group, _, _, _ in pending)
+            for group, provider, _, _ in pending:
+                log(f"would import {', '.join(map(os.path.basename, group))} ({provider})")
+            pending = []
+
+        in_flight = {}
+        queue = iter(pending)
+        while True:
+            # Workers only report counts back, so keep each one busy.
+            while len(in_flight) < workers * 2:
+                item = next(queue, None)
+                if item is None:
+                    break
+                in_flight[pool.submit(import_reports, *item)] = item
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                group, provider, _, _ = in_flight.pop(future)
+                names = ", ".join(map(os.path.basename, group))
+                try:
+                    scan_id, count, error = future.result()
+                except Exception as exc:  # pylint: disable=broad-except
+                    scan_id, count, error = None, 0, f"{type(exc).__name__}: {exc}"
+                if error is not None:
+                    stats["failed"] += len(group)
+                    log(f"failed {names}: {error}")
+                elif scan_id is None:
+                    stats["skipped"] += len(group)
+                else:
+                    stats["imported"] += len(group)
+                    stats["findings"] += count
+                    stats["bytes"] += sum(os.path.getsize(path) for path in group)
+                    log(f"imported {names}: {count} findings as {provider} scan {scan_id}")
+    stats["seconds"] = time.perf_counter() - start
+    return dict(stats)
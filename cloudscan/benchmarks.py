@@ -0,0 +1,296 @@
+"""Benchmarks of ingestion, findings queries, history and exports at scale.
+
+``write_asff`` and ``write_gcp_csv`` stream synthetic Prowler reports of any
+size to disk. They repeat accounts, checks, regions and remediation text the
+way real reports do. ``run_benchmarks`` ingests them and times each stage
+through the public endpoints, recording peak Python memory with
+``tracemalloc``. The resulting report is plain JSON, so runs on different
+commits can be compared with ``compare``. The ``benchmark`` management
+command wraps all of this.
+"""
+
+import csv
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from django.test import Client
+
+from .ingest import ingest_aws, ingest_gcp
+from .models import AWSScan, GCPScan, Finding, FindingChunk, ImportedReport, SearchPosting
+
+SERVICES = ("s3", "ec2", "iam", "rds", "cloudtrail", "kms", "lambda", "vpc")
+AWS_REGIONS = ("us-east-1", "us-west-2", "eu-west-1", "ap-south-1")
+GCP_REGIONS = ("global", "us-central1", "europe-west1")
+SEVERITIES = ("CRITICAL", "HIGH", "MEDIUM", "LOW", "INFORMATIONAL")
+
+GCP_COLUMNS = (
+    "ASSESSMENT_START_TIME", "FINDING_UID", "PROVIDER", "ACCOUNT_UID", "PROJECT_ID",
+    "CHECK_ID", "CHECK_TITLE", "SERVICE_NAME", "SEVERITY", "STATUS", "STATUS_EXTENDED",
+    "RESOURCE_UID", "RESOURCE_NAME", "REGION", "DESCRIPTION", "RISK",
+    "REMEDIATION_RECOMMENDATION_TEXT", "REMEDIATION_RECOMMENDATION_URL", "COMPLIANCE",
+)
+
+# Stages measured for every size, in report order.
+STAGES = (
+    "ingest_aws",
+    "ingest_gcp",
+    "findings_first_page",
+    "findings_filtered_page",
+    "findings_deep_page",
+    "latest_findings_page",
+    "findings_groups",
+    "history_page",
+    "export_csv",
+    "export_xlsx",
+)
+
+
+def _checks():
+    return [f"{service}_check_{i}" for service in SERVICES for i in range(15)]
+
+
+def synthetic_asff(count, seed=0):
+    """Yield ``count`` ASFF findings shaped like a Prowler AWS report."""
+    rng = random.Random(seed)
+    checks = _checks()
+    for i in range(count):
+        check = rng.choice(checks)
+        service = check.split("_", 1)[0]
+        region = rng.choice(AWS_REGIONS)
+        yield {
+            "SchemaVersion": "2018-10-08",
+            "Id": f"prowler-{check}-123456789012-{region}-{i}",
+            "ProductArn": f"arn:aws:securityhub:{region}::product/prowler/prowler",
+            "GeneratorId": f"prowler-{check}",
+            "AwsAccountId": "123456789012",
+            "Types": ["Software and Configuration Checks"],
+            "Severity": {"Label": rng.choice(SEVERITIES)},
+            "Title": f"Ensure {check.replace('_', ' ')} is configured",
+            "Description": f"Check that {check.replace('_', ' ')} follows the AWS security best practice.",
+            "Resources": [{
+                "Type": "AwsAccount",
+                "Id": f"arn:aws:{service}:{region}:123456789012:resource/{i % 5000}",
+                "Region": region,
+            }],
+            "Compliance": {
+                "Status": rng.choice(("PASSED", "FAILED")),
+                "RelatedRequirements": ["CIS-1.4: 2.1.1", "ISO27001: A.12.4", "PCI-3.2.1: 10.1"],
+            },
+            "Remediation": {
+                "Recommendation": {
+                    "Text": f"Follow the documentation to remediate {check}.",
+                    "Url": f"https://docs.aws.amazon.com/{service}/latest/userguide/",
+                }
+            },
+            "Region": region,
+        }
+
+
+def synthetic_gcp_rows(count, seed=0, project_id="benchmark-project"):
+    """Yield ``count`` rows shaped like a Prowler GCP CSV report."""
+    rng = random.Random(seed)
+    checks = _checks()
+    for i in range(count):
+        check = rng.choice(checks)
+        region = rng.choice(GCP_REGIONS)
+        yield {
+            "ASSESSMENT_START_TIME": "2024-01-01T00:00:00",
+            "FINDING_UID": f"prowler-gcp-{check}-{project_id}-{region}-{i}",
+            "PROVIDER": "gcp",
+            "ACCOUNT_UID": project_id,
+            "PROJECT_ID": project_id,
+            "CHECK_ID": check,
+            "CHECK_TITLE": f"Ensure {check.replace('_', ' ')} is configured",
+            "SERVICE_NAME": check.split("_", 1)[0],
+            "SEVERITY": rng.choice(SEVERITIES).lower(),
+            "STATUS": rng.choice(("PASS", "FAIL")),
+            "STATUS_EXTENDED": f"Resource {i % 5000} evaluated by {check}.",
+            "RESOURCE_UID": f"projects/{project_id}/resources/{i % 5000}",
+            "RESOURCE_NAME": f"resource-{i % 5000}",
+            "REGION": region,
+            "DESCRIPTION": f"Check that {check.replace('_', ' ')} follows the GCP security best practice.",
+            "RISK": "Misconfigured resources can expose data.",
+            "REMEDIATION_RECOMMENDATION_TEXT": f"Follow the documentation to remediate {check}.",
+            "REMEDIATION_RECOMMENDATION_URL": "https://cloud.google.com/security/",
+            "COMPLIANCE": "CIS-2.0: 1.1 | ISO27001: A.12.4",
+        }
+
+
+def write_asff(path, count, seed=0):
+    """Stream ``count`` synthetic findings to ``path`` as an ASFF array."""
+    with open(path, "w") as f:
+        f.write("[")
+        for i, finding in enumerate(synthetic_asff(count, seed)):
+            f.write(",\n" if i else "\n")
+            json.dump(finding, f)
+        f.write("\n]")
+
+
+def write_gcp_csv(path, count, seed=0):
+    """Stream ``count`` synthetic rows to ``path`` as a ``;`` CSV report."""
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=GCP_COLUMNS, delimiter=";")
+        writer.writeheader()
+        writer.writerows(synthetic_gcp_rows(count, seed))
+
+
+def measure(func, memory=True):
+    """Run ``func`` and return ``(result, seconds, peak_mb)``.
+
+    ``peak_mb`` is the peak traced Python allocation, or ``None`` when
+    ``memory`` is off; tracing slows the measured code down.
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024) if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def _consume(response):
+    """Read a response body fully and return its size in bytes."""
+    if response.status_code != 200:
+        raise RuntimeError(f"Benchmark request failed with {response.status_code}")
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def _seed_history(count):
+    """Insert ``count`` finding-less scans for the history listing."""
+    start = datetime(2024, 1, 1)
+    docs = [
+        {
+            "provider": "AWS",
+            "date": start + timedelta(minutes=i),
+            "accountId": f"{i % 50:012d}",
+            "region": AWS_REGIONS[i % len(AWS_REGIONS)],
+            "storage": "collection",
+            "findingsCount": 0,
+            "failedCount": 0,
+        }
+        for i in range(count)
+    ]
+    if docs:
+        AWSScan._get_collection().insert_many(docs)
+    return [doc["_id"] for doc in docs]
+
+
+def _cleanup(aws_ids, gcp_ids):
+    scan_ids = list(aws_ids) + list(gcp_ids)
+    Finding.objects(scan__in=scan_ids).delete()
+    FindingChunk.objects(scan__in=scan_ids).delete()
+    ImportedReport.objects(scan__in=scan_ids).delete()
+    SearchPosting.objects(scan__in=scan_ids).delete()
+    AWSScan.objects(id__in=aws_ids).delete()
+    GCPScan.objects(id__in=gcp_ids).delete()
+
+
+def benchmark_size(size, memory=True, stages=STAGES, workdir=None):
+    """Benchmark every stage for one report size; return result rows.
+
+    Scans created here are removed again, so the suite can run against a
+    shared local database.
+    """
+    client = Client()
+    rows = []
+    aws_ids, gcp_ids = [], []
+
+    def record(stage, func, required=False):
+        if stage not in stages:
+            # Ingestion still has to run to give the later stages data.
+            return func() if required else None
+        result, seconds, peak = measure(func, memory)
+        rows.append({"size": size, "stage": stage, "seconds": round(seconds, 6), "peak_mb": peak and round(peak, 3)})
+        return result
+
+    def page(url, params=None):
+        return client.get(url, params or {}).json()
+
+    workdir = workdir or tempfile.gettempdir()
+    asff_path = os.path.join(workdir, f"benchmark-{size}.asff.json")
+    csv_path = os.path.join(workdir, f"benchmark-{size}.csv")
+    try:
+        write_asff(asff_path, size)
+        write_gcp_csv(csv_path, size)
+        aws, _ = record("ingest_aws", lambda: ingest_aws(asff_path, "all"), required=True)
+        aws_ids.append(aws.id)
+        gcp, _ = record("ingest_gcp", lambda: ingest_gcp(csv_path), required=True)
+        gcp_ids.append(gcp.id)
+
+        url = f"/api/prowler/AWSfinding/{aws.id}/"
+        record("findings_first_page", lambda: page(url, {"limit": 100}))
+        record("findings_filtered_page", lambda: page(url, {"limit": 100, "status": "FAIL", "sort": "severity"}))
+        # A page half-way through the scan, reached through the cursor chain.
+        cursor = None
+        for _ in range(min(size // 1000, 50)):
+            cursor = page(url, {"limit": 500, "after": cursor} if cursor else {"limit": 500})["next"]
+            if not cursor:
+                break
+        record("findings_deep_page", lambda: page(url, {"limit": 100, "after": cursor} if cursor else {"limit": 100}))
+        record("latest_findings_page", lambda: page("/api/prowler/GCP_Scan/", {"limit": 100}))
+        # Top failing checks; by now the scan is in the in-memory findings cache.
+        record("findings_groups", lambda: page(f"{url}groups/", {"by": "checkId", "status": "FAIL", "top": 10}))
+
+        aws_ids.extend(_seed_history(min(size // 10, 10000)))
+        record("history_page", lambda: page("/api/prowler/scanlist/history/", {"limit": 50, "accountId": f"{1:012d}"}))
+
+        # Exports are POSTed: DRF reserves the ``format`` query parameter.
+        export = "/api/prowler/xls/"
+        record("export_csv", lambda: _consume(client.post(export, {"id": str(aws.id), "format": "csv"})))
+        record("export_xlsx", lambda: _consume(client.post(export, {"id": str(aws.id), "format": "xlsx"})))
+    finally:
+        _cleanup(aws_ids, gcp_ids)
+        for path in (asff_path, csv_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return rows
+
+
+def run_benchmarks(sizes, memory=True, stages=STAGES, database=None):
+    """Return a report dict with environment metadata and result rows."""
+    rows = []
+    for size in sizes:
+        rows.extend(benchmark_size(size, memory=memory, stages=stages))
+    return {
+        "meta": {
+            "date": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": database,
+            "memory": memory,
+        },
+        "results": rows,
+    }
+
+
+def compare(report, baseline, threshold=0.2):
+    """Compare ``report`` with ``baseline``; return ``(rows, regressions)``.
+
+    Each row pairs the two timings of one ``(size, stage)``; a regression is
+    a stage that got slower by more than ``threshold`` (a fraction).
+    """
+    before = {(r["size"], r["stage"]): r for r in baseline["results"]}
+    rows, regressions = [], []
+    for result in report["results"]:
+        old = before.get((result["size"], result["stage"]))
+        if old is None or not old["seconds"]:
+            continue
+        change = result["seconds"] / old["seconds"] - 1
+        row = dict(result, baseline=old["seconds"], change=round(change, 4))
+        rows.append(row)
+        if change > threshold:
+            regressions.append(row)
+    return rows, regressions
@@ -0,0 +1,131 @@
+"""Conditional GET and response compression for findings endpoints.
+
+A scan's findings do not change after ingest, so a findings response is
+identified by the scan ID, the scan's ``version`` and the query string.
+That strong ETag lets repeat loads be answered with ``304 Not Modified``.
+Scans still being ingested get no ETag and must not be cached.
+Large bodies are compressed with brotli when the optional ``brotli``
+package is installed and the client accepts it, and with gzip otherwise.
+"""
+
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import STAGE_SECONDS
+from .models import DOCUMENT_STORAGES
+
+try:  # Optional dependency
+    import brotli
+except ImportError:  # pragma: no cover - exercised when brotli is missing
+    brotli = None
+
+# Bump when the JSON layout of findings responses changes.
+RESPONSE_VERSION = 1
+
+_ENCODING_SUFFIXES = {"br": "-br", "gzip": "-gz"}
+
+
+def ingested(scan):
+    """Return whether all of ``scan``'s findings are stored.
+
+    Scans storing findings as documents are saved before their findings and
+    get a ``findingsCount`` once ingest completes.
+    """
+    return scan.storage not in DOCUMENT_STORAGES or scan.findingsCount is not None
+
+
+def findings_etag(scan, params):
+    """Return the strong ETag (without encoding suffix) of a findings page.
+
+    Returns ``None`` while ``scan`` is being ingested.
+    """
+    if not ingested(scan):
+        return None
+    query = "&".join(f"{key}={value}" for key, value in sorted(params.items()))
+    digest = hashlib.blake2b(query.encode(), digest_size=8).hexdigest()
+    return f'"{scan.id}-v{scan.version or 0}.{RESPONSE_VERSION}-{digest}"'
+
+
+def _strip_suffix(tag):
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in _ENCODING_SUFFIXES.values():
+        if tag.endswith(f'{suffix}"'):
+            return tag[: -len(suffix) - 1] + '"'
+    return tag
+
+
+def not_modified(request, etag):
+    """Return whether ``If-None-Match`` already names ``etag``.
+
+    Tags are compared weakly, ignoring the content-coding suffix, since
+    every encoding carries the same findings.
+    """
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(_strip_suffix(tag) == etag for tag in header.split(","))
+
+
+def accepted_encoding(request):
+    """Pick ``br``, ``gzip`` or ``None`` from ``Accept-Encoding``."""
+    accepted = {}
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def cached_json_response(request, data, etag, cache_control):
+    """Render ``data`` as JSON with ``etag``, compressed when worthwhile."""
+    with STAGE_SECONDS.time(stage="serialize"):
+        body = JSONRenderer().render(data)
+    encoding = None
+    if len(body) >= getattr(settings, "RESPONSE_COMPRESS_MIN_BYTES", 1024):
+        encoding = accepted_encoding(request)
+    if encoding:
+        body = _compress(body, encoding)
+        if etag is not None:
+            etag = etag[:-1] + _ENCODING_SUFFIXES[encoding] + '"'
+    response = HttpResponse(body, content_type="application/json")
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return _with_validators(response, etag, cache_control)
+
+
+def not_modified_response(etag, cache_control):
+    return _with_validators(HttpResponseNotModified(), etag, cache_control)
+
+
+def _with_validators(response, etag, cache_control):
+    if etag is not None:
+        response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
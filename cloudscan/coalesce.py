@@ -0,0 +1,214 @@
+"""Single-flight coalescing of identical scan requests.
+
+Two users, or a retrying frontend, asking for the same scan (same account
+or project, region, checks, group and options) while it runs would start a
+second full Prowler run. Instead, each request first claims a
+``ScanFlight`` keyed by a hash of its normalized parameters. The first
+request owns the flight and starts a scan. Later requests attach to the
+same ``ScanJob`` while it is queued or running, or while its result is
+younger than ``SCAN_COALESCE_FRESH_SECONDS``: async callers get its
+``scan_id`` and sync callers wait for its result. ``force`` skips fresh
+results (an in-flight scan is still joined).
+
+Sync scans have no executor lease, so a running sync flight whose job has
+not been updated for ``SCAN_COALESCE_STALE_SECONDS`` is considered dead
+and replaced.
+"""
+
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from mongoengine.errors import NotUniqueError
+
+from .events import notify
+from .executor import COMPLETED, ERROR, QUEUED, RUNNING, enqueue
+from .incremental import split_checks
+from .models import ScanFlight, ScanJob
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        value = value.strip()
+    elif isinstance(value, dict):
+        value = {key: _normalize(item) for key, item in value.items()}
+        value = {key: item for key, item in value.items() if item is not None}
+    elif isinstance(value, (list, tuple)):
+        value = sorted({str(_normalize(item)) for item in value} - {"None", ""})
+    return None if value in ("", [], {}) else value
+
+
+def key_fingerprint(key_path):
+    """Return a digest identifying the service account of a GCP key file.
+
+    Keys are identified by ``client_email`` and ``private_key_id``, falling
+    back to the file's bytes; an unreadable file only matches itself.
+    """
+    try:
+        with open(key_path, "rb") as f:
+            content = f.read()
+    except (OSError, TypeError):
+        return f"path:{key_path}"
+    try:
+        info = json.loads(content)
+        identity = [info.get("client_email"), info.get("private_key_id")]
+    except (ValueError, AttributeError):
+        identity = [None]
+    if any(identity):
+        content = json.dumps(identity).encode()
+    return hashlib.sha256(content).hexdigest()
+
+
+def flight_key(provider, account=None, region=None, checks=None, group=None, credential=None, **options):
+    """Return the flight key of a scan request.
+
+    ``account`` is the AWS access key ID or the GCP project and
+    ``credential`` the ``key_fingerprint`` of a GCP key, so requests made
+    with different keys never share a scan. ``options`` holds anything else
+    that changes what the scan finds (sharding, incremental settings).
+    Values are normalized, so ``"b, a"`` and ``["a", "b"]`` checks share a
+    key.
+    """
+    normalized = {
+        "provider": provider.upper(),
+        "account": _normalize(account),
+        "credential": credential,
+        "region": (_normalize(region) or "all").lower(),
+        "checks": _normalize(split_checks(checks)),
+        "group": _normalize(group.lower() if isinstance(group, str) else group),
+        "options": _normalize(options),
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _joinable(job, force=False, now=None):
+    """Return whether requests for a flight should attach to its ``job``.
+
+    A flight whose job does not exist (yet, or any more) is replaced, so a
+    request arriving in the moment between a claim and its job being saved
+    starts its own scan.
+    """
+    now = now or datetime.utcnow()
+    if job is None:
+        return False
+    if job.status == QUEUED:
+        return True
+    if job.status == RUNNING:
+        if job.kind:
+            return True  # Dead executor jobs are requeued by their lease.
+        stale = timedelta(seconds=_setting("SCAN_COALESCE_STALE_SECONDS", 3 * 3600))
+        return job.updated_at >= now - stale
+    if job.status == COMPLETED and not force:
+        fresh = timedelta(seconds=_setting("SCAN_COALESCE_FRESH_SECONDS", 300))
+        return job.updated_at >= now - fresh
+    return False
+
+
+def _job(scan_id):
+    return ScanJob.objects(scan_id=scan_id).only("status", "kind", "updated_at", "result").first()
+
+
+def claim(key, provider, scan_id, force=False):
+    """Claim ``key`` for ``scan_id`` or find the flight to join.
+
+    Returns ``None`` when the caller now owns the flight, else the
+    ``scan_id`` of the job to attach to.
+    """
+    for _ in range(3):
+        flight = ScanFlight.objects(key=key).first()
+        if flight is None:
+            try:
+                ScanFlight(key=key, provider=provider, scan_id=scan_id).save(force_insert=True)
+                return None
+            except NotUniqueError:
+                continue
+        if _joinable(_job(flight.scan_id), force):
+            return flight.scan_id
+        # Replace a finished, failed or dead flight unless another request
+        # already did.
+        if ScanFlight.objects(key=key, scan_id=flight.scan_id).update_one(
+            set__scan_id=scan_id, set__created_at=datetime.utcnow()
+        ):
+            return None
+    # Lost every race; run without coalescing rather than fail.
+    return None
+
+
+def enqueue_coalesced(key, kind, provider, params, project_id=None, force=False, host=None):
+    """Queue a scan unless an identical one is in flight or fresh.
+
+    Returns ``(scan_id, joined)``; when ``joined`` nothing was queued.
+    """
+    scan_id = str(uuid4())
+    joined = claim(key, provider, scan_id, force)
+    if joined:
+        return joined, True
+    enqueue(kind, provider, params, project_id=project_id, scan_id=scan_id, host=host)
+    return scan_id, False
+
+
+def discard_key(key_path, scan_id):
+    """Delete the GCP key file of a request that joined job ``scan_id``.
+
+    The file is kept if the joined job scans with it, and may already be
+    gone once that job finished.
+    """
+    job = ScanJob.objects(scan_id=scan_id).only("params").first()
+    if job is not None and (job.params or {}).get("key_path") == key_path:
+        return
+    try:
+        os.remove(key_path)
+    except FileNotFoundError:
+        pass
+
+
+def wait_for(scan_id):
+    """Block until job ``scan_id`` finishes and return its result.
+
+    Raises ``RuntimeError`` if it failed or stopped responding.
+    """
+    interval = _setting("SCAN_EVENTS_POLL_SECONDS", 1)
+    while True:
+        job = _job(scan_id)
+        if job is not None and job.status == COMPLETED:
+            return dict(job.result or {})
+        if job is not None and job.status == ERROR:
+            raise RuntimeError((job.result or {}).get("error") or "Scan failed")
+        if not _joinable(job, force=True):
+            raise RuntimeError("The scan this request joined stopped responding")
+        time.sleep(interval)
+
+
+def run_coalesced(key, provider, run, project_id=None, force=False):
+    """Run a sync scan unless an identical one is in flight or fresh.
+
+    ``run()`` performs the scan and returns the result dict stored on its
+    ``ScanJob``, as the executor's task handlers do. Returns
+    ``(result, joined)``; joined requests share the owner's result.
+    """
+    scan_id = str(uuid4())
+    joined = claim(key, provider, scan_id, force)
+    if joined:
+        return wait_for(joined), True
+    ScanJob(scan_id=scan_id, provider=provider, projectId=project_id, status=RUNNING, progress=10).save()
+    try:
+        result = run()
+    except Exception as exc:
+        ScanJob.objects(scan_id=scan_id).update_one(
+            set__status=ERROR, set__progress=100, set__result={"error": str(exc)}, set__updated_at=datetime.utcnow()
+        )
+        notify()
+        raise
+    ScanJob.objects(scan_id=scan_id).update_one(
+        set__status=COMPLETED, set__progress=100, set__result=result, set__updated_at=datetime.utcnow()
+    )
+    notify()
+    return result, False
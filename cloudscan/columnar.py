@@ -0,0 +1,172 @@
+"""Compressed, dictionary-encoded chunks of raw findings.
+
+With ``FINDINGS_STORAGE = "compressed"`` a scan's raw findings are not kept
+on each ``Finding`` document. They are grouped into ``FindingChunk``
+documents of ``FINDINGS_CHUNK_SIZE`` findings each, and the ``Finding``
+documents keep only their indexed fields plus ``chunk`` and ``row``.
+
+Inside a chunk every top-level key becomes a column, and every string is
+replaced by its index in a per-chunk string table. Account IDs, regions,
+titles, remediation text and compliance blocks repeat across thousands of
+findings, so each distinct string is stored once. The encoded chunk is then
+compressed with zstd when the optional ``zstandard`` package is installed,
+and with zlib otherwise. The codec is recorded per chunk.
+"""
+
+import json
+import zlib
+
+from bson import Binary
+
+from .models import FindingChunk
+
+try:  # Optional dependency
+    import zstandard
+except ImportError:  # pragma: no cover - exercised when zstandard is missing
+    zstandard = None
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+
+
+def default_codec():
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+def compress(data, codec):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data, codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required to read zstd finding chunks")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class _Encoder:
+    """Replace strings by indexes into a shared table.
+
+    Strings become ints, dicts ``{"m": [key, value, ...]}``, lists
+    ``{"l": [...]}`` and other scalars ``{"v": value}``.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def ref(self, text):
+        index = self._index.get(text)
+        if index is None:
+            index = self._index[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def value(self, value):
+        if isinstance(value, str):
+            return self.ref(value)
+        if isinstance(value, dict):
+            return {"m": [part for key, item in value.items() for part in (self.ref(key), self.value(item))]}
+        if isinstance(value, list):
+            return {"l": [self.value(item) for item in value]}
+        return {"v": value}
+
+
+def encode_chunk(findings, codec=None):
+    """Return ``(payload, codec)`` for a list of raw findings."""
+    codec = codec or default_codec()
+    encoder = _Encoder()
+    columns = {}
+    for row, raw in enumerate(findings):
+        for key, value in raw.items():
+            column = columns.get(key)
+            if column is None:
+                # ``None`` marks rows without the key.
+                column = columns[key] = [None] * len(findings)
+            column[row] = encoder.value(value)
+    payload = {"s": encoder.strings, "n": len(findings), "c": columns}
+    return compress(json.dumps(payload, separators=(",", ":")).encode(), codec), codec
+
+
+def decode_chunk(data, codec, keys=None):
+    """Return the raw findings of an encoded chunk.
+
+    ``keys`` optionally restricts each finding to those top-level keys; the
+    other columns are not decoded.
+    """
+    payload = json.loads(decompress(bytes(data), codec))
+    strings = payload["s"]
+
+    def value(encoded):
+        if isinstance(encoded, int):
+            return strings[encoded]
+        if "m" in encoded:
+            parts = encoded["m"]
+            return {strings[parts[i]]: value(parts[i + 1]) for i in range(0, len(parts), 2)}
+        if "l" in encoded:
+            return [value(item) for item in encoded["l"]]
+        return encoded["v"]
+
+    rows = [{} for _ in range(payload["n"])]
+    for key, column in payload["c"].items():
+        if keys and key not in keys:
+            continue
+        for row, encoded in enumerate(column):
+            if encoded is not None:
+                rows[row][key] = value(encoded)
+    return rows
+
+
+def write_chunk(scan_id, seq, findings):
+    """Store ``findings`` as chunk ``seq`` of a scan."""
+    payload, codec = encode_chunk(findings)
+    FindingChunk._get_collection().insert_one({
+        "scan": scan_id,
+        "seq": seq,
+        "count": len(findings),
+        "codec": codec,
+        "data": Binary(payload),
+    })
+
+
+def iter_chunk_findings(scan_id, keys=None):
+    """Yield a scan's raw findings chunk by chunk, in ingestion order."""
+    for chunk in FindingChunk._get_collection().find({"scan": scan_id}).sort("seq", 1):
+        yield from decode_chunk(chunk["data"], chunk["codec"], keys)
+
+
+def chunk_query(rows):
+    """Return the ``FindingChunk`` query ``attach_data`` needs, or ``None``."""
+    wanted = {}
+    for row in rows:
+        if row.get("chunk") is not None and not row.get("data"):
+            wanted.setdefault(row["scan"], set()).add(row["chunk"])
+    if not wanted:
+        return None
+    return {"$or": [{"scan": scan_id, "seq": {"$in": sorted(seqs)}} for scan_id, seqs in wanted.items()]}
+
+
+def attach_data(rows, keys=None):
+    """Fill in ``data`` on ``Finding`` rows whose raw finding is in a chunk.
+
+    ``rows`` need ``scan``, ``chunk`` and ``row``; each chunk is read and
+    decoded once. ``keys`` restricts ``data`` as in ``decode_chunk``.
+    """
+    query = chunk_query(rows)
+    if query is None:
+        return rows
+    return fill_data(rows, FindingChunk._get_collection().find(query), keys)
+
+
+def fill_data(rows, chunks, keys=None):
+    """Fill in ``data`` on ``rows`` from the chunk documents they point to."""
+    decoded = {}
+    for chunk in chunks:
+        decoded[(chunk["scan"], chunk["seq"])] = decode_chunk(chunk["data"], chunk["codec"], keys)
+    for row in rows:
+        if row.get("chunk") is not None and not row.get("data"):
+            row["data"] = decoded[(row["scan"], row["chunk"])][row["row"]]
+    return rows
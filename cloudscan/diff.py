@@ -0,0 +1,103 @@
+"""Scan-to-scan diffs matched on finding fingerprints.
+
+Both scans' findings are read in ``(fingerprint, _id)`` order straight from
+the ``(scan, fingerprint, _id)`` index, projected down to the fingerprint,
+and merge-joined in one pass. Only the findings a caller asks to see are
+then loaded, by ``_id``. A finding is ``new`` when its fingerprint only
+appears in the head scan, ``resolved`` when it only appears in the base
+scan and ``unchanged`` otherwise; repeated fingerprints pair up one to one.
+"""
+
+from .findings import finding_fields, iter_findings
+from .ingest import _batch_size, batched
+from .columnar import attach_data
+from .models import Finding, DOCUMENT_STORAGES
+
+CHANGES = ("new", "resolved", "unchanged")
+
+
+def ensure_fingerprints(scan):
+    """Fingerprint ``scan``'s findings stored before fingerprints existed.
+
+    This runs once per such scan; later diffs find nothing to update.
+    """
+    collection = Finding._get_collection()
+    missing = collection.find({"scan": scan.id, "fingerprint": None}, {"data": 1, "scan": 1, "chunk": 1, "row": 1})
+    # Compressed scans keep the raw findings in chunks.
+    for batch in batched(missing, _batch_size()):
+        for row in attach_data(batch):
+            value = finding_fields(scan.provider, row.get("data", {}))["fingerprint"]
+            collection.update_one({"_id": row["_id"]}, {"$set": {"fingerprint": value}})
+
+
+def _keys(scan):
+    """Yield ``(fingerprint, ref)`` for ``scan`` in fingerprint order.
+
+    ``ref`` is the ``Finding`` id, or the raw finding for legacy scans whose
+    embedded findings are fingerprinted in memory.
+    """
+    if scan.storage in DOCUMENT_STORAGES:
+        ensure_fingerprints(scan)
+        rows = (
+            Finding._get_collection()
+            .find({"scan": scan.id}, {"fingerprint": 1})
+            .sort([("fingerprint", 1), ("_id", 1)])
+        )
+        for row in rows:
+            yield row["fingerprint"], row["_id"]
+        return
+    keyed = [(finding_fields(scan.provider, raw)["fingerprint"], raw) for raw in iter_findings(scan)]
+    keyed.sort(key=lambda item: item[0])
+    yield from keyed
+
+
+def merge_diff(base_keys, head_keys):
+    """Merge-join two fingerprint-sorted streams.
+
+    Yields ``(change, base_ref, head_ref)`` where the ref missing from one
+    side is ``None``.
+    """
+    base_keys, head_keys = iter(base_keys), iter(head_keys)
+    base, head = next(base_keys, None), next(head_keys, None)
+    while base is not None or head is not None:
+        if head is None or (base is not None and base[0] < head[0]):
+            yield "resolved", base[1], None
+            base = next(base_keys, None)
+        elif base is None or head[0] < base[0]:
+            yield "new", None, head[1]
+            head = next(head_keys, None)
+        else:
+            yield "unchanged", base[1], head[1]
+            base, head = next(base_keys, None), next(head_keys, None)
+
+
+def _load(refs):
+    """Return raw findings for ``refs`` (ids or raw findings), in order."""
+    ids = [ref for ref in refs if not isinstance(ref, dict)]
+    data = {}
+    for batch in batched(ids, _batch_size()):
+        rows = Finding._get_collection().find(
+            {"_id": {"$in": batch}}, {"data": 1, "scan": 1, "chunk": 1, "row": 1}
+        )
+        for row in attach_data(list(rows)):
+            data[row["_id"]] = row.get("data", {})
+    return [ref if isinstance(ref, dict) else data.get(ref, {}) for ref in refs]
+
+
+def diff_scans(base, head, include=("new", "resolved"), limit=None):
+    """Compare two scans of one provider.
+
+    Returns ``counts`` for every change and, for each change in
+    ``include``, up to ``limit`` of the findings (from the head scan,
+    except for ``resolved``).
+    """
+    counts = dict.fromkeys(CHANGES, 0)
+    refs = {change: [] for change in include}
+    for change, base_ref, head_ref in merge_diff(_keys(base), _keys(head)):
+        counts[change] += 1
+        if change in refs and (limit is None or len(refs[change]) < limit):
+            refs[change].append(base_ref if change == "resolved" else head_ref)
+    result = {"counts": counts}
+    for change, change_refs in refs.items():
+        result[change] = _load(change_refs)
+    return result
@@ -0,0 +1,179 @@
+"""In-process pub/sub of ``ScanJob`` state for streaming status endpoints.
+
+Every open event stream subscribes to the scan IDs it watches. A single
+poller thread per process reads the watched jobs with one query per
+``SCAN_EVENTS_POLL_SECONDS`` and publishes each job whose state changed to
+its subscribers, so the database load does not grow with the number of
+open dashboards. Writers in this process call ``notify`` to have the
+poller look again immediately. The poller stops when nobody is listening.
+
+Subscriptions made with an event ``loop`` are read with ``await`` instead,
+so an ASGI server holds no thread per open stream.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+
+from django.conf import settings
+
+from .models import ScanJob
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("completed", "error")
+
+_FIELDS = ("scan_id", "status", "progress", "checks_done", "checks_total", "current_service", "result")
+
+
+def job_event(job):
+    """Return ``(event, data)`` describing a job's current state."""
+    finished = job.status in FINISHED
+    data = {
+        "scanId": job.scan_id,
+        "status": job.status,
+        "progress": job.progress,
+        "checksDone": job.checks_done,
+        "checksTotal": job.checks_total,
+        "service": job.current_service,
+        "result": job.result if finished else None,
+    }
+    return ("done" if finished else "progress"), data
+
+
+class Subscription:
+    """Events for a set of scan IDs, read with ``get``."""
+
+    def __init__(self, hub, scan_ids):
+        self.hub = hub
+        self.scan_ids = set(scan_ids)
+        self.queue = queue.Queue()
+
+    def put(self, event):
+        self.queue.put(event)
+
+    def get(self, timeout=None):
+        """Return the next ``(event, data)``, or ``None`` after ``timeout``."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+    """A ``Subscription`` read with ``await get`` on the event loop ``loop``."""
+
+    def __init__(self, hub, scan_ids, loop):
+        super().__init__(hub, scan_ids)
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            pass  # The loop closed before the stream did.
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class JobEventHub:
+    """Fan ``ScanJob`` changes out to subscribers from one poller thread."""
+
+    def __init__(self, poll_interval=None):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers = {}  # scan_id -> set of Subscription
+        self._states = {}  # scan_id -> last published (event, data)
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, scan_ids, loop=None):
+        """Watch ``scan_ids``; the last known state of each is sent at once.
+
+        With an event ``loop`` the subscription is an ``AsyncSubscription``.
+        """
+        if loop is None:
+            subscription = Subscription(self, scan_ids)
+        else:
+            subscription = AsyncSubscription(self, scan_ids, loop)
+        with self._lock:
+            for scan_id in subscription.scan_ids:
+                self._subscribers.setdefault(scan_id, set()).add(subscription)
+                if scan_id in self._states:
+                    subscription.put(self._states[scan_id])
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll, name="scan-events", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for scan_id in subscription.scan_ids:
+                watchers = self._subscribers.get(scan_id)
+                if watchers is None:
+                    continue
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._subscribers[scan_id]
+                    self._states.pop(scan_id, None)
+
+    def notify(self):
+        """Ask the poller to read the watched jobs now."""
+        self._wakeup.set()
+
+    def poll_once(self):
+        """Read the watched jobs and publish those that changed."""
+        with self._lock:
+            watched = list(self._subscribers)
+        if not watched:
+            return
+        jobs = {job.scan_id: job for job in ScanJob.objects(scan_id__in=watched).only(*_FIELDS)}
+        with self._lock:
+            for scan_id in watched:
+                job = jobs.get(scan_id)
+                if job is None:
+                    event = ("missing", {"scanId": scan_id, "error": "Not found"})
+                else:
+                    event = job_event(job)
+                if self._states.get(scan_id) == event or scan_id not in self._subscribers:
+                    continue
+                self._states[scan_id] = event
+                for subscription in self._subscribers[scan_id]:
+                    subscription.put(event)
+
+    def _poll(self):
+        interval = self.poll_interval or getattr(settings, "SCAN_EVENTS_POLL_SECONDS", 1.0)
+        while True:
+            self._wakeup.clear()
+            try:
+                self.poll_once()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Scan event poll failed")
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            self._wakeup.wait(interval)
+
+
+_hub = JobEventHub()
+
+
+def get_hub():
+    """Return the process-wide ``JobEventHub``."""
+    return _hub
+
+
+def notify():
+    """Tell the local hub that a ``ScanJob`` changed."""
+    _hub.notify()
@@ -0,0 +1,337 @@
+"""Bounded scan executor backed by the ``ScanJob`` collection.
+
+Scans are enqueued as ``ScanJob`` documents with a ``kind`` naming the task
+handler. A ``ScanExecutor`` runs a fixed number of worker threads that claim
+queued jobs atomically, so several Django processes can share one queue.
+Claimed jobs carry a lease that a heartbeat thread keeps extending; when a
+process dies its leases expire and the jobs are requeued, up to
+``SCAN_JOB_MAX_ATTEMPTS`` attempts. Server processes start their executor at
+boot, so jobs left behind by a crash or redeploy run without waiting for the
+next scan request.
+
+Jobs whose ``params`` point at uploaded key or credential files in a
+process's temporary directory record that process's ``host``, and only
+executors on that host claim them. Other jobs run on any host.
+"""
+
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from django.conf import settings
+
+from .events import notify
+from .metrics import QUEUE_DEPTH, SCAN_SECONDS
+from .models import ScanJob
+
+logger = logging.getLogger(__name__)
+
+# Name of this host, recorded on jobs that need its local files.
+HOST = socket.gethostname()
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+ERROR = "error"
+
+# Task handlers by job ``kind``. A handler receives the claimed ``ScanJob``
+# and returns the ``result`` dict stored when it completes.
+HANDLERS = {}
+
+
+def register(kind):
+    """Register the decorated function as the handler for ``kind`` jobs."""
+
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _lease():
+    return timedelta(seconds=_setting("SCAN_JOB_LEASE_SECONDS", 60))
+
+
+def enqueue(kind, provider, params=None, project_id=None, scan_id=None, host=None):
+    """Persist a queued job and wake the local executor; return the job.
+
+    ``host`` restricts the job to executors on that host, for jobs whose
+    ``params`` name files on its disk.
+    """
+    job = ScanJob(
+        scan_id=scan_id or str(uuid4()),
+        provider=provider,
+        projectId=project_id,
+        kind=kind,
+        params=params or {},
+        status=QUEUED,
+        host=host,
+    )
+    job.save()
+    QUEUE_DEPTH.observe(ScanJob.objects(status=QUEUED, kind__ne=None).count())
+    if _setting("SCAN_EXECUTOR_AUTOSTART", True):
+        get_executor().start()
+    if _executor:
+        _executor.wake()
+    return job
+
+
+def claim_next(owner):
+    """Atomically lease the oldest queued job to ``owner``, or return ``None``.
+
+    Only jobs this host can run are considered.
+    """
+    now = datetime.utcnow()
+    return (
+        ScanJob.objects(status=QUEUED, kind__ne=None, host__in=[None, HOST])
+        .order_by("created_at")
+        .modify(
+            new=True,
+            set__status=RUNNING,
+            set__lease_owner=owner,
+            set__lease_expires_at=now + _lease(),
+            set__heartbeat_at=now,
+            set__updated_at=now,
+            inc__attempts=1,
+        )
+    )
+
+
+def heartbeat(scan_id, owner):
+    """Extend ``owner``'s lease on a job; return ``False`` if it was lost."""
+    now = datetime.utcnow()
+    return bool(
+        ScanJob.objects(scan_id=scan_id, status=RUNNING, lease_owner=owner).update_one(
+            set__lease_expires_at=now + _lease(), set__heartbeat_at=now
+        )
+    )
+
+
+def requeue_expired():
+    """Requeue running jobs whose lease expired; fail those out of attempts.
+
+    Returns the number of jobs requeued.
+    """
+    now = datetime.utcnow()
+    max_attempts = _setting("SCAN_JOB_MAX_ATTEMPTS", 3)
+    expired = ScanJob.objects(status=RUNNING, kind__ne=None, lease_expires_at__lt=now)
+    exhausted = list(expired(attempts__gte=max_attempts).only("scan_id", "parent_id"))
+    if exhausted:
+        ScanJob.objects(scan_id__in=[job.scan_id for job in exhausted], status=RUNNING).update(
+            set__status=ERROR,
+            set__progress=100,
+            set__result={"error": "Scan worker stopped responding"},
+            set__updated_at=now,
+            unset__lease_owner=True,
+        )
+        for job in exhausted:
+            _finished(job)
+    requeued = expired(attempts__lt=max_attempts).update(
+        set__status=QUEUED, set__updated_at=now, unset__lease_owner=True
+    )
+    if requeued:
+        logger.warning("Requeued %s scan jobs with expired leases", requeued)
+    return requeued
+
+
+def run_job(job, owner):
+    """Run a claimed job's handler and record the outcome.
+
+    The final update only applies while ``owner`` still holds the lease, so
+    a job requeued to another worker is not overwritten by a stale one.
+    """
+    handler = HANDLERS.get(job.kind)
+    updates = {"set__progress": 100, "unset__lease_owner": True}
+    start = time.perf_counter()
+    try:
+        if handler is None:
+            raise Exception(f"No handler registered for {job.kind!r} jobs")
+        result = handler(job)
+        updates.update(set__status=COMPLETED, set__result=result or {})
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception("Scan job %s failed", job.scan_id)
+        updates.update(set__status=ERROR, set__result={"error": str(exc)})
+    updates["set__updated_at"] = datetime.utcnow()
+    SCAN_SECONDS.observe(
+        time.perf_counter() - start, provider=job.provider, kind=job.kind, status=updates["set__status"]
+    )
+    if ScanJob.objects(scan_id=job.scan_id, lease_owner=owner).update_one(**updates):
+        notify()
+        _finished(job)
+
+
+def _finished(job):
+    """Let a fan-out parent react to one of its children finishing."""
+    if job.parent_id:
+        from .fanout import child_finished
+
+        child_finished(job)
+
+
+class JobProgress:
+    """Progress callback that coalesces updates into few ``ScanJob`` writes.
+
+    Checks done/total are mapped onto ``start``..``end`` percent. State is
+    written at most once per ``SCAN_PROGRESS_INTERVAL`` seconds; ``flush``
+    writes whatever is pending.
+    """
+
+    def __init__(self, job, start=10, end=90):
+        self.scan_id = job.scan_id
+        self.start = start
+        self.end = end
+        self.interval = _setting("SCAN_PROGRESS_INTERVAL", 2.0)
+        self.progress = job.progress or start
+        self.done = self.total = self.service = None
+        self._written = None
+        self._last_write = None
+        self.writes = 0
+
+    def __call__(self, done, total, service=None):
+        self.done, self.total, self.service = done, total, service
+        if total:
+            # Never move backwards, and leave ``end`` for the caller.
+            pct = self.start + (self.end - self.start) * min(done, total) // total
+            self.progress = max(self.progress, min(pct, self.end - 1))
+        if self._last_write is None or time.monotonic() - self._last_write >= self.interval:
+            self.flush()
+
+    def flush(self):
+        state = (self.progress, self.done, self.total, self.service)
+        if state == self._written:
+            return
+        ScanJob.objects(scan_id=self.scan_id).update_one(
+            set__progress=self.progress,
+            set__checks_done=self.done,
+            set__checks_total=self.total,
+            set__current_service=self.service,
+            set__updated_at=datetime.utcnow(),
+        )
+        self._written = state
+        self._last_write = time.monotonic()
+        self.writes += 1
+        notify()
+
+
+class ScanExecutor:
+    """Run queued scan jobs on a fixed pool of worker threads."""
+
+    def __init__(self, concurrency=None, poll_interval=None):
+        self.concurrency = concurrency or _setting("SCAN_WORKER_CONCURRENCY", 2)
+        self.poll_interval = poll_interval or _setting("SCAN_EXECUTOR_POLL_SECONDS", 5)
+        self.owner = f"{HOST}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._running = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Start the worker and heartbeat threads once."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.concurrency):
+                thread = threading.Thread(target=self._work, name=f"scan-worker-{i}", daemon=True)
+                self._threads.append(thread)
+            self._threads.append(threading.Thread(target=self._maintain, name="scan-heartbeat", daemon=True))
+            for thread in self._threads:
+                thread.start()
+        logger.info("Scan executor %s started with %s workers", self.owner, self.concurrency)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run_once(self):
+        """Claim and run one job in the calling thread; return it or ``None``."""
+        job = claim_next(self.owner)
+        if job is None:
+            return None
+        with self._lock:
+            self._running[job.scan_id] = job
+        try:
+            run_job(job, self.owner)
+        finally:
+            with self._lock:
+                self._running.pop(job.scan_id, None)
+        return job
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.run_once()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Scan worker failed to claim a job")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _maintain(self):
+        interval = _lease().total_seconds() / 3
+        while True:
+            try:
+                with self._lock:
+                    running = list(self._running)
+                for scan_id in running:
+                    if not heartbeat(scan_id, self.owner):
+                        logger.warning("Lost lease on scan job %s", scan_id)
+                if requeue_expired():
+                    self.wake()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Scan executor maintenance failed")
+            if self._stopping.wait(interval):
+                return
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide ``ScanExecutor``, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ScanExecutor()
+        return _executor
+
+
+def serving_process(argv=None):
+    """Return whether this process serves requests.
+
+    Management commands other than ``runserver`` do not, nor does the
+    autoreloader process of ``runserver`` that only restarts its child.
+    """
+    argv = sys.argv if argv is None else argv
+    if not argv or os.path.basename(argv[0]) not in ("manage.py", "django-admin"):
+        return True  # A WSGI/ASGI server
+    if argv[1:2] != ["runserver"]:
+        return False
+    return "--noreload" in argv or os.environ.get("RUN_MAIN") == "true"
+
+
+def start_at_boot():
+    """Start the process-wide executor if this process serves requests.
+
+    Called once MongoDB is connected; ``SCAN_EXECUTOR_AUTOSTART=false``
+    leaves queued jobs to ``run_scan_worker`` processes.
+    """
+    if _setting("SCAN_EXECUTOR_AUTOSTART", True) and serving_process():
+        get_executor().start()
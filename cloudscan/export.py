@@ -0,0 +1,254 @@
+"""Streaming CSV/XLSX export of scan findings.
+
+Rows are produced straight from the findings cursor and handed to a
+``StreamingHttpResponse`` in small chunks, so memory stays bounded and the
+header row reaches the client before the rest of the scan has been read.
+XLSX workbooks are written as a ZIP stream with inline strings, which needs
+no spreadsheet library and no seekable output. Under ASGI the chunks are
+produced in a worker thread and streamed from an async iterator, since
+Django would otherwise read a sync iterator to the end before sending it.
+"""
+
+import csv
+import json
+import re
+import zipfile
+import zlib
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+from .findings import iter_findings
+
+FORMATS = ("csv", "xlsx")
+
+# Columns exported for AWS scans when none are requested. GCP reports are
+# already flat, so their own CSV header is used instead.
+DEFAULT_AWS_COLUMNS = [
+    "AwsAccountId",
+    "Region",
+    "GeneratorId",
+    "Title",
+    "Severity.Label",
+    "Compliance.Status",
+    "Resources.0.Type",
+    "Resources.0.Id",
+    "Description",
+    "Remediation.Recommendation.Text",
+    "Remediation.Recommendation.Url",
+    "Compliance.RelatedRequirements",
+]
+
+# Bytes collected before a chunk is handed to the response.
+CHUNK_SIZE = 64 * 1024
+
+# Excel rejects longer cells and XML 1.0 forbids most control characters.
+_XLSX_MAX_CELL = 32767
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def parse_columns(value):
+    """Accept columns as a list or a comma-separated string."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    columns = [c.strip() for c in value if c and c.strip()]
+    return columns or None
+
+
+def cell_value(raw, column):
+    """Resolve a dotted ``column`` path (``Resources.0.Id``) in ``raw``."""
+    value = raw
+    for part in column.split("."):
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return ""
+        if value is None:
+            return ""
+    if isinstance(value, list) and all(not isinstance(v, (dict, list)) for v in value):
+        return ", ".join(str(v) for v in value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+class _Buffer:
+    """Write-only file object whose contents are drained by the generator."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(p.encode() if isinstance(p, str) else p for p in self.parts)
+        self.parts = []
+        self.size = 0
+        return data
+
+
+def _csv_chunks(columns, rows):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.drain()
+    for raw in rows:
+        writer.writerow([cell_value(raw, c) for c in columns])
+        if buffer.size >= CHUNK_SIZE:
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def _column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _xlsx_cell(ref, value):
+    if isinstance(value, bool):
+        value = str(value)
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    text = _XML_ILLEGAL.sub("", str(value))[:_XLSX_MAX_CELL]
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _xlsx_row(number, letters, values):
+    cells = "".join(_xlsx_cell(f"{col}{number}", v) for col, v in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'.encode()
+
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Findings" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+
+def _xlsx_chunks(columns, rows):
+    buffer = _Buffer()
+    letters = [_column_letter(i) for i in range(len(columns))]
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b"<sheetData>"
+            )
+            sheet.write(_xlsx_row(1, letters, columns))
+            yield buffer.drain()
+            for number, raw in enumerate(rows, start=2):
+                sheet.write(_xlsx_row(number, letters, [cell_value(raw, c) for c in columns]))
+                if buffer.size >= CHUNK_SIZE:
+                    yield buffer.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield buffer.drain()
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def _async_chunks(chunks):
+    """Yield ``chunks`` on the event loop, producing each in a worker thread."""
+    produce = sync_to_async(next, thread_sensitive=False)
+    while True:
+        chunk = await produce(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def export_response(scan, fmt, columns=None, compress=False, asynchronous=False):
+    """Return a ``StreamingHttpResponse`` with ``scan``'s findings as CSV/XLSX.
+
+    ``columns`` are dotted paths into each raw finding. When omitted, AWS
+    scans use ``DEFAULT_AWS_COLUMNS`` and GCP scans use the keys of their
+    first finding. ``compress`` gzips the file and adds a ``.gz`` suffix.
+    ``asynchronous`` streams from an async iterator, for ASGI requests.
+    """
+    if columns:
+        roots = {c.split(".", 1)[0] for c in columns}
+        rows = iter_findings(scan, keys=roots)
+    elif scan.provider == "AWS":
+        columns = DEFAULT_AWS_COLUMNS
+        rows = iter_findings(scan, keys={c.split(".", 1)[0] for c in columns})
+    else:
+        rows = iter_findings(scan)
+        first = next(rows, None)
+        columns = list(first) if first else []
+        rows = chain([first], rows) if first else iter(())
+
+    if fmt == "xlsx":
+        chunks = _xlsx_chunks(columns, rows)
+        content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        chunks = _csv_chunks(columns, rows)
+        content_type = "text/csv; charset=utf-8"
+    filename = f"{scan.provider}_scan_{scan.id}_findings.{fmt}"
+    if compress:
+        chunks = _gzip_chunks(chunks)
+        content_type = "application/gzip"
+        filename += ".gz"
+
+    chunks = (c for c in chunks if c)
+    if asynchronous:
+        chunks = _async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,134 @@
+"""Multi-project GCP scans fanned out under one parent ``ScanJob``.
+
+The parent job only tracks the fan-out; each project is scanned by its own
+``gcp_scan`` child job with ``parent_id`` set. At most ``max_parallel``
+children are ``queued`` at a time, the rest wait as ``pending`` and are
+promoted one by one as siblings finish. When the last child finishes the
+parent is completed with a roll-up of every project's result.
+"""
+
+import os
+from datetime import datetime
+from uuid import uuid4
+
+from django.conf import settings
+
+from .executor import COMPLETED, ERROR, QUEUED, RUNNING, get_executor
+from .models import ScanJob
+
+PENDING = "pending"
+FINISHED = (COMPLETED, ERROR)
+
+
+def start_multi_project_scan(
+    key_path, projects, checks=None, group=None, max_parallel=None, remove_key=False, host=None
+):
+    """Create the parent job and one child job per project; return the parent.
+
+    ``host`` is the host holding ``key_path``; children only run there.
+    """
+    max_parallel = max_parallel or settings.GCP_FANOUT_MAX_PARALLEL
+    parent = ScanJob(
+        scan_id=str(uuid4()),
+        provider="GCP",
+        status=RUNNING,
+        host=host,
+        params={
+            "projects": projects,
+            "key_path": key_path,
+            "remove_key": remove_key,
+            "max_parallel": max_parallel,
+        },
+    )
+    parent.save()
+    for index, project_id in enumerate(projects):
+        ScanJob(
+            scan_id=str(uuid4()),
+            provider="GCP",
+            projectId=project_id,
+            kind="gcp_scan",
+            parent_id=parent.scan_id,
+            params={"key_path": key_path, "checks": checks, "group": group},
+            host=host,
+            status=QUEUED if index < max_parallel else PENDING,
+        ).save()
+
+    if not projects:
+        finalize(parent.scan_id)
+    elif getattr(settings, "SCAN_EXECUTOR_AUTOSTART", True):
+        executor = get_executor()
+        executor.start()
+        executor.wake()
+    return parent
+
+
+def child_finished(job):
+    """Promote the next pending sibling and finalize the parent when done."""
+    promoted = (
+        ScanJob.objects(parent_id=job.parent_id, status=PENDING)
+        .order_by("created_at")
+        .modify(new=True, set__status=QUEUED, set__updated_at=datetime.utcnow())
+    )
+    if promoted is not None:
+        get_executor().wake()
+    if not ScanJob.objects(parent_id=job.parent_id, status__nin=FINISHED).count():
+        finalize(job.parent_id)
+
+
+def children(parent_id):
+    """Return per-project status rows for a parent job."""
+    rows = ScanJob.objects(parent_id=parent_id).only(
+        "scan_id", "projectId", "status", "progress", "result", "current_service"
+    ).order_by("created_at")
+    return [
+        {
+            "scan_id": child.scan_id,
+            "projectId": child.projectId,
+            "status": child.status,
+            "progress": child.progress,
+            "service": child.current_service,
+            "result": child.result if child.status in FINISHED else None,
+        }
+        for child in rows
+    ]
+
+
+def overall_progress(rows):
+    if not rows:
+        return 100
+    return sum(row["progress"] or 0 for row in rows) // len(rows)
+
+
+def rollup(rows):
+    """Summarize finished child rows into the parent's result."""
+    completed = [r for r in rows if r["status"] == COMPLETED]
+    failed = [r for r in rows if r["status"] == ERROR]
+    return {
+        "projects": len(rows),
+        "completed": len(completed),
+        "failed": len(failed),
+        "findingsCount": sum(r["result"].get("findingsCount", 0) for r in completed),
+        "scans": [
+            {"projectId": r["projectId"], "scanId": r["result"].get("scanId"), "findingsCount": r["result"].get("findingsCount")}
+            for r in completed
+        ],
+        "errors": [{"projectId": r["projectId"], "error": r["result"].get("error")} for r in failed],
+    }
+
+
+def finalize(parent_id):
+    """Complete a running parent with its roll-up; only the first call wins."""
+    rows = children(parent_id)
+    summary = rollup(rows)
+    status = ERROR if rows and not summary["completed"] else COMPLETED
+    parent = ScanJob.objects(scan_id=parent_id, status=RUNNING).modify(
+        new=True,
+        set__status=status,
+        set__progress=100,
+        set__result=summary,
+        set__updated_at=datetime.utcnow(),
+    )
+    if parent is not None and parent.params.get("remove_key"):
+        key_path = parent.params.get("key_path")
+        if key_path and os.path.exists(key_path):
+            os.remove(key_path)
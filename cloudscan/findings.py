@@ -0,0 +1,320 @@
+"""Helpers for reading and normalizing scan findings.
+
+New scans store each finding as a ``Finding`` document. Scans created before
+that keep their findings embedded in the scan document; the helpers here hide
+the difference from the views.
+"""
+
+import base64
+import hashlib
+import json
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from mongoengine.errors import ValidationError
+
+from .columnar import attach_data, iter_chunk_findings
+from .models import AWSScan, GCPScan, Finding, DOCUMENT_STORAGES, STORAGE_COLLECTION, STORAGE_COMPRESSED
+
+SCAN_MODELS = {"AWS": AWSScan, "GCP": GCPScan}
+
+# Prowler writes ASFF compliance states and CSV statuses differently.
+_STATUS_ALIASES = {
+    "PASSED": "PASS",
+    "FAILED": "FAIL",
+    "WARNING": "MANUAL",
+    "NOT_AVAILABLE": "MANUAL",
+}
+
+
+# Sort order for ``?sort=severity``; unknown severities sort last.
+SEVERITY_RANKS = {
+    "critical": 0,
+    "high": 1,
+    "medium": 2,
+    "low": 3,
+    "informational": 4,
+}
+
+
+def normalize_severity(value):
+    return value.strip().lower() if value else None
+
+
+def normalize_status(value):
+    if not value:
+        return None
+    value = value.strip().upper()
+    return _STATUS_ALIASES.get(value, value)
+
+
+def _aws_check_id(raw):
+    generator = raw.get("GeneratorId") or ""
+    if generator.startswith("prowler-"):
+        return generator[len("prowler-"):]
+    return generator or None
+
+
+def fingerprint(check_id, resource, region, account):
+    """Return a stable identity for one check result on one resource.
+
+    The same resource failing the same check yields the same fingerprint in
+    every scan, which is what scan diffs match on.
+    """
+    key = "\x1f".join(str(part or "") for part in (check_id, resource, region, account))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def finding_fields(provider, raw):
+    """Return the indexed ``Finding`` fields extracted from a raw record."""
+    if provider == "AWS":
+        check_id = _aws_check_id(raw)
+        resources = raw.get("Resources") or [{}]
+        fields = {
+            "severity": normalize_severity((raw.get("Severity") or {}).get("Label")),
+            "status": normalize_status((raw.get("Compliance") or {}).get("Status")),
+            # Prowler check IDs are prefixed with the service name.
+            "service": check_id.split("_", 1)[0] if check_id else None,
+            "checkId": check_id,
+            "region": raw.get("Region") or resources[0].get("Region"),
+        }
+        resource = resources[0].get("Id")
+        account = raw.get("AwsAccountId")
+    else:
+        fields = {
+            "severity": normalize_severity(raw.get("SEVERITY")),
+            "status": normalize_status(raw.get("STATUS")),
+            "service": raw.get("SERVICE_NAME") or None,
+            "checkId": raw.get("CHECK_ID") or None,
+            "region": raw.get("REGION") or None,
+        }
+        resource = raw.get("RESOURCE_UID") or raw.get("RESOURCE_ID") or raw.get("RESOURCE_NAME")
+        account = raw.get("ACCOUNT_UID") or raw.get("PROJECT_ID")
+    fields["severityRank"] = SEVERITY_RANKS.get(fields["severity"], len(SEVERITY_RANKS))
+    fields["fingerprint"] = fingerprint(fields["checkId"], resource, fields["region"], account)
+    return fields
+
+
+def make_finding(scan, raw):
+    """Build an unsaved ``Finding`` for ``raw`` belonging to ``scan``."""
+    return Finding(
+        scan=scan.id,
+        provider=scan.provider,
+        observedAt=scan.date,
+        data=raw,
+        **finding_fields(scan.provider, raw),
+    )
+
+
+def get_scan(model, **query):
+    """Fetch a scan without its embedded findings, or ``None``."""
+    try:
+        return model.objects(**query).exclude("findings").first()
+    except ValidationError:
+        return None
+
+
+def iter_findings(scan, keys=None):
+    """Yield the raw findings of ``scan`` in ingestion order.
+
+    ``keys`` optionally restricts each finding to those top-level keys, which
+    lets MongoDB skip the rest of each document.
+    """
+    if scan.storage == STORAGE_COMPRESSED:
+        yield from iter_chunk_findings(scan.id, keys)
+        return
+    if scan.storage == STORAGE_COLLECTION:
+        projection = {f"data.{key}": 1 for key in keys} if keys else {"data": 1}
+        rows = Finding._get_collection().find({"scan": scan.id}, projection).sort("_id", 1)
+        for row in rows:
+            yield row.get("data", {})
+        return
+    embedded = type(scan).objects(id=scan.id).only("findings").as_pymongo().first()
+    for raw in (embedded or {}).get("findings", []):
+        yield {key: raw[key] for key in keys if key in raw} if keys else raw
+
+
+def load_findings(scan):
+    """Return every raw finding of ``scan`` as a list."""
+    return list(iter_findings(scan))
+
+
+# Query parameters accepted as findings filters, mapped to their normalizer.
+FILTERS = {
+    "severity": normalize_severity,
+    "status": normalize_status,
+    "service": str.strip,
+    "region": str.strip,
+    "checkId": str.strip,
+}
+SORTS = ("id", "severity")
+
+
+def parse_filters(params):
+    """Return ``{field: [values]}`` from comma-separated query parameters."""
+    filters = {}
+    for field, normalize in FILTERS.items():
+        raw = params.get(field)
+        if raw:
+            values = [normalize(v) for v in raw.split(",") if v.strip()]
+            if values:
+                filters[field] = values
+    return filters
+
+
+def parse_group_by(value):
+    """Return the fields of a comma-separated ``by`` parameter.
+
+    Raises ``ValueError`` if it is empty or names a field that is not one
+    of ``FILTERS``.
+    """
+    fields = [field.strip() for field in (value or "").split(",") if field.strip()]
+    if not fields:
+        raise ValueError(f"by must name one or more of {', '.join(FILTERS)}")
+    for field in fields:
+        if field not in FILTERS:
+            raise ValueError(f"Unknown group field {field!r}")
+    return list(dict.fromkeys(fields))
+
+
+def encode_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Decode an ``after`` token, raising ``ValueError`` if it is malformed."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(data, dict):
+        raise ValueError("Invalid cursor")
+    return data
+
+
+def page_cursor(sort, after):
+    """Validate ``sort`` and decode ``after``; raise ``ValueError`` if bad."""
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort {sort!r}")
+    return decode_cursor(after) if after else None
+
+
+def page_findings(scan, filters=None, limit=None, after=None, sort="id"):
+    """Return ``(findings, next_cursor)`` for one page of ``scan``'s findings.
+
+    ``limit=None`` returns every matching finding. ``after`` is the opaque
+    cursor returned with the previous page; it encodes the sort key of the
+    last finding so each page is an index range scan rather than a skip.
+    Raises ``ValueError`` for an unknown sort or malformed cursor.
+    """
+    filters = filters or {}
+    cursor = page_cursor(sort, after)
+    if scan.storage in DOCUMENT_STORAGES:
+        return _page_collection(scan, filters, limit, cursor, sort)
+    return _page_embedded(scan, filters, limit, cursor, sort)
+
+
+# Fields read for each finding of a page.
+PAGE_PROJECTION = {"data": 1, "severityRank": 1, "scan": 1, "chunk": 1, "row": 1}
+
+
+def collection_query(scan, filters, cursor, sort):
+    """Return ``(query, order)`` selecting one page from the findings collection."""
+    query = {"scan": scan.id}
+    for field, values in filters.items():
+        query[field] = values[0] if len(values) == 1 else {"$in": values}
+
+    order = [("_id", 1)] if sort == "id" else [("severityRank", 1), ("_id", 1)]
+    if cursor:
+        last_id, rank = cursor_key(cursor, sort)
+        if sort == "id":
+            query["_id"] = {"$gt": last_id}
+        else:
+            query["$or"] = [
+                {"severityRank": {"$gt": rank}},
+                {"severityRank": rank, "_id": {"$gt": last_id}},
+            ]
+    return query, order
+
+
+def cursor_key(cursor, sort):
+    """Return ``(last_id, rank)`` from a findings collection cursor.
+
+    ``rank`` is ``None`` for ``sort=id``. Raises ``ValueError`` if the
+    cursor is malformed.
+    """
+    try:
+        last_id = ObjectId(cursor.get("id"))
+    except (InvalidId, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if sort == "id":
+        return last_id, None
+    rank = cursor.get("rank")
+    if not isinstance(rank, int):
+        raise ValueError("Invalid cursor")
+    return last_id, rank
+
+
+def collection_page(rows, limit, sort):
+    """Trim the ``limit + 1`` rows read for a page; return ``(rows, next_cursor)``."""
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        token = {"id": str(last["_id"])}
+        if sort == "severity":
+            token["rank"] = last.get("severityRank")
+        next_cursor = encode_cursor(token)
+    return rows, next_cursor
+
+
+def _page_collection(scan, filters, limit, cursor, sort):
+    query, order = collection_query(scan, filters, cursor, sort)
+    rows = Finding._get_collection().find(query, PAGE_PROJECTION).sort(order)
+    if limit is not None:
+        rows = rows.limit(limit + 1)
+    rows, next_cursor = collection_page(list(rows), limit, sort)
+    return [row.get("data", {}) for row in attach_data(rows)], next_cursor
+
+
+def _page_embedded(scan, filters, limit, cursor, sort):
+    """Filter and page a legacy scan's embedded findings in memory."""
+    matches = []
+    for raw in iter_findings(scan):
+        fields = finding_fields(scan.provider, raw)
+        if all(fields.get(field) in values for field, values in filters.items()):
+            matches.append((fields["severityRank"], raw))
+    if sort == "severity":
+        matches.sort(key=lambda item: item[0])
+    matches, next_cursor = position_page(matches, limit, cursor)
+    return [raw for _, raw in matches], next_cursor
+
+
+def position_page(matches, limit, cursor):
+    """Slice one page off ``matches`` using a ``{"pos": n}`` cursor.
+
+    Returns ``(page, next_cursor)``; raises ``ValueError`` for a bad cursor.
+    """
+    start = 0
+    if cursor:
+        start = cursor.get("pos")
+        if not isinstance(start, int) or start < 0:
+            raise ValueError("Invalid cursor")
+    end = len(matches) if limit is None else start + limit
+    next_cursor = encode_cursor({"pos": end}) if end < len(matches) else None
+    return matches[start:end], next_cursor
+
+
+def page_size(value):
+    """Validate a ``limit`` query parameter against ``FINDINGS_MAX_PAGE_SIZE``."""
+    if value in (None, ""):
+        return None
+    try:
+        limit = int(value)
+    except ValueError as exc:
+        raise ValueError("limit must be an integer") from exc
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, getattr(settings, "FINDINGS_MAX_PAGE_SIZE", 1000))
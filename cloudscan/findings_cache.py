@@ -0,0 +1,386 @@
+"""In-process cache of recent scans' findings in columnar form.
+
+Dashboard interactions filter and group the same scan's findings again and
+again. ``FINDINGS_CACHE`` keeps the most recently used scans in memory as
+columns: each indexed field (``severity``, ``status``, ``service``,
+``region``, ``checkId``) is dictionary-encoded into an integer array, and
+the raw findings are kept as JSON bytes in one buffer. Filters and group-bys
+then run over the integer arrays; only the findings of the page being
+returned are decoded. These are vectorized ``numpy`` operations, or plain
+loops over ``array`` columns where numpy is not installed.
+
+Scans are admitted on their second request, so a one-off page read does not
+pay for loading the whole scan. Concurrent requests for a scan being loaded
+wait for that one load, and a load stops as soon as the scan proves larger
+than the budget. Entries are keyed by scan ID, ``version``
+and storage, so rewritten scans are never served stale. The least recently
+used entries are evicted to stay within ``FINDINGS_MEMORY_CACHE_BYTES``
+(0 disables the cache). Pages served from the cache are identical to the
+ones read from MongoDB, cursors included, so a client can move between the
+two mid-pagination.
+"""
+
+import bisect
+import json
+import sys
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from itertools import islice
+
+from bson import ObjectId
+from django.conf import settings
+
+from .caching import ingested
+from .columnar import attach_data
+from .findings import (
+    FILTERS,
+    SEVERITY_RANKS,
+    cursor_key,
+    encode_cursor,
+    finding_fields,
+    iter_findings,
+    page_cursor,
+    page_findings,
+    position_page,
+)
+from .metrics import STAGE_SECONDS
+from .models import Finding, DOCUMENT_STORAGES
+
+try:  # In requirements.txt; the fallback keeps minimal installs working
+    import numpy as np
+except ImportError:
+    np = None
+
+# Indexed fields stored as dictionary-encoded columns.
+COLUMNS = tuple(FILTERS)
+
+# Findings read from MongoDB per round trip while loading a scan.
+LOAD_BATCH_SIZE = 1000
+
+# Scans remembered as requested once (or too large to keep).
+_SEEN_LIMIT = 1024
+_OVERSIZE = -1
+
+# Lower bound of the cached size of one finding, to skip loading scans whose
+# ``findingsCount`` alone rules them out.
+MIN_FINDING_BYTES = 64
+
+
+class TooLarge(Exception):
+    """Raised by ``ScanColumns`` once the findings exceed ``max_bytes``."""
+
+
+def _budget():
+    return getattr(settings, "FINDINGS_MEMORY_CACHE_BYTES", 256 * 1024 * 1024)
+
+
+def _typecode(size):
+    """Smallest signed ``array`` type code holding values below ``size``."""
+    if size <= 1 << 7:
+        return "b"
+    if size <= 1 << 15:
+        return "h"
+    return "i"
+
+
+def _column(codes, size):
+    if np is not None:
+        return np.asarray(codes).astype({"b": np.int8, "h": np.int16, "i": np.int32}[_typecode(size)])
+    return array(_typecode(size), codes)
+
+
+def _nbytes(column):
+    return column.nbytes if np is not None else column.itemsize * len(column)
+
+
+class _Ids:
+    """Sequence view over 12-byte ``ObjectId``s stored back to back."""
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def __len__(self):
+        return len(self.buf) // 12
+
+    def __getitem__(self, index):
+        return self.buf[index * 12:index * 12 + 12]
+
+
+class ScanColumns:
+    """One scan's findings as columns; see the module docstring.
+
+    ``rows`` yields ``(fields, finding_id, raw)`` in ``_id`` order, where
+    ``fields`` holds the indexed ``Finding`` fields. ``positional`` scans
+    (embedded findings) page with position cursors like ``page_findings``
+    does for them; the others with ``_id`` cursors. Building raises
+    ``TooLarge`` once the raw findings exceed ``max_bytes``.
+    """
+
+    def __init__(self, rows, positional=False, max_bytes=None):
+        self.positional = positional
+        self.values = {field: [] for field in COLUMNS}
+        self.lookup = {field: {} for field in COLUMNS}
+        codes = {field: array("i") for field in COLUMNS}
+        ranks = array("b")
+        offsets = array("q", [0])
+        data, ids = bytearray(), bytearray()
+        for fields, finding_id, raw in rows:
+            for field in COLUMNS:
+                value = fields.get(field)
+                lookup = self.lookup[field]
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(self.values[field])
+                    self.values[field].append(value)
+                codes[field].append(code)
+            rank = fields.get("severityRank")
+            ranks.append(len(SEVERITY_RANKS) if rank is None else rank)
+            if finding_id is not None:
+                ids += finding_id.binary
+            data += json.dumps(raw, separators=(",", ":"), default=str).encode()
+            offsets.append(len(data))
+            if max_bytes is not None and len(data) > max_bytes:
+                raise TooLarge
+        self.count = len(ranks)
+        self.codes = {field: _column(codes[field], len(self.values[field])) for field in COLUMNS}
+        self.ranks = _column(ranks, len(SEVERITY_RANKS) + 1)
+        self.offsets = offsets
+        self.data = bytes(data)
+        self.ids = bytes(ids)
+        self.nbytes = (
+            len(self.data) + len(self.ids) + offsets.itemsize * len(offsets) + _nbytes(self.ranks)
+            + sum(_nbytes(column) for column in self.codes.values())
+            # Each distinct value is referenced from ``values`` and ``lookup``.
+            + sum(sys.getsizeof(value) + 100 for values in self.values.values() for value in values)
+        )
+
+    def select(self, filters):
+        """Return the positions of the findings matching ``filters``, in order."""
+        wanted = {
+            field: [self.lookup[field][value] for value in values if value in self.lookup[field]]
+            for field, values in filters.items()
+        }
+        if np is not None:
+            mask = np.ones(self.count, dtype=bool)
+            for field, codes in wanted.items():
+                mask &= np.isin(self.codes[field], codes)
+            return np.flatnonzero(mask)
+        tests = [(self.codes[field], set(codes)) for field, codes in wanted.items()]
+        return [row for row in range(self.count) if all(column[row] in codes for column, codes in tests)]
+
+    def findings(self, rows):
+        """Decode the raw findings at positions ``rows``."""
+        data, offsets = self.data, self.offsets
+        return [json.loads(data[offsets[row]:offsets[row + 1]]) for row in rows]
+
+    def page(self, filters, limit, cursor, sort):
+        """Return ``(findings, next_cursor)`` exactly as ``page_findings`` would."""
+        rows = self.select(filters)
+        if sort == "severity":
+            if np is not None:
+                rows = rows[np.argsort(self.ranks[rows], kind="stable")]
+            else:
+                rows = sorted(rows, key=self.ranks.__getitem__)
+        if self.positional:
+            rows, next_cursor = position_page(rows, limit, cursor)
+            return self.findings(rows), next_cursor
+
+        if cursor:
+            last_id, rank = cursor_key(cursor, sort)
+            start = bisect.bisect_right(_Ids(self.ids), last_id.binary)
+            if np is not None:
+                keep = rows >= start
+                if sort == "severity":
+                    ranks = self.ranks[rows]
+                    keep = (ranks > rank) | ((ranks == rank) & keep)
+                rows = rows[keep]
+            elif sort == "id":
+                rows = [row for row in rows if row >= start]
+            else:
+                ranks = self.ranks
+                rows = [row for row in rows if ranks[row] > rank or (ranks[row] == rank and row >= start)]
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = int(rows[-1])
+            token = {"id": str(ObjectId(_Ids(self.ids)[last]))}
+            if sort == "severity":
+                token["rank"] = int(self.ranks[last])
+            next_cursor = encode_cursor(token)
+        return self.findings(rows), next_cursor
+
+    def group_counts(self, by, filters):
+        """Return ``{values: count}`` of the matching findings per ``by`` fields."""
+        rows = self.select(filters)
+        sizes = [len(self.values[field]) for field in by]
+        if np is not None:
+            # One integer per combination: the codes in mixed radix.
+            keys = np.zeros(len(rows), dtype=np.int64)
+            for field, size in zip(by, sizes):
+                keys = keys * size + self.codes[field][rows]
+            unique, counts = np.unique(keys, return_counts=True)
+            cells = {}
+            for key, count in zip(unique.tolist(), counts.tolist()):
+                codes = []
+                for size in reversed(sizes):
+                    key, code = divmod(key, size)
+                    codes.append(code)
+                cells[tuple(reversed(codes))] = count
+        else:
+            columns = [self.codes[field] for field in by]
+            cells = Counter(tuple(column[row] for column in columns) for row in rows)
+        return Counter({
+            tuple(self.values[field][code] for field, code in zip(by, codes)): count
+            for codes, count in cells.items()
+        })
+
+
+def scan_rows(scan):
+    """Yield ``(fields, finding_id, raw)`` for every finding of ``scan``."""
+    if scan.storage not in DOCUMENT_STORAGES:
+        for raw in iter_findings(scan):
+            yield finding_fields(scan.provider, raw), None, raw
+        return
+    projection = dict.fromkeys(COLUMNS + ("severityRank", "data", "scan", "chunk", "row"), 1)
+    cursor = Finding._get_collection().find({"scan": scan.id}, projection).sort("_id", 1)
+    while True:
+        batch = list(islice(cursor, LOAD_BATCH_SIZE))
+        if not batch:
+            return
+        for row in attach_data(batch):
+            yield row, row["_id"], row.get("data", {})
+
+
+class _Load:
+    """A scan being loaded that other requests can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.columns = None
+        self.error = None
+
+
+class FindingsCache:
+    """LRU of ``ScanColumns`` bounded by their estimated size in bytes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._seen = OrderedDict()
+        self._loading = {}  # key -> _Load
+        self.nbytes = 0
+
+    @staticmethod
+    def key(scan):
+        return (scan.id, scan.version or 0, scan.storage)
+
+    @staticmethod
+    def cacheable(scan):
+        return _budget() > 0 and ingested(scan)
+
+    def get(self, scan):
+        """Return the cached columns of ``scan`` or ``None``; never loads."""
+        key = self.key(scan)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def load(self, scan):
+        """Return the columns of ``scan``, loading them on its second request.
+
+        Returns ``None`` when the scan should be read from MongoDB instead:
+        it is still being ingested, this is its first request, or it does not
+        fit in the budget. Concurrent calls for one scan share a single load;
+        its errors are raised in every caller.
+        """
+        if not self.cacheable(scan):
+            return None
+        key = self.key(scan)
+        budget = _budget()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            seen = self._seen.pop(key, 0)
+            self._seen[key] = seen if seen == _OVERSIZE else seen + 1
+            while len(self._seen) > _SEEN_LIMIT:
+                self._seen.popitem(last=False)
+            if seen in (0, _OVERSIZE):
+                return None
+            if (scan.findingsCount or 0) * MIN_FINDING_BYTES > budget:
+                self._seen[key] = _OVERSIZE
+                return None
+            load = self._loading.get(key)
+            leader = load is None
+            if leader:
+                load = self._loading[key] = _Load()
+
+        if not leader:
+            load.done.wait()
+            if load.error is not None:
+                raise load.error
+            return load.columns
+
+        try:
+            with STAGE_SECONDS.time(stage="findings_cache_load"):
+                load.columns = ScanColumns(
+                    scan_rows(scan), positional=scan.storage not in DOCUMENT_STORAGES, max_bytes=budget
+                )
+        except TooLarge:
+            with self._lock:
+                self._seen[key] = _OVERSIZE
+        except Exception as exc:
+            load.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            load.done.set()
+        columns = load.columns
+        if columns is None:
+            return None
+        if scan.storage in DOCUMENT_STORAGES and columns.count != scan.findingsCount:
+            # Findings changed underneath the scan; answer but do not keep.
+            return columns
+        self.put(key, columns)
+        return columns
+
+    def put(self, key, columns):
+        budget = _budget()
+        with self._lock:
+            if columns.nbytes > budget:
+                self._seen[key] = _OVERSIZE
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[key] = columns
+            self.nbytes += columns.nbytes
+            while self.nbytes > budget:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._seen.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+FINDINGS_CACHE = FindingsCache()
+
+
+def cached_page(scan, filters=None, limit=None, after=None, sort="id"):
+    """``page_findings`` answered from ``FINDINGS_CACHE`` when it can be."""
+    cursor = page_cursor(sort, after)
+    columns = FINDINGS_CACHE.load(scan)
+    if columns is None:
+        return page_findings(scan, filters, limit, after, sort)
+    return columns.page(filters or {}, limit, cursor, sort)
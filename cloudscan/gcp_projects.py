@@ -0,0 +1,93 @@
+"""Project discovery for uploaded GCP service account keys.
+
+Projects are listed in-process with the Resource Manager client library
+instead of a ``gcloud`` subprocess. Results are cached for
+``GCP_PROJECTS_CACHE_SECONDS`` under a SHA-256 fingerprint of the key file,
+so uploading the same key again does not hit the API, and concurrent
+uploads of one key share a single lookup.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+
+_SCOPES = ["https://www.googleapis.com/auth/cloud-platform.read-only"]
+
+_lock = threading.Lock()
+_cache = {}  # fingerprint -> (expires_at, project ids)
+_inflight = {}  # fingerprint -> _Lookup
+
+
+class _Lookup:
+    """A project listing in progress that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.projects = None
+        self.error = None
+
+
+def key_fingerprint(key_path):
+    """Return the SHA-256 hex digest of a key file's contents."""
+    digest = hashlib.sha256()
+    with open(key_path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_projects(key_path):
+    """Return the IDs of the active projects visible to a service account."""
+    from google.cloud import resourcemanager_v3
+    from google.oauth2 import service_account
+
+    credentials = service_account.Credentials.from_service_account_file(key_path, scopes=_SCOPES)
+    client = resourcemanager_v3.ProjectsClient(credentials=credentials)
+    return [project.project_id for project in client.search_projects(query="state:ACTIVE")]
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def fetch_project_ids(key_path):
+    """Return the project IDs for ``key_path``, from the cache when fresh.
+
+    Failed lookups are not cached; every caller waiting on one gets its
+    exception.
+    """
+    fingerprint = key_fingerprint(key_path)
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(fingerprint)
+        if cached and cached[0] > now:
+            return list(cached[1])
+        lookup = _inflight.get(fingerprint)
+        leader = lookup is None
+        if leader:
+            lookup = _inflight[fingerprint] = _Lookup()
+
+    if not leader:
+        lookup.done.wait()
+        if lookup.error is not None:
+            raise lookup.error
+        return list(lookup.projects)
+
+    try:
+        lookup.projects = list_projects(key_path)
+    except Exception as exc:
+        lookup.error = exc
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(fingerprint, None)
+            if lookup.error is None:
+                now = time.monotonic()
+                for stale in [fp for fp, (expires, _) in _cache.items() if expires <= now]:
+                    del _cache[stale]
+                _cache[fingerprint] = (now + settings.GCP_PROJECTS_CACHE_SECONDS, lookup.projects)
+        lookup.done.set()
+    return list(lookup.projects)
@@ -1,7 +1,10 @@
+from django.http import HttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from mongoengine.connection import get_db
 
+from .metrics import render
+
 
 class HealthCheckView(APIView):
     """Simple endpoint to verify MongoDB connectivity."""
@@ -17,3 +20,13 @@ class HealthCheckView(APIView):
             return Response({"mongodb": "connected"})
         except Exception as exc:
             return Response({"mongodb": "unavailable", "detail": str(exc)}, status=500)
+
+
+class MetricsView(APIView):
+    """Expose hot-path timings in the Prometheus text format."""
+
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
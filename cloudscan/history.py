@@ -0,0 +1,144 @@
+"""Paginated, projection-only scan history queries.
+
+History listings only need a handful of metadata fields, so they are read
+with an aggregation that projects those fields (plus a finding count) and
+never transfers embedded findings. Pages are keyed on ``(date, _id)`` in
+descending order; the ``after`` cursor encodes the last row of a page.
+"""
+
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from .findings import decode_cursor, encode_cursor
+from .models import Finding, DOCUMENT_STORAGES
+
+
+def parse_date(value, field):
+    """Parse an ISO-8601 date parameter into a naive UTC ``datetime``."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as exc:
+        raise ValueError(f"{field} must be an ISO-8601 date") from exc
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def history_match(params, date_field, filters):
+    """Build a ``$match`` stage from the query parameters.
+
+    ``filters`` maps query parameter names to document fields; each accepts
+    comma-separated values. ``from`` and ``to`` bound ``date_field``.
+    """
+    match = {}
+    for param, field in filters.items():
+        values = [v.strip() for v in (params.get(param) or "").split(",") if v.strip()]
+        if values:
+            match[field] = values[0] if len(values) == 1 else {"$in": values}
+    bounds = {}
+    if params.get("from"):
+        bounds["$gte"] = parse_date(params["from"], "from")
+    if params.get("to"):
+        bounds["$lte"] = parse_date(params["to"], "to")
+    if bounds:
+        match[date_field] = bounds
+    return match
+
+
+def _after_clause(date_field, cursor):
+    """Return the filter selecting rows after ``cursor`` in descending order."""
+    last_id = cursor.get("id")
+    if last_id is None:
+        raise ValueError("Invalid cursor")
+    if cursor.get("date") is None:
+        # Rows without a date sort last; only ids break ties among them.
+        return {date_field: None, "_id": {"$lt": last_id}}
+    last_date = parse_date(cursor["date"], "after")
+    return {"$or": [
+        {date_field: {"$lt": last_date}},
+        {date_field: last_date, "_id": {"$lt": last_id}},
+        {date_field: None},
+    ]}
+
+
+def history_pipeline(match, fields, date_field, limit=None, after=None, id_type=str):
+    """Return the aggregation pipeline reading one history page.
+
+    ``fields`` is the ``$project`` stage; ``id_type`` converts cursor ids back
+    to the type stored in ``_id``. Raises ``ValueError`` on a bad cursor.
+    """
+    match = dict(match)
+    if after:
+        cursor = decode_cursor(after)
+        if cursor.get("id") is not None:
+            try:
+                cursor["id"] = id_type(cursor["id"])
+            except Exception as exc:  # pylint: disable=broad-except
+                raise ValueError("Invalid cursor") from exc
+        match = {"$and": [match, _after_clause(date_field, cursor)]}
+
+    pipeline = [{"$match": match}, {"$sort": {date_field: -1, "_id": -1}}]
+    if limit is not None:
+        pipeline.append({"$limit": limit + 1})
+    pipeline.append({"$project": fields})
+    return pipeline
+
+
+def history_cursor(rows, date_field, limit):
+    """Trim the ``limit + 1`` rows read for a page; return ``(rows, next_cursor)``."""
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        last_date = last.get(date_field)
+        next_cursor = encode_cursor({
+            "date": last_date.isoformat() if last_date else None,
+            "id": str(last["_id"]),
+        })
+    return rows, next_cursor
+
+
+def history_page(model, match, fields, date_field, limit=None, after=None, id_type=str):
+    """Return ``(rows, next_cursor)`` for one page of ``model`` documents.
+
+    See ``history_pipeline`` for the arguments.
+    """
+    pipeline = history_pipeline(match, fields, date_field, limit, after, id_type)
+    return history_cursor(list(model._get_collection().aggregate(pipeline)), date_field, limit)
+
+
+# ``$project`` stage for scan listings. ``findingsCount`` falls back to the
+# size of the embedded list for scans ingested before it was recorded.
+SCAN_FIELDS = {
+    "date": 1,
+    "provider": 1,
+    "region": 1,
+    "accountId": 1,
+    "projectId": 1,
+    "storage": 1,
+    "failedCount": 1,
+    "findingsCount": {"$ifNull": ["$findingsCount", {"$size": {"$ifNull": ["$findings", []]}}]},
+}
+
+
+def scan_history_match(params):
+    return history_match(params, "date", {"accountId": "accountId", "projectId": "projectId"})
+
+
+def uncounted(row):
+    """Return whether a history row's count must be read from the findings.
+
+    True for scans moved to the findings collection without a recorded count.
+    """
+    return row.get("storage") in DOCUMENT_STORAGES and not row.get("findingsCount")
+
+
+def scan_history(model, params, limit=None, after=None):
+    """Return ``(rows, next_cursor)`` of scan metadata for the history views."""
+    match = scan_history_match(params)
+    rows, next_cursor = history_page(model, match, SCAN_FIELDS, "date", limit, after, id_type=ObjectId)
+    for row in rows:
+        if uncounted(row):
+            row["findingsCount"] = Finding.objects(scan=row["_id"]).count()
+    return rows, next_cursor
@@ -0,0 +1,216 @@
+"""Incremental rescans that reuse the up-to-date checks of a previous scan.
+
+An incremental rescan starts from the latest scan of the same AWS account
+and region or GCP project. Only the checks that were requested explicitly,
+belong to a requested service or are older than their max-age are rerun;
+the findings of every other check are copied into the new scan with
+``carriedForward`` set and their original ``observedAt``.
+
+Checks are known from the findings they produced, so a check without any
+findings in the base scan is only run again when it is requested.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from .findings import finding_fields, get_scan, iter_findings
+from .columnar import attach_data, write_chunk
+from .ingest import _batch_size, _chunk_size, batched, default_storage
+from .models import DOCUMENT_STORAGES, Finding, FindingChunk, SearchPosting, STORAGE_COMPRESSED
+from .search import SearchIndexer
+from .summary import merge_summary, summary_key
+
+
+def max_age(check_id):
+    """Return how long a result of ``check_id`` stays fresh.
+
+    ``CHECK_MAX_AGE_OVERRIDES`` entries for the check, then for its service
+    (the check ID prefix), take precedence over ``CHECK_MAX_AGE_SECONDS``.
+    """
+    overrides = getattr(settings, "CHECK_MAX_AGE_OVERRIDES", {})
+    service = check_id.split("_", 1)[0]
+    seconds = overrides.get(check_id, overrides.get(service, settings.CHECK_MAX_AGE_SECONDS))
+    return timedelta(seconds=seconds)
+
+
+def find_base_scan(model, scan_id=None, **owner):
+    """Return the scan to rescan: ``scan_id`` or the latest matching ``owner``.
+
+    ``owner`` holds fields such as ``accountId`` and ``region``; if any of
+    them is empty no scan is matched. Returns ``None`` when there is no such
+    scan.
+    """
+    if scan_id:
+        return get_scan(model, id=scan_id)
+    if not owner or not all(owner.values()):
+        return None
+    return model.objects(**owner).exclude("findings").order_by("-date").first()
+
+
+def check_ages(scan):
+    """Return ``{checkId: observedAt}`` of the oldest result of each check."""
+    if scan.storage in DOCUMENT_STORAGES:
+        rows = Finding._get_collection().aggregate([
+            {"$match": {"scan": scan.id}},
+            {"$group": {"_id": "$checkId", "observedAt": {"$min": "$observedAt"}}},
+        ])
+        return {row["_id"]: row["observedAt"] or scan.date for row in rows if row["_id"]}
+    return {
+        check_id: scan.date
+        for check_id in {finding_fields(scan.provider, raw)["checkId"] for raw in iter_findings(scan)}
+        if check_id
+    }
+
+
+def plan_rescan(base, checks=None, services=None, now=None):
+    """Return ``(rerun, reuse)`` sets of check IDs for a rescan of ``base``.
+
+    ``rerun`` holds the requested ``checks``, every known check of the
+    requested ``services`` and every stale check; ``reuse`` the rest.
+    """
+    now = now or datetime.now()
+    services = set(services or ())
+    ages = check_ages(base)
+    rerun = set(checks or ())
+    for check_id, observed in ages.items():
+        if check_id.split("_", 1)[0] in services or now - observed > max_age(check_id):
+            rerun.add(check_id)
+    return rerun, set(ages) - rerun
+
+
+def _carried_docs(base, scan, checks):
+    """Yield raw ``Finding`` documents of ``base`` for ``checks``, re-parented."""
+    if base.storage in DOCUMENT_STORAGES:
+        rows = Finding._get_collection().find(
+            {"scan": base.id, "checkId": {"$in": sorted(checks)}}
+        ).sort("_id", 1)
+        for batch in batched(rows, _batch_size()):
+            # Compressed bases keep raw data in chunks; copy it inline.
+            for row in attach_data(batch):
+                for field in ("_id", "chunk", "row"):
+                    row.pop(field, None)
+                row.update(
+                    scan=scan.id,
+                    observedAt=row.get("observedAt") or base.date,
+                    carriedForward=True,
+                )
+                yield row
+        return
+    for raw in iter_findings(base):
+        fields = finding_fields(base.provider, raw)
+        if fields["checkId"] in checks:
+            yield Finding(
+                scan=scan.id,
+                provider=base.provider,
+                observedAt=base.date,
+                carriedForward=True,
+                data=raw,
+                **fields,
+            ).to_mongo().to_dict()
+
+
+def carry_forward(base, scan, checks):
+    """Copy ``base``'s findings for ``checks`` into ``scan``.
+
+    Returns ``(count, failed, cells)`` for the copied findings, ``cells``
+    being a ``Counter`` of their summary cells.
+    """
+    count = failed = 0
+    cells = Counter()
+    if not checks:
+        return count, failed, cells
+    collection = Finding._get_collection()
+    compressed = scan.storage == STORAGE_COMPRESSED
+    size = _chunk_size() if compressed else _batch_size()
+    seq = FindingChunk.objects(scan=scan.id).count()
+    indexer = SearchIndexer(scan)
+    for batch in batched(_carried_docs(base, scan, checks), size):
+        raws = [doc.get("data", {}) for doc in batch]
+        if compressed:
+            write_chunk(scan.id, seq, raws)
+            for row, doc in enumerate(batch):
+                doc.pop("data", None)
+                doc.update(chunk=seq, row=row)
+            seq += 1
+        collection.insert_many(batch, ordered=False)
+        indexer.add([doc["_id"] for doc in batch], raws)
+        count += len(batch)
+        failed += sum(1 for doc in batch if doc.get("status") == "FAIL")
+        cells.update(summary_key(doc) for doc in batch)
+    return count, failed, cells
+
+
+def incremental_scan(base, run, checks=None, services=None):
+    """Rescan ``base``'s account or project reusing its up-to-date checks.
+
+    ``run(checks)`` runs Prowler for the given comma-separated checks, ingests
+    the report and returns ``(scan, count)``; it is not called when every
+    check is still fresh. Returns ``(scan, count, info)`` where ``count``
+    includes carried-forward findings and ``info`` describes the rescan.
+    """
+    model = type(base)
+    rerun, reuse = plan_rescan(base, checks, services)
+    if rerun:
+        scan, count = run(",".join(sorted(rerun)))
+    else:
+        scan = model(
+            date=datetime.now(),
+            provider=base.provider,
+            storage=default_storage(),
+            findingsCount=0,
+            failedCount=0,
+            summary=[],
+            **{f: getattr(base, f) for f in ("accountId", "projectId", "region") if f in model._fields},
+        )
+        scan.save()
+        count = 0
+
+    carried, carried_failed, cells = carry_forward(base, scan, reuse)
+    scan.reload()
+    updates = {
+        "set__baseScan": base.id,
+        "set__rerunChecks": sorted(rerun),
+        "set__summary": merge_summary(scan.summary, cells),
+        "inc__findingsCount": carried,
+        "inc__failedCount": carried_failed,
+    }
+    # A rerun without findings cannot name its account or project.
+    for field in ("accountId", "projectId"):
+        if field in model._fields and getattr(scan, field) in (None, "unknown"):
+            updates[f"set__{field}"] = getattr(base, field)
+    model.objects(id=scan.id).update_one(**updates)
+    if "set__accountId" in updates:
+        SearchPosting.objects(scan=scan.id).update(set__accountId=updates["set__accountId"])
+    scan.reload()
+    info = {
+        "baseScanId": str(base.id),
+        "rerunChecks": sorted(rerun),
+        "carriedForward": carried,
+    }
+    return scan, count + carried, info
+
+
+def split_checks(checks):
+    """Return check IDs from a comma-separated string or a list."""
+    if isinstance(checks, str):
+        checks = checks.split(",")
+    return [c.strip() for c in checks or () if c and c.strip()]
+
+
+def rescan(model, run, checks=None, base_scan_id=None, services=None, **owner):
+    """Rescan incrementally, or run a full scan when there is nothing to reuse.
+
+    The base scan is ``base_scan_id`` or the latest scan matching ``owner``;
+    a missing ``base_scan_id`` raises ``LookupError``. Without any base scan
+    ``run(checks)`` performs a normal scan. Returns ``(scan, count, info)``
+    with ``info=None`` for a full scan.
+    """
+    base = find_base_scan(model, base_scan_id, **owner)
+    if base is None:
+        if base_scan_id:
+            raise LookupError("Base scan not found")
+        scan, count = run(checks)
+        return scan, count, None
+    return incremental_scan(base, run, checks=split_checks(checks), services=services)
@@ -0,0 +1,165 @@
+"""Index declarations checked against the queries the app actually runs.
+
+``QUERY_SHAPES`` lists each query the views, executor and ingest code send,
+as equality fields, sort keys and range fields. An index serves a shape
+when it starts with the shape's equality fields in any order, then its sort
+keys (all in the same or all in the opposite direction) and its range
+fields. ``audit`` compares the shapes with the indexes declared on the
+models and those present in the database, and reports three things:
+
+* indexes that are declared but missing from the database;
+* indexes that no shape uses, or that MongoDB has never used;
+* shapes that no index serves.
+
+``ensure_indexes`` builds the missing indexes.
+"""
+
+from collections import namedtuple
+
+from mongoengine.connection import get_db
+from pymongo.errors import OperationFailure
+
+from .findings import FILTERS
+from .models import AWSScan, GCPScan, Finding, FindingChunk, ImportedReport, ScanFlight, ScanJob, SearchPosting
+
+MODELS = (AWSScan, GCPScan, ScanJob, Finding, FindingChunk, ImportedReport, SearchPosting, ScanFlight)
+
+QueryShape = namedtuple("QueryShape", "model name equality sort ranges")
+
+
+def shape(model, name, equality=(), sort=(), ranges=()):
+    return QueryShape(model, name, tuple(equality), tuple(sort), tuple(ranges))
+
+
+_NEWEST = (("date", -1), ("_id", -1))
+
+QUERY_SHAPES = [
+    # Latest scan (latest findings and summary endpoints) and history pages,
+    # optionally bounded by ``from``/``to`` on ``date``.
+    shape(AWSScan, "latest scan", sort=[("date", -1)]),
+    shape(AWSScan, "history", sort=_NEWEST),
+    shape(AWSScan, "history by account", ["accountId"], _NEWEST),
+    shape(AWSScan, "incremental base scan", ["accountId", "region"], [("date", -1)]),
+    shape(GCPScan, "latest scan", sort=[("date", -1)]),
+    shape(GCPScan, "history", sort=_NEWEST),
+    shape(GCPScan, "history by account", ["accountId"], _NEWEST),
+    shape(GCPScan, "history by project", ["projectId"], _NEWEST),
+    shape(GCPScan, "incremental base scan", ["projectId"], [("date", -1)]),
+    # Scan job status, SSE polling and lease updates go through ``_id``.
+    shape(ScanJob, "job by id", ["_id"]),
+    shape(ScanJob, "claim next queued job", ["status"], [("created_at", 1)]),
+    shape(ScanJob, "expired leases", ["status"], ranges=["lease_expires_at"]),
+    shape(ScanJob, "fan-out children", ["parent_id"], [("created_at", 1)]),
+    shape(ScanJob, "job history", ["parent_id"], [("created_at", -1), ("_id", -1)]),
+    shape(Finding, "findings page", ["scan"], [("_id", 1)]),
+    shape(Finding, "findings by severity rank", ["scan"], [("severityRank", 1), ("_id", 1)]),
+    shape(Finding, "scan diff", ["scan"], [("fingerprint", 1), ("_id", 1)]),
+    shape(FindingChunk, "chunks of a scan", ["scan"], [("seq", 1)]),
+    shape(ImportedReport, "report by content hash", ["_id"]),
+    # Term and prefix lookups: a term is an equality or a range on ``term``.
+    shape(SearchPosting, "search a scan", ["scan"], ranges=["term"]),
+    shape(SearchPosting, "search an account", ["accountId"], ranges=["term"]),
+    shape(SearchPosting, "search all scans", ranges=["term"]),
+    shape(ScanFlight, "flight by parameters", ["_id"]),
+] + [
+    shape(Finding, f"findings filtered by {field}", ["scan", field], [("_id", 1)])
+    for field in FILTERS
+]
+
+
+def _collection(model):
+    # Not ``model._get_collection()``, which would create the indexes itself.
+    return get_db(model._meta.get("db_alias", "default"))[model._get_collection_name()]
+
+
+def declared_indexes(model):
+    """Return ``[(keys, options)]`` for the indexes declared on ``model``."""
+    declared = []
+    for spec in model._meta.get("index_specs") or []:
+        options = {key: value for key, value in spec.items() if key != "fields"}
+        declared.append((tuple(spec["fields"]), options))
+    return declared
+
+
+def existing_indexes(model):
+    """Return ``{keys: name}`` for the indexes present in the database."""
+    return {
+        tuple((field, int(direction)) for field, direction in info["key"]): name
+        for name, info in _collection(model).index_information().items()
+    }
+
+
+def serves(keys, query):
+    """Return whether an index with ``keys`` serves ``query`` without scanning."""
+    fields = [field for field, _ in keys]
+    count = len(query.equality)
+    if set(fields[:count]) != set(query.equality):
+        return False
+    rest = list(keys[count:])
+    if len(rest) < len(query.sort) + len(query.ranges):
+        return False
+    if query.sort:
+        head = rest[: len(query.sort)]
+        forward = list(query.sort)
+        backward = [(field, -direction) for field, direction in query.sort]
+        if head != forward and head != backward:
+            return False
+        rest = rest[len(query.sort):]
+    return [field for field, _ in rest[: len(query.ranges)]] == list(query.ranges)
+
+
+def index_usage(model):
+    """Return ``{name: ops}`` from ``$indexStats``, or ``None`` if unsupported."""
+    try:
+        return {row["name"]: row["accesses"]["ops"] for row in _collection(model).aggregate([{"$indexStats": {}}])}
+    except (OperationFailure, NotImplementedError):
+        return None
+
+
+ID_INDEX = (("_id", 1),)
+
+
+def audit(models=MODELS):
+    """Return one report dict per model; see the module docstring."""
+    reports = []
+    for model in models:
+        declared = [keys for keys, _ in declared_indexes(model)]
+        existing = existing_indexes(model)
+        shapes = [query for query in QUERY_SHAPES if query.model is model]
+        candidates = set(declared) | set(existing) | {ID_INDEX}
+        usage = index_usage(model)
+        unused = []
+        for keys in sorted(candidates - {ID_INDEX}):
+            name = existing.get(keys)
+            reasons = []
+            if not any(serves(keys, query) for query in shapes):
+                reasons.append("serves no known query")
+            if usage is not None and name in usage and not usage[name]:
+                reasons.append("never used since the server started")
+            if reasons:
+                unused.append({"keys": keys, "name": name, "reasons": reasons})
+        reports.append({
+            "model": model.__name__,
+            "collection": model._get_collection_name(),
+            "missing": [keys for keys in declared if keys not in existing],
+            "undeclared": [keys for keys in existing if keys != ID_INDEX and keys not in declared],
+            "unused": unused,
+            "uncovered": [query.name for query in shapes if not any(serves(keys, query) for keys in candidates)],
+        })
+    return reports
+
+
+def ensure_indexes(model, background=True):
+    """Create ``model``'s declared indexes that are missing; return their keys."""
+    existing = existing_indexes(model)
+    created = []
+    for keys, options in declared_indexes(model):
+        if keys in existing:
+            continue
+        _collection(model).create_index(list(keys), background=background, **options)
+        created.append(keys)
+    return created
+
+
+def format_keys(keys):
+    return ", ".join(f"{field} {'asc' if direction == 1 else 'desc'}" for field, direction in keys)
@@ -0,0 +1,337 @@
+"""Streaming ingestion of Prowler output files into MongoDB.
+
+Prowler reports can be hundreds of megabytes on large accounts. Instead of
+``json.load``-ing the whole report, findings are decoded one element at a
+time and written to MongoDB in bounded batches so peak memory does not grow
+with the number of findings.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from itertools import chain, islice
+
+from django.conf import settings
+
+from .findings import make_finding
+from .columnar import write_chunk
+from .metrics import FINDINGS_PER_SCAN, StageTimer
+from .models import AWSScan, GCPScan, Finding, ImportedReport, STORAGE_COLLECTION, STORAGE_COMPRESSED
+from .search import SearchIndexer
+from .summary import summary_key, summary_rows
+
+# Size of each read from the report file while decoding the ASFF array.
+ASFF_CHUNK_SIZE = 64 * 1024
+
+# GCP CSV columns with few distinct values per report: provider, account,
+# check metadata and the texts Prowler repeats for every resource a check
+# covers. Rows share one copy of each value instead of one per row.
+GCP_SHARED_COLUMNS = frozenset({
+    "AUTH_METHOD", "PROVIDER", "ACCOUNT_UID", "ACCOUNT_NAME", "ACCOUNT_EMAIL",
+    "ACCOUNT_ORGANIZATION_UID", "ACCOUNT_ORGANIZATION_NAME", "PROJECT_ID",
+    "CHECK_ID", "CHECK_TITLE", "CHECK_TYPE", "STATUS", "SERVICE_NAME",
+    "SUBSERVICE_NAME", "SEVERITY", "RESOURCE_TYPE", "PARTITION", "REGION",
+    "DESCRIPTION", "RISK", "RELATED_URL", "REMEDIATION_RECOMMENDATION_TEXT",
+    "REMEDIATION_RECOMMENDATION_URL", "REMEDIATION_CODE_NATIVEIAC",
+    "REMEDIATION_CODE_TERRAFORM", "REMEDIATION_CODE_CLI", "REMEDIATION_CODE_OTHER",
+    "COMPLIANCE", "CATEGORIES", "DEPENDS_ON", "RELATED_TO", "NOTES",
+    "PROWLER_VERSION", "ASSESSMENT_START_TIME", "TIMESTAMP",
+})
+
+
+def _csv_bool(value):
+    text = value.strip().lower()
+    if text in ("true", "false"):
+        return text == "true"
+    return value
+
+
+# Converters for typed GCP CSV columns. Values they do not recognise are
+# kept as read.
+GCP_COLUMN_TYPES = {
+    "MUTED": _csv_bool,
+}
+
+
+def _batch_size():
+    return getattr(settings, "INGEST_BATCH_SIZE", 500)
+
+
+def _chunk_size():
+    return getattr(settings, "FINDINGS_CHUNK_SIZE", 1000)
+
+
+def default_storage():
+    """Return the storage new scans use, per ``FINDINGS_STORAGE``."""
+    if getattr(settings, "FINDINGS_STORAGE", STORAGE_COLLECTION) == STORAGE_COMPRESSED:
+        return STORAGE_COMPRESSED
+    return STORAGE_COLLECTION
+
+
+def batched(iterable, size):
+    """Yield lists of at most ``size`` items from ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_json_array(fp, chunk_size=ASFF_CHUNK_SIZE):
+    """Yield the elements of a top-level JSON array read from ``fp``.
+
+    Only the current element and one read chunk are held in memory. An empty
+    file is treated as an empty array.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip_ws()
+    if pos >= len(buf):
+        return
+    if buf[pos] != "[":
+        raise ValueError("Expected a JSON array in Prowler output")
+    pos += 1
+
+    first = True
+    while True:
+        skip_ws()
+        if pos >= len(buf):
+            raise ValueError("Unexpected end of Prowler output")
+        if buf[pos] == "]":
+            return
+        if not first:
+            if buf[pos] != ",":
+                raise ValueError(f"Expected ',' in Prowler output, got {buf[pos]!r}")
+            pos += 1
+            skip_ws()
+        first = False
+
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # A scalar cut at the chunk boundary decodes "successfully";
+            # read more and decode again before trusting it.
+            if end == len(buf) and not eof:
+                fill()
+                continue
+            break
+        pos = end
+        yield item
+
+
+def iter_asff(path):
+    """Yield findings from a Prowler ``*.asff.json`` report one at a time."""
+    with open(path) as fp:
+        yield from iter_json_array(fp)
+
+
+def iter_gcp_csv(path):
+    """Yield rows of a Prowler GCP ``;``-separated CSV report one at a time.
+
+    Rows are dicts keyed by the header, like ``csv.DictReader`` rows: short
+    rows get ``None`` for the missing columns and values past the header
+    are dropped. Column names and ``GCP_SHARED_COLUMNS`` values are
+    interned, and ``GCP_COLUMN_TYPES`` columns are converted.
+    """
+    with open(path, newline="") as csvfile:
+        reader = csv.reader(csvfile, delimiter=";")
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [sys.intern(name) for name in header]
+        shared = [name for name in header if name in GCP_SHARED_COLUMNS]
+        typed = [(name, GCP_COLUMN_TYPES[name]) for name in header if name in GCP_COLUMN_TYPES]
+        width = len(header)
+        for values in reader:
+            if not values:
+                continue
+            if len(values) < width:
+                values += [None] * (width - len(values))
+            row = dict(zip(header, values))
+            for name in shared:
+                value = row[name]
+                if value is not None:
+                    row[name] = sys.intern(value)
+            for name, convert in typed:
+                value = row[name]
+                if value is not None:
+                    row[name] = convert(value)
+            yield row
+
+
+def store_findings(scan, findings):
+    """Insert ``findings`` for ``scan`` in batches and return how many.
+
+    The scan's ``findingsCount``, ``failedCount`` and ``summary`` are updated
+    once all findings are written. Compressed scans write each batch as one
+    ``FindingChunk`` and keep raw data off the ``Finding`` documents. Each
+    batch is also added to the search index.
+    """
+    count = failed = 0
+    cells = Counter()
+    compressed = scan.storage == STORAGE_COMPRESSED
+    size = _chunk_size() if compressed else _batch_size()
+    parse, save, index = StageTimer("parse"), StageTimer("save"), StageTimer("search_index")
+    indexer = SearchIndexer(scan)
+    for seq, batch in enumerate(batched(parse.wrap(findings), size)):
+        with parse.time():
+            docs = [make_finding(scan, raw) for raw in batch]
+        with save.time():
+            if compressed:
+                write_chunk(scan.id, seq, batch)
+                rows = []
+                for row, doc in enumerate(docs):
+                    doc.chunk, doc.row = seq, row
+                    mongo = doc.to_mongo()
+                    del mongo["data"]
+                    rows.append(mongo)
+                Finding._get_collection().insert_many(rows)
+                ids = [row["_id"] for row in rows]
+            else:
+                ids = Finding.objects.insert(docs, load_bulk=False)
+        with index.time():
+            indexer.add(ids, batch)
+        count += len(docs)
+        failed += sum(1 for doc in docs if doc.status == "FAIL")
+        cells.update(summary_key(doc) for doc in docs)
+    type(scan).objects(id=scan.id).update_one(
+        set__findingsCount=count, set__failedCount=failed, set__summary=summary_rows(cells)
+    )
+    parse.observe()
+    save.observe()
+    index.observe()
+    FINDINGS_PER_SCAN.observe(count, provider=scan.provider)
+    return count
+
+
+def iter_asff_merged(paths):
+    """Yield findings from several ASFF reports, skipping repeated ``Id``s.
+
+    Shards of one scan each run Prowler's global checks, so the same finding
+    can appear in several reports.
+    """
+    seen = set()
+    for path in paths:
+        for finding in iter_asff(path):
+            finding_id = finding.get("Id") if isinstance(finding, dict) else None
+            if finding_id:
+                if finding_id in seen:
+                    continue
+                seen.add(finding_id)
+            yield finding
+
+
+def new_aws_scan(first, region, date=None, shard_errors=None):
+    """Return an unsaved ``AWSScan`` described by its first finding."""
+    return AWSScan(
+        date=date or datetime.now(),
+        provider="AWS",
+        accountId=(first or {}).get("AwsAccountId", "unknown"),
+        region=region,
+        storage=default_storage(),
+        shardErrors=shard_errors or [],
+    )
+
+
+def new_gcp_scan(first, project_id=None, date=None):
+    """Return an unsaved ``GCPScan`` described by its first row.
+
+    Account, project and region are taken from the row, falling back to
+    ``project_id`` when the report has no ``PROJECT_ID`` column.
+    """
+    first = first or {}
+    return GCPScan(
+        date=date or datetime.now(),
+        provider="GCP",
+        accountId=first.get("ACCOUNT_UID", "unknown"),
+        projectId=first.get("PROJECT_ID", project_id or "unknown"),
+        region=first.get("REGION", "global"),
+        storage=default_storage(),
+    )
+
+
+def report_hash(path):
+    """Return the SHA-256 hex digest of a report file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def record_reports(paths, scan):
+    """Remember that the report files at ``paths`` are stored as ``scan``.
+
+    ``backfill_reports`` skips files whose content hash is recorded here.
+    """
+    for path in paths:
+        ImportedReport.objects(sha256=report_hash(path)).update_one(
+            upsert=True,
+            set__path=os.path.basename(path),
+            set__provider=scan.provider,
+            set__scan=scan.id,
+            set__importedAt=datetime.utcnow(),
+        )
+
+
+def ingest_aws(json_path, region, shard_errors=None):
+    """Store an ASFF report as an ``AWSScan`` and return ``(scan, count)``.
+
+    ``json_path`` may also be a list of shard reports, which are merged into
+    one scan; ``shard_errors`` records shards that failed. The scan document
+    is created from the first finding, then every finding is written to the
+    ``findings`` collection in batches of ``INGEST_BATCH_SIZE``.
+    """
+    if isinstance(json_path, (list, tuple)):
+        paths = list(json_path)
+        findings = iter_asff_merged(paths)
+    else:
+        paths = [json_path]
+        findings = iter_asff(json_path)
+    first = next(findings, None)
+    scan = new_aws_scan(first, region, shard_errors=shard_errors)
+    scan.save()
+    count = store_findings(scan, chain([first], findings) if first is not None else ())
+    record_reports(paths, scan)
+    return scan, count
+
+
+def ingest_gcp(csv_path, project_id=None, date=None):
+    """Store a GCP CSV report as a ``GCPScan`` and return ``(scan, count)``."""
+    findings = iter_gcp_csv(csv_path)
+    first = next(findings, None) or {}
+    scan = new_gcp_scan(first, project_id, date)
+    scan.save()
+    count = store_findings(scan, chain([first], findings) if first else ())
+    record_reports([csv_path], scan)
+    return scan, count
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cloudscan.backfill import backfill
+from cloudscan.prowler_runner import OUTPUT_DIR
+
+
+class Command(BaseCommand):
+    help = "Import Prowler reports from an output directory that are not in MongoDB yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", nargs="?", default=OUTPUT_DIR, help="Directory holding the reports.")
+        parser.add_argument("--workers", type=int, help="Import processes (default: CPU count; 1 imports inline).")
+        parser.add_argument("--after", type=int,
+                            help="Only reports whose file name timestamp (epoch ms) is later than this.")
+        parser.add_argument("--dry-run", action="store_true", help="List the reports that would be imported.")
+
+    def handle(self, *args, **options):
+        if options["workers"] is not None and options["workers"] < 1:
+            raise CommandError("--workers must be positive")
+        stats = backfill(
+            options["directory"],
+            workers=options["workers"],
+            after=options["after"],
+            dry_run=options["dry_run"],
+            log=self.stdout.write,
+        )
+        seconds = max(stats["seconds"], 1e-9)
+        if options["dry_run"]:
+            self.stdout.write(f"{stats.get('new', 0)} of {stats['files']} reports would be imported")
+            return
+        self.stdout.write(
+            f"{stats.get('imported', 0)} imported, {stats.get('skipped', 0)} already imported, "
+            f"{stats.get('failed', 0)} failed of {stats['files']} reports in {stats['seconds']:.1f}s"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats.get('imported', 0) / seconds:.1f} reports/s, {stats.get('findings', 0) / seconds:.0f} findings/s, "
+            f"{stats.get('bytes', 0) / seconds / (1024 * 1024):.1f} MB/s"
+        ))
+        if stats.get("failed"):
+            raise CommandError(f"{stats['failed']} report(s) failed to import")
@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cloudscan.benchmarks import STAGES, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Time ingestion, findings/history queries and exports on synthetic reports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000",
+                            help="Comma-separated finding counts, e.g. 1000,10000,100000,1000000.")
+        parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages to time.")
+        parser.add_argument("--mongomock", action="store_true", help="Run against an in-memory mongomock database.")
+        parser.add_argument("--mongo-uri", help="Run against this MongoDB instead of the configured one.")
+        parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc peak memory tracking.")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument("--compare", help="Baseline JSON report to compare against.")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Fail when a stage is slower than the baseline by more than this fraction.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+        stages = [stage.strip() for stage in options["stages"].split(",") if stage.strip()]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise CommandError(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+        database = self._connect(options)
+        report = run_benchmarks(sizes, memory=not options["no_memory"], stages=stages, database=database)
+
+        self.stdout.write(f"{'size':>9}  {'stage':<24}{'seconds':>10}{'peak MB':>10}")
+        for row in report["results"]:
+            peak = f"{row['peak_mb']:.1f}" if row["peak_mb"] is not None else "-"
+            self.stdout.write(f"{row['size']:>9}  {row['stage']:<24}{row['seconds']:>10.3f}{peak:>10}")
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+            if baseline.get("meta", {}).get("memory") != report["meta"]["memory"]:
+                self.stderr.write("Baseline was run with different memory tracking; timings are not comparable")
+            rows, regressions = compare(report, baseline, options["threshold"])
+            for row in rows:
+                self.stdout.write(
+                    f"{row['size']:>9}  {row['stage']:<24}{row['baseline']:>10.3f} -> {row['seconds']:.3f} "
+                    f"({row['change']:+.1%})"
+                )
+            if regressions:
+                stages = ", ".join(f"{row['stage']}@{row['size']}" for row in regressions)
+                raise CommandError(f"{len(regressions)} stage(s) regressed beyond {options['threshold']:.0%}: {stages}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def _connect(self, options):
+        if not options["mongomock"] and not options["mongo_uri"]:
+            return "configured"
+        from mongoengine import connect, disconnect
+
+        disconnect()
+        if options["mongomock"]:
+            import mongomock
+
+            connect("benchmark", host="mongodb://localhost", mongo_client_class=mongomock.MongoClient)
+            return "mongomock"
+        connect(host=options["mongo_uri"])
+        return "mongodb"
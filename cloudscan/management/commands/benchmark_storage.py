@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import time
+
+import bson
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from cloudscan.benchmarks import synthetic_asff
+from cloudscan.findings import iter_findings, page_findings
+from cloudscan.ingest import ingest_aws
+from cloudscan.models import AWSScan, Finding, FindingChunk, STORAGE_COLLECTION, STORAGE_COMPRESSED
+
+
+def _bson_bytes(collection, query):
+    return sum(len(bson.encode(doc)) for doc in collection.find(query))
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+class Command(BaseCommand):
+    help = "Compare size and read latency of collection and compressed findings storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--findings", type=int, default=10000, help="Synthetic findings per scan.")
+        parser.add_argument("--mongomock", action="store_true", help="Run against an in-memory mongomock database.")
+
+    def handle(self, *args, **options):
+        if options["mongomock"]:
+            import mongomock
+            from mongoengine import connect, disconnect
+
+            disconnect()
+            connect("benchmark", host="mongodb://localhost", mongo_client_class=mongomock.MongoClient)
+
+        with tempfile.NamedTemporaryFile("w", suffix=".asff.json", delete=False) as report:
+            json.dump(list(synthetic_asff(options["findings"])), report)
+        try:
+            results = [self._measure(storage, report.name) for storage in (STORAGE_COLLECTION, STORAGE_COMPRESSED)]
+        finally:
+            os.remove(report.name)
+
+        self.stdout.write(f"{'storage':<12}{'bytes':>14}{'ingest s':>11}{'read all s':>12}{'page s':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['storage']:<12}{row['bytes']:>14,}{row['ingest']:>11.3f}{row['read']:>12.3f}{row['page']:>9.4f}"
+            )
+        base, packed = results
+        self.stdout.write(self.style.SUCCESS(
+            f"compressed storage uses {packed['bytes'] / base['bytes']:.1%} of the bytes"
+        ))
+
+    def _measure(self, storage, path):
+        with override_settings(FINDINGS_STORAGE=storage):
+            ingest, (scan, _) = _timed(lambda: ingest_aws(path, "us-east-1"))
+        scan.reload()
+        try:
+            size = _bson_bytes(Finding._get_collection(), {"scan": scan.id})
+            size += _bson_bytes(FindingChunk._get_collection(), {"scan": scan.id})
+            read, _ = _timed(lambda: sum(1 for _ in iter_findings(scan)))
+            page, _ = _timed(lambda: page_findings(scan, {"status": ["FAIL"]}, limit=100, sort="severity"))
+            return {"storage": storage, "bytes": size, "ingest": ingest, "read": read, "page": page}
+        finally:
+            Finding.objects(scan=scan.id).delete()
+            FindingChunk.objects(scan=scan.id).delete()
+            AWSScan.objects(id=scan.id).delete()
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from cloudscan.findings import SCAN_MODELS, get_scan
+from cloudscan.models import SearchPosting, DOCUMENT_STORAGES
+from cloudscan.search import index_scan
+
+
+class Command(BaseCommand):
+    help = "Add scans ingested before the search index existed to it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--provider", choices=sorted(SCAN_MODELS), help="Only index scans of this provider.")
+        parser.add_argument("--rebuild", action="store_true", help="Also rebuild scans that are already indexed.")
+
+    def handle(self, *args, **options):
+        providers = [options["provider"]] if options["provider"] else sorted(SCAN_MODELS)
+        for provider in providers:
+            model = SCAN_MODELS[provider]
+            indexed = 0
+            # Embedded scans are indexed when ``split_findings`` moves them.
+            for scan_id in list(model.objects(storage__in=DOCUMENT_STORAGES).scalar("id")):
+                if not options["rebuild"] and SearchPosting.objects(scan=scan_id).only("id").first() is not None:
+                    continue
+                count = index_scan(get_scan(model, id=scan_id))
+                indexed += 1
+                self.stdout.write(f"{model._class_name} {scan_id}: {count} findings")
+            self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} {model._class_name} documents"))
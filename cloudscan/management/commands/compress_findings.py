@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from cloudscan.columnar import write_chunk
+from cloudscan.findings import SCAN_MODELS, get_scan
+from cloudscan.ingest import _chunk_size, batched
+from cloudscan.models import Finding, FindingChunk, STORAGE_COLLECTION, STORAGE_COMPRESSED
+
+
+class Command(BaseCommand):
+    help = "Move the raw findings of collection-stored scans into compressed chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--provider", choices=sorted(SCAN_MODELS), help="Only convert scans of this provider.")
+
+    def handle(self, *args, **options):
+        providers = [options["provider"]] if options["provider"] else sorted(SCAN_MODELS)
+        for provider in providers:
+            model = SCAN_MODELS[provider]
+            # Scans still being ingested have no ``findingsCount`` yet.
+            scan_ids = list(model.objects(storage=STORAGE_COLLECTION, findingsCount__ne=None).scalar("id"))
+            for scan_id in scan_ids:
+                count = compress_scan(model, scan_id)
+                self.stdout.write(f"{model._class_name} {scan_id}: {count} findings")
+            self.stdout.write(self.style.SUCCESS(f"Compressed {len(scan_ids)} {model._class_name} documents"))
+
+
+def point_to_chunk(collection, seq, batch):
+    """Set ``chunk`` and ``row`` on the findings stored in chunk ``seq``."""
+    collection.bulk_write([
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"chunk": seq, "row": row}})
+        for row, doc in enumerate(batch)
+    ], ordered=False)
+
+
+def compress_scan(model, scan_id):
+    """Write one scan's raw findings as chunks and drop them from its findings.
+
+    Findings already pointing at a chunk keep it, and only those still
+    without one are chunked. Their raw data is unset once every finding has
+    a chunk, so a run interrupted at any step can be resumed by re-running
+    the command.
+    """
+    scan = get_scan(model, id=scan_id)
+    collection = Finding._get_collection()
+    done = [seq for seq in collection.distinct("chunk", {"scan": scan.id}) if seq is not None]
+    # Chunks written before their findings were updated are rebuilt.
+    FindingChunk.objects(scan=scan.id, seq__nin=done).delete()
+    rows = collection.find({"scan": scan.id, "chunk": None}, {"data": 1}).sort("_id", 1)
+    for seq, batch in enumerate(batched(rows, _chunk_size()), start=max(done, default=-1) + 1):
+        write_chunk(scan.id, seq, [row.get("data", {}) for row in batch])
+        point_to_chunk(collection, seq, batch)
+    collection.update_many({"scan": scan.id, "data": {"$exists": True}}, {"$unset": {"data": ""}})
+    model.objects(id=scan.id).update_one(set__storage=STORAGE_COMPRESSED, inc__version=1)
+    return collection.count_documents({"scan": scan.id})
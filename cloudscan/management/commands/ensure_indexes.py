@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cloudscan.indexes import MODELS, audit, ensure_indexes, format_keys
+
+
+class Command(BaseCommand):
+    help = "Build declared MongoDB indexes in the background and report missing or unused ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Only report; fail if declared indexes are missing or a query shape is unserved.")
+
+    def handle(self, *args, **options):
+        if not options["check"]:
+            for model in MODELS:
+                for keys in ensure_indexes(model):
+                    self.stdout.write(f"{model.__name__}: built index ({format_keys(keys)})")
+
+        problems = 0
+        for report in audit():
+            self.stdout.write(f"{report['model']} ({report['collection']})")
+            for keys in report["missing"]:
+                problems += 1
+                self.stdout.write(self.style.WARNING(f"  missing: ({format_keys(keys)})"))
+            for keys in report["undeclared"]:
+                self.stdout.write(f"  not declared on the model: ({format_keys(keys)})")
+            for row in report["unused"]:
+                name = row["name"] or "not built"
+                self.stdout.write(f"  unused: ({format_keys(row['keys'])}) [{name}]: {'; '.join(row['reasons'])}")
+            for query in report["uncovered"]:
+                problems += 1
+                self.stdout.write(self.style.WARNING(f"  no index serves: {query}"))
+            if not any(report[key] for key in ("missing", "undeclared", "unused", "uncovered")):
+                self.stdout.write("  ok")
+
+        if options["check"] and problems:
+            raise CommandError(f"{problems} index problem(s) found")
+        self.stdout.write(self.style.SUCCESS("Indexes checked"))
@@ -0,0 +1,26 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from cloudscan import tasks  # noqa: F401  registers the task handlers
+from cloudscan.executor import ScanExecutor
+
+
+class Command(BaseCommand):
+    help = "Run queued scan jobs until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, help="Number of scans run at once (default: SCAN_WORKER_CONCURRENCY).")
+
+    def handle(self, *args, **options):
+        executor = ScanExecutor(concurrency=options["concurrency"])
+        stopped = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stopped.set())
+
+        executor.start()
+        self.stdout.write(f"Scan worker {executor.owner} running {executor.concurrency} jobs at a time")
+        stopped.wait()
+        self.stdout.write("Stopping scan worker")
+        executor.stop()
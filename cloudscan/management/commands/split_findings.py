@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from cloudscan.findings import SCAN_MODELS, get_scan, iter_findings
+from cloudscan.ingest import store_findings
+from cloudscan.models import Finding, SearchPosting, DOCUMENT_STORAGES, STORAGE_COLLECTION
+
+
+class Command(BaseCommand):
+    help = "Move findings embedded in scan documents into the findings collection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--provider", choices=sorted(SCAN_MODELS), help="Only migrate scans of this provider.")
+
+    def handle(self, *args, **options):
+        providers = [options["provider"]] if options["provider"] else sorted(SCAN_MODELS)
+        models = [SCAN_MODELS[p] for p in providers]
+
+        for model in models:
+            scan_ids = list(model.objects(storage__nin=DOCUMENT_STORAGES).scalar("id"))
+            for scan_id in scan_ids:
+                count = split_scan(model, scan_id)
+                self.stdout.write(f"{model._class_name} {scan_id}: {count} findings")
+            self.stdout.write(self.style.SUCCESS(f"Migrated {len(scan_ids)} {model._class_name} documents"))
+
+
+def split_scan(model, scan_id):
+    """Copy one scan's embedded findings into ``Finding`` documents.
+
+    Findings (and their search postings) already written for the scan by an
+    interrupted run are removed first, so the command can safely be re-run.
+    """
+    scan = get_scan(model, id=scan_id)
+    Finding.objects(scan=scan.id).delete()
+    SearchPosting.objects(scan=scan.id).delete()
+    count = store_findings(scan, iter_findings(scan))
+    model.objects(id=scan.id).update_one(
+        set__storage=STORAGE_COLLECTION, unset__findings=True, inc__version=1
+    )
+    return count
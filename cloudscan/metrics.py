@@ -0,0 +1,230 @@
+"""Process-local metrics in the Prometheus text exposition format.
+
+Histograms record how long the hot paths take: Prowler runs, report
+parsing, MongoDB writes and commands, response serialization and whole
+requests. ``MetricsView`` in ``health.py`` serves them at ``/metrics/``.
+Values live in this process only, so each worker is scraped separately
+(Prometheus adds an ``instance`` label per target).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from pymongo import monitoring
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+SCAN_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+COUNT_BUCKETS = (0, 10, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+QUEUE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+REGISTRY = []
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    """A labelled histogram with cumulative buckets, ``_sum`` and ``_count``."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        if registry is not None:
+            registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the ``with`` block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def collect(self):
+        """Return the exposition lines of this histogram."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {count}")
+        return lines
+
+
+def render(registry=REGISTRY):
+    """Return every metric of ``registry`` in the text exposition format."""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "cloudscan_stage_duration_seconds",
+    "Time spent per scan or request in each hot-path stage.",
+    ["stage"],
+)
+SCAN_SECONDS = Histogram(
+    "cloudscan_scan_duration_seconds",
+    "Wall time of queued scan jobs from claim to result.",
+    ["provider", "kind", "status"],
+    buckets=SCAN_BUCKETS,
+)
+FINDINGS_PER_SCAN = Histogram(
+    "cloudscan_findings_per_scan",
+    "Findings stored per ingested scan.",
+    ["provider"],
+    buckets=COUNT_BUCKETS,
+)
+QUEUE_DEPTH = Histogram(
+    "cloudscan_scan_queue_depth",
+    "Queued scan jobs, sampled whenever a job is enqueued.",
+    buckets=QUEUE_BUCKETS,
+)
+MONGO_SECONDS = Histogram(
+    "cloudscan_mongo_command_duration_seconds",
+    "Latency of MongoDB commands as reported by the driver.",
+    ["command", "outcome"],
+)
+REQUEST_SECONDS = Histogram(
+    "cloudscan_http_request_duration_seconds",
+    "Latency of HTTP requests until the response is returned by the view.",
+    ["method", "route", "status"],
+)
+
+
+class StageTimer:
+    """Accumulate time spent in one stage and observe it once.
+
+    Parsing and writing a report interleave batch by batch, so each is
+    summed over the whole ingest instead of being observed per batch.
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.seconds = 0.0
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def wrap(self, iterable):
+        """Yield from ``iterable``, counting the time spent producing items."""
+        iterator = iter(iterable)
+        while True:
+            with self.time():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def observe(self):
+        STAGE_SECONDS.observe(self.seconds, stage=self.stage)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Feed driver command timings into ``MONGO_SECONDS``."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
+
+
+_listener_registered = False
+
+
+def register_mongo_listener():
+    """Register ``MongoCommandListener`` for clients created from now on."""
+    global _listener_registered
+    if not _listener_registered:
+        monitoring.register(MongoCommandListener())
+        _listener_registered = True
+
+
+class RequestMetricsMiddleware:
+    """Observe request latency by method, URL route and status code.
+
+    The route pattern (e.g. ``api/prowler/AWSfinding/<str:scan_id>/``) is
+    used instead of the path so scan IDs do not create new series. The
+    middleware runs in the same mode as the stack, so async views under ASGI
+    are not pushed onto a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        return self._observe(request, self.get_response(request), start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        return self._observe(request, await self.get_response(request), start)
+
+    @staticmethod
+    def _observe(request, response, start):
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match else "unmatched"
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start, method=request.method, route=route, status=response.status_code
+        )
+        return response
@@ -5,15 +5,53 @@ from mongoengine import (
     DictField,
     ListField,
     IntField,
+    BooleanField,
+    ObjectIdField,
+    BinaryField,
 )
 from datetime import datetime
 
+# Where a scan keeps its findings: embedded in ``findings`` (legacy scans),
+# as documents in the ``findings`` collection, or as ``findings`` documents
+# without raw data plus compressed ``finding_chunks`` holding it.
+STORAGE_EMBEDDED = "embedded"
+STORAGE_COLLECTION = "collection"
+STORAGE_COMPRESSED = "compressed"
+# Storages whose findings are ``Finding`` documents.
+DOCUMENT_STORAGES = (STORAGE_COLLECTION, STORAGE_COMPRESSED)
+
+
 class AWSScan(Document):
     provider = StringField(default="AWS")
     date = DateTimeField()
     accountId = StringField()
     region = StringField()
     findings = ListField(DictField())
+    storage = StringField(default=STORAGE_EMBEDDED)
+    # Set at ingest so history listings need not count findings.
+    findingsCount = IntField()
+    failedCount = IntField()
+    # Finding counts per severity/status/service/region cell; ``None`` until
+    # computed for scans ingested before summaries existed.
+    summary = ListField(DictField(), default=None)
+    # Bumped whenever stored findings are rewritten; part of response ETags.
+    version = IntField(default=0)
+    # Shards of a sharded scan that failed; non-empty means a partial result.
+    shardErrors = ListField(DictField())
+    # Incremental rescans: the scan reused and the checks actually rerun.
+    baseScan = ObjectIdField()
+    rerunChecks = ListField(StringField())
+
+    # Query shapes are listed in ``cloudscan.indexes``.
+    meta = {
+        "indexes": [
+            ("-date", "-id"),
+            ("accountId", "-date", "-id"),
+            ("accountId", "region", "-date"),
+        ],
+        "index_background": True,
+    }
+
 
 class GCPScan(Document):
     provider = StringField(default="GCP")
@@ -22,10 +60,95 @@ class GCPScan(Document):
     projectId = StringField()
     region = StringField()
     findings = ListField(DictField())
+    storage = StringField(default=STORAGE_EMBEDDED)
+    # Set at ingest so history listings need not count findings.
+    findingsCount = IntField()
+    failedCount = IntField()
+    # Finding counts per severity/status/service/region cell; ``None`` until
+    # computed for scans ingested before summaries existed.
+    summary = ListField(DictField(), default=None)
+    # Bumped whenever stored findings are rewritten; part of response ETags.
+    version = IntField(default=0)
+    # Incremental rescans: the scan reused and the checks actually rerun.
+    baseScan = ObjectIdField()
+    rerunChecks = ListField(StringField())
+
+    # Query shapes are listed in ``cloudscan.indexes``.
+    meta = {
+        "indexes": [
+            ("-date", "-id"),
+            ("accountId", "-date", "-id"),
+            ("projectId", "-date", "-id"),
+        ],
+        "index_background": True,
+    }
+
+
+class Finding(Document):
+    """A single finding of an ``AWSScan`` or ``GCPScan``.
+
+    ``data`` holds the raw Prowler record; the remaining fields are extracted
+    from it at ingest so findings can be filtered through indexes.
+    ``observedAt`` is when Prowler produced the record; findings copied from
+    an earlier scan by an incremental rescan keep it and set
+    ``carriedForward``.
+    """
+
+    scan = ObjectIdField(required=True)
+    provider = StringField(required=True)
+    severity = StringField()
+    severityRank = IntField()
+    status = StringField()
+    service = StringField()
+    checkId = StringField()
+    region = StringField()
+    # Stable across scans: check, resource, region and account.
+    fingerprint = StringField()
+    observedAt = DateTimeField()
+    carriedForward = BooleanField(default=False)
+    data = DictField()
+    # Compressed storage: the raw record is row ``row`` of chunk ``chunk``.
+    chunk = IntField()
+    row = IntField()
+
+    meta = {
+        "collection": "findings",
+        "indexes": [
+            {"fields": ["scan", "id"]},
+            ("scan", "severity", "id"),
+            ("scan", "status", "id"),
+            ("scan", "service", "id"),
+            ("scan", "checkId", "id"),
+            ("scan", "region", "id"),
+            ("scan", "severityRank", "id"),
+            ("scan", "fingerprint", "id"),
+        ],
+    }
+
+
+class FindingChunk(Document):
+    """Raw findings of a compressed scan; see ``cloudscan.columnar``."""
+
+    scan = ObjectIdField(required=True)
+    seq = IntField(required=True)
+    count = IntField()
+    codec = StringField()
+    data = BinaryField()
+
+    meta = {
+        "collection": "finding_chunks",
+        "indexes": [{"fields": ["scan", "seq"], "unique": True}],
+    }
 
 
 class ScanJob(Document):
-    """Track progress and status for async scans."""
+    """Track progress and status for async scans.
+
+    Jobs with a ``kind`` double as the persistent work queue read by
+    ``cloudscan.executor``: a worker claims a ``queued`` job by taking a
+    lease, renews it with heartbeats and jobs whose lease expires are
+    requeued.
+    """
 
     scan_id = StringField(primary_key=True)
     provider = StringField(required=True)
@@ -35,11 +158,80 @@ class ScanJob(Document):
     result = DictField()
     created_at = DateTimeField(default=datetime.utcnow)
     updated_at = DateTimeField(default=datetime.utcnow)
+    checks_done = IntField()
+    checks_total = IntField()
+    current_service = StringField()
+    kind = StringField()  # Task handler name for queued scans
+    host = StringField()  # Host holding the job's key files; None runs anywhere
+    parent_id = StringField()  # Set on the per-project jobs of a fan-out scan
+    params = DictField()
+    attempts = IntField(default=0)
+    lease_owner = StringField()
+    lease_expires_at = DateTimeField()
+    heartbeat_at = DateTimeField()
 
     meta = {
         "collection": "scan_jobs",
+        "indexes": [
+            ("status", "created_at"),
+            ("status", "lease_expires_at"),
+            ("parent_id", "created_at", "scan_id"),
+        ],
+        "index_background": True,
     }
 
     def save(self, *args, **kwargs):
         self.updated_at = datetime.utcnow()
         return super().save(*args, **kwargs)
+
+
+class ImportedReport(Document):
+    """A Prowler report file already stored as a scan, keyed by content hash."""
+
+    sha256 = StringField(primary_key=True)
+    path = StringField()  # File name when imported
+    provider = StringField()
+    scan = ObjectIdField()
+    findingsCount = IntField()
+    importedAt = DateTimeField(default=datetime.utcnow)
+
+    meta = {"collection": "imported_reports"}
+
+
+class SearchPosting(Document):
+    """Findings of one scan that contain ``term``; see ``cloudscan.search``.
+
+    Each ingest batch writes its own postings, so a term has one document
+    per batch it occurs in. ``weights`` is parallel to ``findings``.
+    """
+
+    term = StringField(required=True)
+    scan = ObjectIdField(required=True)
+    provider = StringField()
+    accountId = StringField()
+    findings = ListField(ObjectIdField())
+    weights = ListField(IntField())
+
+    meta = {
+        "collection": "search_postings",
+        "indexes": [
+            ("scan", "term"),
+            ("accountId", "term"),
+            "term",
+        ],
+        "index_background": True,
+    }
+
+
+class ScanFlight(Document):
+    """The scan job answering requests with one set of scan parameters.
+
+    ``key`` hashes the normalized parameters; see ``cloudscan.coalesce``.
+    """
+
+    key = StringField(primary_key=True)
+    provider = StringField()
+    scan_id = StringField()  # ``ScanJob`` of the flight
+    created_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {"collection": "scan_flights"}
@@ -1,13 +1,117 @@
+import codecs
 import os
+import re
 import subprocess
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from uuid import uuid4
+
+from django.conf import settings
+
+from .metrics import STAGE_SECONDS
 
 OUTPUT_DIR = os.path.abspath("./output")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def run_prowler_aws(access_key, secret_key, region, checks=None):
-    timestamp = int(time.time() * 1000)
+# Prowler prints "Executing N checks" up front and then an alive-progress bar
+# such as "-> Scanning s3 service |████▌ | 120/300 [40%] in 5s".
+_ANSI_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+_TOTAL_RE = re.compile(r"Executing (\d+) checks")
+_SERVICE_RE = re.compile(r"Scanning (\S+) service")
+_COUNTER_RE = re.compile(r"(\d+)/(\d+)\s*\[\s*\d+%\]")
+
+# Lines of Prowler output kept for logging and error messages.
+OUTPUT_TAIL_LINES = 200
+
+
+class ProwlerProgress:
+    """Derive check progress from Prowler's console output.
+
+    ``callback(done, total, service)`` is called whenever the parsed state
+    changes; ``total`` is ``None`` until Prowler reports it.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.done = 0
+        self.total = None
+        self.service = None
+
+    def feed(self, line):
+        line = _ANSI_RE.sub("", line)
+        state = (self.done, self.total, self.service)
+        match = _TOTAL_RE.search(line)
+        if match:
+            self.total = int(match.group(1))
+        match = _SERVICE_RE.search(line)
+        if match:
+            self.service = match.group(1)
+        match = _COUNTER_RE.search(line)
+        if match:
+            self.done, self.total = int(match.group(1)), int(match.group(2))
+        if (self.done, self.total, self.service) != state:
+            self.callback(self.done, self.total, self.service)
+
+
+def _run(prowler_cmd, env, progress=None):
+    """Run Prowler, streaming its output, and return ``(returncode, tail)``.
+
+    Output is read as it is produced and split on both newlines and the
+    carriage returns progress bars use to redraw, so ``progress`` sees every
+    update. Only the last ``OUTPUT_TAIL_LINES`` lines are kept.
+    """
+    parser = ProwlerProgress(progress) if progress else None
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    proc = subprocess.Popen(prowler_cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    with proc:
+        fd = proc.stdout.fileno()
+        while True:
+            chunk = os.read(fd, 65536)
+            pending += decoder.decode(chunk, final=not chunk)
+            *lines, pending = re.split(r"[\r\n]", pending)
+            if not chunk:
+                lines.append(pending)
+            for line in lines:
+                if not line.strip():
+                    continue
+                tail.append(line)
+                if parser:
+                    parser.feed(line)
+            if not chunk:
+                break
+    return proc.returncode, "\n".join(tail)
+
+def split_check_ids(checks):
+    """Return check IDs from a comma/space-separated string or a list."""
+    if isinstance(checks, str):
+        checks = checks.replace(",", " ").split()
+    return list(checks or ())
+
+def check_args(checks):
+    """Return ``-c`` arguments for a comma/space-separated string or a list."""
+    checks = split_check_ids(checks)
+    return ["-c", *checks] if checks else []
+
+def service_checks(checks, services):
+    """Return the checks in ``checks`` that belong to one of ``services``.
+
+    Prowler check IDs start with their service, e.g. ``s3_bucket_public_access``.
+    """
+    return [
+        check for check in split_check_ids(checks)
+        if any(check == svc or check.startswith(f"{svc}_") for svc in services)
+    ]
+
+def run_prowler_aws(access_key, secret_key, region, checks=None, progress=None, services=None, shard=None,
+                    timestamp=None):
+    timestamp = timestamp or int(time.time() * 1000)
     output_filename = f"aws-scan-{timestamp}"
+    if shard:
+        output_filename += f"-{shard}"
     output_json = os.path.join(OUTPUT_DIR, f"{output_filename}.asff.json")
     env = os.environ.copy()
     env["AWS_ACCESS_KEY_ID"] = access_key
@@ -24,24 +128,104 @@ def run_prowler_aws(access_key, secret_key, region, checks=None):
     ]
     if region and region != "all" and region != "":
         prowler_cmd += ["--region", region]
-    if checks:
-        prowler_cmd += ["-c", checks]
+    if checks and services:
+        # Prowler rejects ``-c`` combined with ``--services``.
+        checks = service_checks(checks, services)
+        if not checks:
+            raise ValueError(f"None of the checks belong to {', '.join(services)}")
+        services = None
+    prowler_cmd += check_args(checks)
+    if services:
+        prowler_cmd += ["--services", *services]
 
     # You can print the command for debugging
     print("Running:", " ".join(prowler_cmd))
 
-    result = subprocess.run(prowler_cmd, env=env, capture_output=True, text=True)
-    print("STDOUT:", result.stdout)
-    print("STDERR:", result.stderr)
-    if result.returncode != 0:
-        raise Exception(f"Prowler failed with exit code {result.returncode}")
+    with STAGE_SECONDS.time(stage="prowler_aws"):
+        returncode, output = _run(prowler_cmd, env, progress)
+    print("OUTPUT:", output)
+    if returncode != 0:
+        raise Exception(f"Prowler failed with exit code {returncode}")
     if not os.path.exists(output_json):
         raise Exception("Prowler did not generate JSON output.")
     return output_json
 
-def run_prowler_gcp(gcp_key_file, project_id=None, checks=None, group=None):
+def aws_shards(region, services=None, checks=None):
+    """Split a scan into ``(region, service)`` shards.
+
+    ``region="all"`` expands to ``AWS_SCAN_REGIONS``; without ``services``
+    each shard covers every service of its region. With ``checks`` too,
+    services none of the checks belong to get no shard.
+    """
+    if region and region != "all":
+        regions = [r.strip() for r in region.split(",") if r.strip()]
+    else:
+        regions = list(settings.AWS_SCAN_REGIONS)
+    if services and checks:
+        services = [svc for svc in services if service_checks(checks, [svc])]
+        if not services:
+            raise ValueError("None of the checks belong to the requested services")
+    return [(r, svc) for r in regions for svc in (services or [None])]
+
+
+def run_prowler_aws_sharded(access_key, secret_key, region, checks=None, progress=None, services=None, parallelism=None):
+    """Run one Prowler process per shard, at most ``parallelism`` at a time.
+
+    Returns ``(output_paths, errors)``; ``errors`` lists the shards that
+    failed so callers can keep a partial result. Raises if every shard fails.
+    Progress is reported as the sum over all shards.
+    """
+    shards = aws_shards(region, services, checks)
+    parallelism = parallelism or settings.AWS_SHARD_PARALLELISM
+    # Shard reports share the run's timestamp, so backfills can merge them.
+    timestamp = int(time.time() * 1000)
+    lock = Lock()
+    state = {}
+
+    def shard_progress(key):
+        def report(done, total, service):
+            if not progress:
+                return
+            with lock:
+                state[key] = (done, total or 0)
+                progress(
+                    sum(d for d, _ in state.values()),
+                    sum(t for _, t in state.values()) or None,
+                    service,
+                )
+        return report
+
+    def run_shard(index, shard_region, service):
+        key = f"{index}-{shard_region}" + (f"-{service}" if service else "")
+        return run_prowler_aws(
+            access_key,
+            secret_key,
+            shard_region,
+            checks=checks,
+            progress=shard_progress(key),
+            services=[service] if service else None,
+            shard=key,
+            timestamp=timestamp,
+        )
+
+    paths, errors = [], []
+    # Each shard is its own Prowler process; the threads only wait on them.
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        futures = [(r, svc, pool.submit(run_shard, i, r, svc)) for i, (r, svc) in enumerate(shards)]
+        for shard_region, service, future in futures:
+            try:
+                paths.append(future.result())
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append({"region": shard_region, "service": service, "error": str(exc)})
+    if not paths:
+        raise Exception(f"All {len(shards)} Prowler shards failed: {errors[0]['error']}")
+    return paths, errors
+
+
+def run_prowler_gcp(gcp_key_file, project_id=None, checks=None, group=None, progress=None):
     timestamp = int(time.time() * 1000)
-    output_filename = f"gcp-scan-{timestamp}"
+    # Fan-out children and executor workers can start in the same millisecond.
+    output_filename = f"gcp-scan-{timestamp}-{uuid4().hex}"
     output_csv = os.path.join(OUTPUT_DIR, f"{output_filename}.csv")
     env = os.environ.copy()
     env["GOOGLE_APPLICATION_CREDENTIALS"] = gcp_key_file
@@ -53,8 +237,7 @@ def run_prowler_gcp(gcp_key_file, project_id=None, checks=None, group=None):
         "--output-directory", OUTPUT_DIR,
         "--ignore-exit-code-3"
     ]
-    if checks:
-        prowler_cmd += ["-c", checks]
+    prowler_cmd += check_args(checks)
     if group:
         prowler_cmd += ["-g", group]
     if project_id:
@@ -62,11 +245,11 @@ def run_prowler_gcp(gcp_key_file, project_id=None, checks=None, group=None):
 
     print("Running:", " ".join(prowler_cmd))
 
-    result = subprocess.run(prowler_cmd, env=env, capture_output=True, text=True)
-    print("STDOUT:", result.stdout)
-    print("STDERR:", result.stderr)
-    if result.returncode != 0:
-        raise Exception(f"Prowler GCP failed with exit code {result.returncode}")
+    with STAGE_SECONDS.time(stage="prowler_gcp"):
+        returncode, output = _run(prowler_cmd, env, progress)
+    print("OUTPUT:", output)
+    if returncode != 0:
+        raise Exception(f"Prowler GCP failed with exit code {returncode}")
     if not os.path.exists(output_csv):
         raise Exception("Prowler did not generate CSV output.")
     return output_csv
@@ -0,0 +1,293 @@
+"""Full-text search over findings through an inverted index.
+
+At ingest every finding's resource IDs, titles, check IDs, descriptions and
+remediation text are split into lowercase terms. Each batch then writes one
+``SearchPosting`` per distinct term, listing the findings containing it and
+how much each match weighs: matches in a resource ID weigh most, then
+titles and check IDs, then free text.
+
+A query is a list of words, all of which must match; a word ending in
+``*`` matches every term starting with it. Queries can be scoped to one
+scan, one account or every scan, optionally of one provider. Hits are
+ranked by the summed weight of their matches (prefix matches count in
+proportion to how much of the term they cover), newest findings first
+among equals, and paginated with a ``(score, id)`` cursor. Only the
+postings and a few fields of the findings on the requested page are read.
+
+Terms are matched rarest first and later terms only score the findings the
+earlier ones matched, so memory is bounded by the rarest term. A query whose
+rarest term matches more than ``FINDINGS_SEARCH_MAX_CANDIDATES`` findings is
+rejected rather than ranked, and prefixes must be at least as long as the
+shortest indexed term.
+"""
+
+import re
+from itertools import islice
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+
+from .columnar import attach_data
+from .findings import _aws_check_id, decode_cursor, encode_cursor
+from .models import Finding, SearchPosting
+
+# Weight of a match per field.
+RESOURCE, TITLE, TEXT = 3, 2, 1
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have if in is it its not of on or that the this to was were "
+    "will with".split()
+)
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+DEFAULT_PAGE_SIZE = 50
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+# Raw keys read for a hit, per provider.
+HIT_KEYS = {
+    "AWS": ("Title", "Resources"),
+    "GCP": ("CHECK_TITLE", "RESOURCE_UID", "RESOURCE_NAME"),
+}
+HIT_FIELDS = ("scan", "provider", "severity", "status", "service", "checkId", "region", "chunk", "row")
+
+
+def enabled():
+    return getattr(settings, "FINDINGS_SEARCH_INDEX", True)
+
+
+def max_candidates():
+    return getattr(settings, "FINDINGS_SEARCH_MAX_CANDIDATES", 100_000)
+
+
+def tokens(text):
+    """Yield the index terms of ``text``."""
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) >= MIN_TERM_LENGTH and token not in STOP_WORDS:
+            yield token[:MAX_TERM_LENGTH]
+
+
+def _aws_fields(raw):
+    for resource in raw.get("Resources") or ():
+        if isinstance(resource, dict):
+            yield RESOURCE, resource.get("Id")
+    yield TITLE, raw.get("Title")
+    yield TITLE, _aws_check_id(raw)
+    yield TEXT, raw.get("Description")
+    remediation = raw.get("Remediation")
+    if isinstance(remediation, dict):
+        yield TEXT, (remediation.get("Recommendation") or {}).get("Text")
+
+
+def _gcp_fields(raw):
+    yield RESOURCE, raw.get("RESOURCE_UID")
+    yield RESOURCE, raw.get("RESOURCE_NAME")
+    yield TITLE, raw.get("CHECK_TITLE")
+    yield TITLE, raw.get("CHECK_ID")
+    yield TEXT, raw.get("DESCRIPTION")
+    yield TEXT, raw.get("REMEDIATION_RECOMMENDATION_TEXT")
+    yield TEXT, raw.get("STATUS_EXTENDED")
+
+
+def finding_terms(provider, raw):
+    """Return ``{term: weight}`` for a raw finding, keeping each term's best field."""
+    terms = {}
+    if not isinstance(raw, dict):
+        return terms
+    for weight, text in (_aws_fields(raw) if provider == "AWS" else _gcp_fields(raw)):
+        if isinstance(text, str):
+            for term in tokens(text):
+                if terms.get(term, 0) < weight:
+                    terms[term] = weight
+    return terms
+
+
+class SearchIndexer:
+    """Write the postings of one scan's findings, one set per batch."""
+
+    def __init__(self, scan):
+        self.scan = scan
+        self.enabled = enabled()
+
+    def add(self, finding_ids, findings):
+        """Index ``findings``, already stored with IDs ``finding_ids``."""
+        if not self.enabled:
+            return
+        postings = {}
+        for finding_id, raw in zip(finding_ids, findings):
+            for term, weight in finding_terms(self.scan.provider, raw).items():
+                posting = postings.get(term)
+                if posting is None:
+                    posting = postings[term] = ([], [])
+                posting[0].append(finding_id)
+                posting[1].append(weight)
+        if postings:
+            SearchPosting._get_collection().insert_many([
+                {
+                    "term": term,
+                    "scan": self.scan.id,
+                    "provider": self.scan.provider,
+                    "accountId": self.scan.accountId,
+                    "findings": ids,
+                    "weights": weights,
+                }
+                for term, (ids, weights) in postings.items()
+            ], ordered=False)
+
+
+def index_scan(scan, batch_size=1000):
+    """(Re)build the postings of a scan stored as ``Finding`` documents.
+
+    Returns the number of findings indexed.
+    """
+    SearchPosting.objects(scan=scan.id).delete()
+    indexer = SearchIndexer(scan)
+    rows = Finding._get_collection().find(
+        {"scan": scan.id}, {"data": 1, "scan": 1, "chunk": 1, "row": 1}
+    ).sort("_id", 1)
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        attach_data(batch)
+        indexer.add([row["_id"] for row in batch], [row.get("data", {}) for row in batch])
+        count += len(batch)
+
+
+def parse_query(query):
+    """Return ``[(term, prefix)]`` for a query string.
+
+    Raises ``ValueError`` if nothing in it can be searched for or a prefix
+    is shorter than ``MIN_TERM_LENGTH``.
+    """
+    terms = []
+    for word in (query or "").split():
+        prefix = word.endswith("*")
+        parts = list(tokens(word))
+        if not parts and prefix:
+            # Stop-word prefixes are still valid prefixes.
+            parts = [token.lower() for token in _TOKEN.findall(word)][-1:]
+        if prefix and parts and len(parts[-1]) < MIN_TERM_LENGTH:
+            raise ValueError(f"Prefixes must be at least {MIN_TERM_LENGTH} characters long")
+        for i, part in enumerate(parts):
+            terms.append((part, prefix and i == len(parts) - 1))
+    if not terms:
+        raise ValueError("q must contain at least one searchable word")
+    return list(dict.fromkeys(terms))
+
+
+def _term_match(scope, term, prefix):
+    if prefix:
+        return dict(scope, term={"$gte": term, "$lt": term + "\uffff"})
+    return dict(scope, term=term)
+
+
+def _match_count(scope, term, prefix):
+    """Return how many findings within ``scope`` one query term matches."""
+    rows = SearchPosting._get_collection().aggregate([
+        {"$match": _term_match(scope, term, prefix)},
+        {"$group": {"_id": None, "count": {"$sum": {"$size": "$findings"}}}},
+    ])
+    return next(iter(rows), {}).get("count", 0)
+
+
+def _term_scores(scope, term, prefix, candidates=None):
+    """Return ``{finding_id: score}`` for one query term within ``scope``.
+
+    Only findings in ``candidates`` are scored when it is given.
+    """
+    scores = {}
+    postings = SearchPosting._get_collection().find(
+        _term_match(scope, term, prefix), {"term": 1, "findings": 1, "weights": 1}
+    )
+    for posting in postings:
+        coverage = len(term) / len(posting["term"])
+        for finding_id, weight in zip(posting["findings"], posting["weights"]):
+            if candidates is not None and finding_id not in candidates:
+                continue
+            score = weight * coverage
+            if scores.get(finding_id, 0) < score:
+                scores[finding_id] = score
+    return scores
+
+
+def _hits(finding_ids, scores):
+    keys = sorted({key for keys in HIT_KEYS.values() for key in keys})
+    projection = dict.fromkeys(HIT_FIELDS, 1)
+    projection.update({f"data.{key}": 1 for key in keys})
+    rows = list(Finding._get_collection().find({"_id": {"$in": finding_ids}}, projection))
+    rows = {row["_id"]: row for row in attach_data(rows, keys)}
+    hits = []
+    # Findings deleted since they were indexed are skipped.
+    for finding_id in finding_ids:
+        row = rows.get(finding_id)
+        if row is None:
+            continue
+        data = row.get("data") or {}
+        if row.get("provider") == "AWS":
+            title = data.get("Title")
+            resources = data.get("Resources") or [{}]
+            resource = resources[0].get("Id") if isinstance(resources[0], dict) else None
+        else:
+            title = data.get("CHECK_TITLE")
+            resource = data.get("RESOURCE_UID") or data.get("RESOURCE_NAME")
+        hits.append({
+            "scanId": str(row["scan"]),
+            "findingId": str(finding_id),
+            "provider": row.get("provider"),
+            "score": scores[finding_id],
+            **{field: row.get(field) for field in ("severity", "status", "service", "checkId", "region")},
+            "title": title,
+            "resource": resource,
+        })
+    return hits
+
+
+def search(query, scan_id=None, account_id=None, provider=None, limit=DEFAULT_PAGE_SIZE, after=None):
+    """Return ``(hits, next_cursor)`` for one page of search results.
+
+    Raises ``ValueError`` for an empty query, a too short prefix, a query
+    matching too many findings or a malformed cursor.
+    """
+    terms = parse_query(query)
+    scope = {}
+    if scan_id is not None:
+        scope["scan"] = scan_id
+    if account_id:
+        scope["accountId"] = account_id
+    if provider:
+        scope["provider"] = provider
+
+    counts = {(term, prefix): _match_count(scope, term, prefix) for term, prefix in terms}
+    terms.sort(key=counts.get)
+    if counts[terms[0]] > max_candidates():
+        raise ValueError(
+            f"q matches more than {max_candidates()} findings; add words or narrow it with scanId, "
+            "accountId or provider"
+        )
+    scores = None
+    for term, prefix in terms:
+        term_scores = _term_scores(scope, term, prefix, candidates=scores)
+        if scores is None:
+            scores = term_scores
+        else:
+            scores = {fid: score + term_scores[fid] for fid, score in scores.items() if fid in term_scores}
+        if not scores:
+            return [], None
+
+    ranked = sorted(((round(score, 4), fid) for fid, score in scores.items()), reverse=True)
+    if after:
+        cursor = decode_cursor(after)
+        try:
+            last = (float(cursor["score"]), ObjectId(cursor["id"]))
+        except (KeyError, InvalidId, TypeError, ValueError) as exc:
+            raise ValueError("Invalid cursor") from exc
+        ranked = [item for item in ranked if item < last]
+    page = ranked[:limit]
+    next_cursor = None
+    if len(ranked) > limit:
+        score, finding_id = page[-1]
+        next_cursor = encode_cursor({"score": score, "id": str(finding_id)})
+    return _hits([fid for _, fid in page], {fid: score for score, fid in page}), next_cursor
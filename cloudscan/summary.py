@@ -0,0 +1,102 @@
+"""Per-scan rollups of finding counts.
+
+Ingestion tallies every finding by ``(severity, status, service, region)``
+and stores the non-empty cells on the scan as ``summary``, so the dashboard
+reads one field instead of the findings. Scans ingested before that are
+rolled up with an aggregation the first time they are asked for, and the
+result is stored on the scan.
+"""
+
+from collections import Counter
+
+from .findings import finding_fields, iter_findings
+from .models import Finding, DOCUMENT_STORAGES
+
+DIMENSIONS = ("severity", "status", "service", "region")
+
+
+def summary_key(finding):
+    """Return the summary cell of a ``Finding`` or a dict of its fields."""
+    if isinstance(finding, dict):
+        return tuple(finding.get(dim) for dim in DIMENSIONS)
+    return tuple(getattr(finding, dim) for dim in DIMENSIONS)
+
+
+def summary_rows(counter):
+    """Turn a ``Counter`` of summary cells into stored rows."""
+    return [
+        dict(zip(DIMENSIONS, key), count=count)
+        for key, count in sorted(counter.items(), key=lambda item: tuple(str(v) for v in item[0]))
+    ]
+
+
+def merge_summary(rows, counter):
+    """Return ``rows`` with the cells of ``counter`` added."""
+    total = Counter({summary_key(row): row["count"] for row in rows or ()})
+    total.update(counter)
+    return summary_rows(total)
+
+
+def aggregate_summary(scan):
+    """Compute summary rows from ``scan``'s findings."""
+    if scan.storage in DOCUMENT_STORAGES:
+        rows = Finding._get_collection().aggregate([
+            {"$match": {"scan": scan.id}},
+            {"$group": {"_id": {dim: f"${dim}" for dim in DIMENSIONS}, "count": {"$sum": 1}}},
+        ])
+        return summary_rows(Counter({summary_key(row["_id"]): row["count"] for row in rows}))
+    return summary_rows(Counter(
+        summary_key(finding_fields(scan.provider, raw)) for raw in iter_findings(scan)
+    ))
+
+
+def scan_summary(scan):
+    """Return the rollups served by the summary endpoints.
+
+    ``rows`` is the full severity × status × service × region breakdown;
+    the ``by*`` maps total it along each dimension.
+    """
+    rows = scan.summary
+    if rows is None:
+        rows = aggregate_summary(scan)
+        type(scan).objects(id=scan.id).update_one(set__summary=rows)
+    result = {"total": sum(row["count"] for row in rows)}
+    for dim in DIMENSIONS:
+        totals = Counter()
+        for row in rows:
+            totals[row[dim] or "unknown"] += row["count"]
+        result["by" + dim.capitalize()] = dict(totals)
+    result["rows"] = rows
+    return result
+
+
+def group_counts(scan, by, filters=None):
+    """Count ``scan``'s findings matching ``filters`` per combination of ``by``.
+
+    Returns a ``Counter`` keyed by tuples of ``by`` values; see
+    ``ScanColumns.group_counts`` for the in-memory equivalent.
+    """
+    filters = filters or {}
+    if scan.storage in DOCUMENT_STORAGES:
+        match = {"scan": scan.id}
+        for field, values in filters.items():
+            match[field] = {"$in": values}
+        rows = Finding._get_collection().aggregate([
+            {"$match": match},
+            {"$group": {"_id": {field: f"${field}" for field in by}, "count": {"$sum": 1}}},
+        ])
+        return Counter({tuple(row["_id"].get(field) for field in by): row["count"] for row in rows})
+    counts = Counter()
+    for raw in iter_findings(scan):
+        fields = finding_fields(scan.provider, raw)
+        if all(fields.get(field) in values for field, values in filters.items()):
+            counts[tuple(fields.get(field) for field in by)] += 1
+    return counts
+
+
+def group_rows(by, counts):
+    """Turn ``group_counts`` output into rows, largest groups first."""
+    return [
+        dict(zip(by, key), count=count)
+        for key, count in sorted(counts.items(), key=lambda item: (-item[1], tuple(str(v) for v in item[0])))
+    ]
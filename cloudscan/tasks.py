@@ -0,0 +1,115 @@
+"""Scan task handlers run by ``cloudscan.executor``.
+
+Importing this module registers the handlers; ``CloudscanConfig.ready``
+does so at startup.
+"""
+
+import json
+import os
+
+from .executor import JobProgress, register
+from .incremental import rescan
+from .ingest import ingest_aws, ingest_gcp
+from .models import AWSScan, GCPScan
+from .prowler_runner import run_prowler_aws, run_prowler_aws_sharded, run_prowler_gcp
+
+
+def _cleanup(path):
+    """Remove a temporary file if it exists."""
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+@register("gcp_scan")
+def gcp_scan(job):
+    """Run Prowler for one GCP project and ingest the report.
+
+    ``params``: ``key_path`` (service account key), optional ``checks`` and
+    ``group``, ``incremental`` options for ``cloudscan.incremental.rescan``
+    and ``remove_key`` to delete the key file afterwards.
+    """
+    params = job.params
+    key_path = params["key_path"]
+
+    def run(checks):
+        progress = JobProgress(job)
+        csv_path = run_prowler_gcp(
+            key_path,
+            project_id=job.projectId,
+            checks=checks,
+            group=params.get("group"),
+            progress=progress,
+        )
+        progress.flush()
+        job.update(progress=90)
+        return ingest_gcp(csv_path, job.projectId)
+
+    try:
+        job.update(progress=10)
+        info = None
+        if params.get("incremental"):
+            scan, count, info = rescan(
+                GCPScan, run, params.get("checks"), **params["incremental"], projectId=job.projectId
+            )
+        else:
+            scan, count = run(params.get("checks"))
+        return {"scanId": str(scan.id), "findingsCount": count, "incremental": info}
+    finally:
+        if params.get("remove_key"):
+            _cleanup(key_path)
+
+
+@register("aws_scan")
+def aws_scan(job):
+    """Run Prowler for an AWS account and ingest the report.
+
+    ``params``: ``region``, optional ``checks``, ``sharding`` options for
+    ``run_prowler_aws_sharded``, ``incremental`` options for
+    ``cloudscan.incremental.rescan`` and ``credentials_path``, a
+    JSON file with ``accessKey``/``secretKey`` deleted once the scan ends.
+    Without it the ``AWS_ACCESS_KEY_ID``/``AWS_SECRET_ACCESS_KEY`` environment
+    variables are used.
+    """
+    params = job.params
+    credentials_path = params.get("credentials_path")
+    region = params.get("region") or "all"
+    try:
+        if credentials_path:
+            with open(credentials_path) as f:
+                credentials = json.load(f)
+            access_key, secret_key = credentials["accessKey"], credentials["secretKey"]
+        else:
+            access_key = os.getenv("AWS_ACCESS_KEY_ID")
+            secret_key = os.getenv("AWS_SECRET_ACCESS_KEY")
+        job.update(progress=10)
+        progress = JobProgress(job)
+        checks = params.get("checks")
+        info = None
+        if params.get("incremental"):
+            def run(run_checks):
+                json_path = run_prowler_aws(access_key, secret_key, region, checks=run_checks, progress=progress)
+                progress.flush()
+                job.update(progress=90)
+                return ingest_aws(json_path, region)
+
+            scan, count, info = rescan(AWSScan, run, checks, **params["incremental"], region=region)
+        elif params.get("sharding"):
+            json_paths, errors = run_prowler_aws_sharded(
+                access_key, secret_key, region, checks=checks, progress=progress, **params["sharding"]
+            )
+            progress.flush()
+            job.update(progress=90)
+            scan, count = ingest_aws(json_paths, region, shard_errors=errors)
+        else:
+            json_path = run_prowler_aws(access_key, secret_key, region, checks=checks, progress=progress)
+            progress.flush()
+            job.update(progress=90)
+            scan, count = ingest_aws(json_path, region)
+        return {
+            "scanId": str(scan.id),
+            "findingsCount": count,
+            "failedShards": scan.shardErrors,
+            "incremental": info,
+        }
+    finally:
+        _cleanup(credentials_path)
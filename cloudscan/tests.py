@@ -1,26 +1,31 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 from mongoengine import connect, disconnect
 
-from .models import AWSScan, GCPScan
+from .models import AWSScan, GCPScan, Finding, FindingChunk, ImportedReport, ScanFlight, ScanJob, SearchPosting
 
+import io
 import os
 import json
 import csv
 import tempfile
 
 
-class ScanViewTests(TestCase):
-    """Integration tests for the scan views using MongoDB."""
+class MongoTestCase(TestCase):
+    """Test case backed by an in-memory mongomock database.
+
+    ``setUp`` drops the collections of the ``documents`` listed.
+    """
+
+    db_name = "testdb"
+    documents = ()
 
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        # Use an in-memory MongoDB via mongomock
         import mongomock
-        connect("testdb", host="mongodb://localhost", mongo_client_class=mongomock.MongoClient)
-        os.environ.setdefault("DJANGO_SECRET_KEY", "testing-secret")
+        connect(cls.db_name, host="mongodb://localhost", mongo_client_class=mongomock.MongoClient)
 
     @classmethod
     def tearDownClass(cls):
@@ -28,8 +33,22 @@ class ScanViewTests(TestCase):
         super().tearDownClass()
 
     def setUp(self):
-        AWSScan.drop_collection()
-        GCPScan.drop_collection()
+        for document in self.documents:
+            document.drop_collection()
+
+
+class ScanViewTests(MongoTestCase):
+    """Integration tests for the scan views using MongoDB."""
+
+    documents = (AWSScan, GCPScan)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.environ.setdefault("DJANGO_SECRET_KEY", "testing-secret")
+
+    def setUp(self):
+        super().setUp()
         self.client = Client()
 
     def test_scan_aws_creates_entry(self):
@@ -256,3 +275,2115 @@ class ScanViewTests(TestCase):
         self.assertEqual(resp.status_code, 200)
         # path from TEMP_KEYS should be used and removed after
         self.assertFalse(os.path.exists(captured["path"]))
+
+
+class IngestTests(MongoTestCase):
+    """Tests for the streaming report ingestion helpers."""
+
+    documents = (AWSScan, GCPScan, Finding)
+
+    def _write_asff(self, findings):
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".asff.json", delete=False) as tmp:
+            json.dump(findings, tmp, indent=2)
+        self.addCleanup(os.remove, tmp.name)
+        return tmp.name
+
+    def test_iter_json_array_across_chunk_boundaries(self):
+        """Elements split across reads should decode intact."""
+        from .ingest import iter_json_array
+
+        items = [{"Id": str(i), "Title": "x" * i, "Score": i * 1.5} for i in range(50)] + [12345]
+        text = json.dumps(items, indent=1)
+        for chunk_size in (1, 7, 64, len(text)):
+            self.assertEqual(list(iter_json_array(io.StringIO(text), chunk_size)), items)
+
+    def test_iter_json_array_empty_and_invalid(self):
+        from .ingest import iter_json_array
+
+        self.assertEqual(list(iter_json_array(io.StringIO(""))), [])
+        self.assertEqual(list(iter_json_array(io.StringIO(" [ ] "))), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('{"a": 1}')))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('[{"a": 1}')))
+
+    def test_ingest_aws_writes_in_batches(self):
+        from .ingest import ingest_aws
+
+        findings = [{"AwsAccountId": "111122223333", "Id": str(i)} for i in range(7)]
+        path = self._write_asff(findings)
+        with self.settings(INGEST_BATCH_SIZE=3):
+            scan, count = ingest_aws(path, "us-east-1")
+
+        self.assertEqual(count, 7)
+        from .findings import load_findings
+
+        stored = AWSScan.objects.get(id=scan.id)
+        self.assertEqual(stored.accountId, "111122223333")
+        self.assertEqual(stored.region, "us-east-1")
+        self.assertEqual(stored.findings, [])
+        self.assertEqual([f["Id"] for f in load_findings(stored)], [str(i) for i in range(7)])
+
+    def test_finding_fields_are_extracted(self):
+        from .ingest import ingest_aws
+
+        path = self._write_asff([{
+            "AwsAccountId": "1",
+            "GeneratorId": "prowler-s3_bucket_public_access",
+            "Severity": {"Label": "HIGH"},
+            "Compliance": {"Status": "FAILED"},
+            "Resources": [{"Region": "eu-west-1"}],
+        }])
+        scan, _ = ingest_aws(path, "all")
+        finding = Finding.objects.get(scan=scan.id)
+        self.assertEqual(
+            (finding.severity, finding.status, finding.service, finding.checkId, finding.region),
+            ("high", "FAIL", "s3", "s3_bucket_public_access", "eu-west-1"),
+        )
+
+    def test_split_findings_command_moves_embedded_findings(self):
+        from django.core.management import call_command
+        from .findings import get_scan, load_findings
+
+        legacy = GCPScan(projectId="p", findings=[{"CHECK_ID": "a"}, {"CHECK_ID": "b"}]).save()
+        call_command("split_findings", stdout=io.StringIO())
+        call_command("split_findings", stdout=io.StringIO())
+
+        scan = get_scan(GCPScan, id=legacy.id)
+        self.assertEqual(scan.storage, "collection")
+        self.assertEqual(Finding.objects(scan=legacy.id).count(), 2)
+        self.assertEqual([f["CHECK_ID"] for f in load_findings(scan)], ["a", "b"])
+        self.assertNotIn("findings", GCPScan.objects(id=legacy.id).as_pymongo().first())
+
+    def test_finding_endpoint_serves_both_storages(self):
+        from .ingest import ingest_aws
+
+        legacy = AWSScan(findings=[{"Id": "old"}]).save()
+        scan, _ = ingest_aws(self._write_asff([{"Id": "new"}]), "all")
+        client = Client()
+        for scan_id, expected in ((legacy.id, "old"), (scan.id, "new")):
+            resp = client.get(f"/api/prowler/AWSfinding/{scan_id}/")
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual([f["Id"] for f in resp.json()["findings"]], [expected])
+        self.assertEqual(client.get("/api/prowler/AWSfinding/not-an-id/").status_code, 404)
+
+    def test_iter_gcp_csv_shares_and_types_columns(self):
+        from .ingest import ingest_gcp, iter_gcp_csv
+
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False, newline="") as tmp:
+            tmp.write("PROVIDER;CHECK_ID;RESOURCE_UID;MUTED;STATUS\n")
+            tmp.write("gcp;iam_check;r1;False;FAIL\n")
+            tmp.write("\n")
+            tmp.write("gcp;iam_check;r2;True;PASS;extra\n")
+            tmp.write("gcp;iam_check;r3\n")
+        self.addCleanup(os.remove, tmp.name)
+
+        rows = list(iter_gcp_csv(tmp.name))
+        self.assertEqual([row["RESOURCE_UID"] for row in rows], ["r1", "r2", "r3"])
+        self.assertEqual([row["MUTED"] for row in rows], [False, True, None])
+        self.assertEqual(rows[2]["STATUS"], None)
+        self.assertEqual(sorted(rows[1]), ["CHECK_ID", "MUTED", "PROVIDER", "RESOURCE_UID", "STATUS"])
+        self.assertIs(rows[0]["CHECK_ID"], rows[1]["CHECK_ID"])
+        self.assertIs(rows[0]["PROVIDER"], rows[2]["PROVIDER"])
+
+        scan, count = ingest_gcp(tmp.name, "p")
+        self.assertEqual(count, 3)
+        from .findings import load_findings
+
+        self.assertEqual([f["MUTED"] for f in load_findings(GCPScan.objects.get(id=scan.id))], [False, True, None])
+
+    def test_ingest_aws_empty_report(self):
+        from .ingest import ingest_aws
+
+        scan, count = ingest_aws(self._write_asff([]), "all")
+        self.assertEqual(count, 0)
+        self.assertEqual(AWSScan.objects.get(id=scan.id).accountId, "unknown")
+
+
+class FindingsPaginationTests(MongoTestCase):
+    """Tests for cursor pagination and filters on the findings endpoints."""
+
+    SEVERITIES = ["low", "critical", "high", "medium"]
+
+    documents = (GCPScan, Finding)
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.rows = [
+            {
+                "CHECK_ID": f"check{i}",
+                "SEVERITY": self.SEVERITIES[i % 4],
+                "STATUS": "FAIL" if i % 2 else "PASS",
+                "SERVICE_NAME": "iam" if i < 6 else "compute",
+                "REGION": "global",
+            }
+            for i in range(10)
+        ]
+
+    def _ingested_scan(self):
+        from .ingest import ingest_gcp
+
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False, newline="") as tmp:
+            writer = csv.DictWriter(tmp, fieldnames=list(self.rows[0]), delimiter=";")
+            writer.writeheader()
+            writer.writerows(self.rows)
+        self.addCleanup(os.remove, tmp.name)
+        scan, _ = ingest_gcp(tmp.name, "proj")
+        return scan
+
+    def _legacy_scan(self):
+        return GCPScan(projectId="proj", findings=self.rows).save()
+
+    def _walk(self, scan_id, **params):
+        """Follow ``next`` cursors and return all check IDs in order."""
+        seen, after = [], None
+        while True:
+            query = dict(params, **({"after": after} if after else {}))
+            resp = self.client.get(f"/api/prowler/GCPfinding/{scan_id}/", query)
+            self.assertEqual(resp.status_code, 200)
+            body = resp.json()
+            self.assertLessEqual(len(body["findings"]), int(params.get("limit", 10**6)))
+            seen += [f["CHECK_ID"] for f in body["findings"]]
+            after = body["next"]
+            if not after:
+                return seen
+
+    def test_pages_cover_all_findings_in_both_storages(self):
+        for scan in (self._ingested_scan(), self._legacy_scan()):
+            self.assertEqual(self._walk(scan.id, limit=3), [f"check{i}" for i in range(10)])
+
+    def test_filters_and_severity_sort(self):
+        expected_fail_iam = ["check1", "check3", "check5"]
+        expected_by_severity = ["check1", "check5", "check9", "check2", "check6", "check3", "check7"]
+        for scan in (self._ingested_scan(), self._legacy_scan()):
+            self.assertEqual(self._walk(scan.id, limit=2, status="fail", service="iam"), expected_fail_iam)
+            self.assertEqual(
+                self._walk(scan.id, limit=2, sort="severity", severity="CRITICAL,high,medium"),
+                expected_by_severity,
+            )
+
+    def test_without_limit_returns_everything(self):
+        resp = self.client.get(f"/api/prowler/GCPfinding/{self._ingested_scan().id}/")
+        self.assertEqual(len(resp.json()["findings"]), 10)
+        self.assertIsNone(resp.json()["next"])
+
+    def test_invalid_parameters_return_400(self):
+        scan = self._ingested_scan()
+        for params in ({"after": "garbage"}, {"limit": "x"}, {"limit": "0"}, {"sort": "nope"}):
+            resp = self.client.get(f"/api/prowler/GCPfinding/{scan.id}/", params)
+            self.assertEqual(resp.status_code, 400, params)
+
+    def test_latest_endpoint_is_paginated(self):
+        self._ingested_scan()
+        resp = self.client.get("/api/prowler/GCP_Scan/", {"limit": 4})
+        self.assertEqual(len(resp.json()["findings"]), 4)
+        self.assertIsNotNone(resp.json()["next"])
+
+
+class ExportTests(MongoTestCase):
+    """Tests for the streaming CSV/XLSX export endpoints."""
+
+    documents = (AWSScan, Finding)
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        from .ingest import store_findings
+
+        self.scan = AWSScan(storage="collection").save()
+        store_findings(self.scan, [
+            {
+                "AwsAccountId": "1",
+                "Title": f"Title {i} <&>",
+                "Severity": {"Label": "HIGH"},
+                "Resources": [{"Id": f"arn:{i}"}],
+                "Compliance": {"RelatedRequirements": ["a", "b"]},
+            }
+            for i in range(3)
+        ])
+
+    def _download(self, **data):
+        resp = self.client.post("/api/prowler/xls/", dict(data, id=str(self.scan.id)))
+        self.assertEqual(resp.status_code, 200)
+        return resp, b"".join(resp.streaming_content)
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        from django.test import AsyncClient
+
+        data = {"id": str(self.scan.id), "format": "csv", "columns": "Title"}
+        resp = await AsyncClient().post("/api/prowler/xls/", data)
+        self.assertTrue(resp.is_async)
+        body = b"".join([chunk async for chunk in resp.streaming_content])
+        self.assertEqual(body.decode().splitlines()[:2], ["Title", "Title 0 <&>"])
+
+    def test_csv_with_selected_columns(self):
+        resp, body = self._download(format="csv", columns="Title,Resources.0.Id,Compliance.RelatedRequirements")
+        self.assertTrue(resp["Content-Type"].startswith("text/csv"))
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0], ["Title", "Resources.0.Id", "Compliance.RelatedRequirements"])
+        self.assertEqual(rows[1], ["Title 0 <&>", "arn:0", "a, b"])
+        self.assertEqual(len(rows), 4)
+
+    def test_gzip_csv(self):
+        import gzip
+
+        resp, body = self._download(format="csv", gzip="1")
+        self.assertEqual(resp["Content-Type"], "application/gzip")
+        self.assertIn(".csv.gz", resp["Content-Disposition"])
+        rows = list(csv.reader(io.StringIO(gzip.decompress(body).decode())))
+        self.assertEqual(rows[0][:2], ["AwsAccountId", "Region"])
+        self.assertEqual(len(rows), 4)
+
+    def test_xlsx_is_a_valid_workbook(self):
+        import zipfile
+        from xml.etree import ElementTree
+
+        _, body = self._download(format="xlsx", columns="Title,Severity.Label")
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+        ns = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        rows = [[t.text for t in row.iterfind(".//m:t", ns)] for row in sheet.iterfind(".//m:row", ns)]
+        self.assertEqual(rows[0], ["Title", "Severity.Label"])
+        self.assertEqual(rows[3], ["Title 2 <&>", "HIGH"])
+
+    def test_json_remains_default_and_bad_format_rejected(self):
+        resp = self.client.post("/api/prowler/xls/", {"id": str(self.scan.id)})
+        self.assertEqual(len(resp.json()["findings"]), 3)
+        resp = self.client.post("/api/prowler/xls/", {"id": str(self.scan.id), "format": "pdf"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class HistoryTests(MongoTestCase):
+    """Tests for the paginated history endpoints."""
+
+    documents = (AWSScan, Finding, ScanJob)
+
+    def setUp(self):
+        from datetime import datetime
+
+        super().setUp()
+        self.client = Client()
+        for day in range(1, 6):
+            AWSScan(
+                date=datetime(2024, 1, day),
+                accountId="a" if day % 2 else "b",
+                region="all",
+                findings=[{"Id": str(i)} for i in range(day)],
+            ).save()
+            ScanJob(scan_id=f"job{day}", provider="GCP", status="completed",
+                    created_at=datetime(2024, 1, day)).save()
+
+    def _walk(self, url, **params):
+        rows, after = [], None
+        while True:
+            query = dict(params, **({"after": after} if after else {}))
+            resp = self.client.get(url, query)
+            self.assertEqual(resp.status_code, 200)
+            rows += resp.json()["data"]
+            after = resp.json()["next"]
+            if not after:
+                return rows
+
+    def test_history_pages_newest_first_with_counts(self):
+        rows = self._walk("/api/prowler/scanlist/history/", limit=2)
+        self.assertEqual([r["findingsCount"] for r in rows], [5, 4, 3, 2, 1])
+        self.assertNotIn("findings", rows[0])
+
+    def test_history_filters(self):
+        rows = self._walk("/api/prowler/scanlist/history/", limit=1, accountId="a",
+                          **{"from": "2024-01-02", "to": "2024-01-05"})
+        self.assertEqual([r["findingsCount"] for r in rows], [5, 3])
+        resp = self.client.get("/api/prowler/scanlist/history/", {"from": "yesterday"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_job_history_pagination(self):
+        rows = self._walk("/api/prowler/scanlist/db/", limit=2)
+        self.assertEqual([r["scan_id"] for r in rows], ["job5", "job4", "job3", "job2", "job1"])
+
+
+@override_settings(SCAN_EXECUTOR_AUTOSTART=False)
+class ScanExecutorTests(MongoTestCase):
+    """Tests for the persistent scan queue and its executor."""
+
+    documents = (ScanJob, GCPScan, Finding)
+
+    def setUp(self):
+        from .executor import ScanExecutor
+
+        super().setUp()
+        self.client = Client()
+        self.executor = ScanExecutor(concurrency=1)
+
+    def _csv(self):
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False) as tmp_csv:
+            writer = csv.DictWriter(tmp_csv, fieldnames=["ACCOUNT_UID", "REGION"], delimiter=";")
+            writer.writeheader()
+            writer.writerow({"ACCOUNT_UID": "id", "REGION": "region"})
+        self.addCleanup(os.remove, tmp_csv.name)
+        return tmp_csv.name
+
+    def _key(self):
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as tmp_key:
+            tmp_key.write("{}")
+        return tmp_key.name
+
+    def test_db_scan_is_queued_then_run_by_worker(self):
+        key_path = self._key()
+        ScanJob(scan_id="key1", provider="GCP", status="uploaded", result={"key_path": key_path}).save()
+
+        resp = self.client.post("/api/prowler/scan/async/gcp/db/", {"keyId": "key1", "projectId": "proj"})
+        scan_id = resp.json()["scan_id"]
+        self.assertEqual(ScanJob.objects.get(scan_id=scan_id).status, "queued")
+
+        with patch("cloudscan.tasks.run_prowler_gcp", return_value=self._csv()) as mock_run:
+            self.assertEqual(self.executor.run_once().scan_id, scan_id)
+        self.assertIsNone(self.executor.run_once())
+
+        mock_run.assert_called_once_with(key_path, project_id="proj", checks=None, group=None, progress=ANY)
+        status = self.client.get(f"/api/prowler/scan/status/db/{scan_id}/").json()
+        self.assertEqual((status["status"], status["progress"]), ("completed", 100))
+        self.assertEqual(status["result"]["findingsCount"], 1)
+        self.assertFalse(os.path.exists(key_path))
+
+    def test_failed_scan_is_reported_through_scan_status(self):
+        from . import views
+
+        views.TEMP_KEYS["k"] = self._key()
+        resp = self.client.post("/api/prowler/scan/async/gcp/", {"keyId": "k", "projectId": "proj"})
+        scan_id = resp.json()["scan_id"]
+        self.assertIsNone(self.client.get(f"/api/prowler/scan/status/{scan_id}/").json()["result"])
+
+        with patch("cloudscan.tasks.run_prowler_gcp", side_effect=Exception("boom")):
+            self.executor.run_once()
+        body = self.client.get(f"/api/prowler/scan/status/{scan_id}/").json()
+        self.assertEqual((body["progress"], body["result"]), (100, {"error": "boom"}))
+        self.assertNotIn("k", views.TEMP_KEYS)
+
+    def test_executor_starts_at_boot_in_server_processes(self):
+        from . import executor
+
+        self.assertTrue(executor.serving_process(["/venv/bin/uvicorn", "prow.asgi:application"]))
+        self.assertFalse(executor.serving_process(["manage.py", "migrate"]))
+        self.assertFalse(executor.serving_process(["manage.py", "run_scan_worker"]))
+        self.assertTrue(executor.serving_process(["manage.py", "runserver", "--noreload"]))
+        with patch.dict(os.environ, {"RUN_MAIN": "true"}):
+            self.assertTrue(executor.serving_process(["manage.py", "runserver"]))
+
+        with patch.object(executor, "get_executor") as get_executor:
+            with patch.object(executor, "serving_process", return_value=True):
+                executor.start_at_boot()
+                self.assertFalse(get_executor.called)  # SCAN_EXECUTOR_AUTOSTART is off here.
+                with self.settings(SCAN_EXECUTOR_AUTOSTART=True):
+                    executor.start_at_boot()
+        get_executor.return_value.start.assert_called_once_with()
+
+    def test_jobs_with_local_files_only_run_on_their_host(self):
+        from . import views
+        from .executor import HOST, claim_next, enqueue
+
+        other = enqueue("gcp_scan", "GCP", {"key_path": "/elsewhere"}, host="other-host")
+        self.assertIsNone(claim_next("worker"))
+        anywhere = enqueue("aws_scan", "AWS", {"region": "all"})
+        self.assertEqual(claim_next("worker").scan_id, anywhere.scan_id)
+        self.assertEqual(ScanJob.objects.get(scan_id=other.scan_id).status, "queued")
+
+        upload = {"keyFile": SimpleUploadedFile("k.json", b"{}")}
+        with patch("cloudscan.async_views.fetch_project_ids", return_value=[]):
+            key_id = self.client.post("/api/prowler/async/projects", upload).json()["keyId"]
+        self.assertEqual(ScanJob.objects.get(scan_id=key_id).host, HOST)
+        views.TEMP_KEYS["k"] = self._key()
+        scan_ids = [
+            self.client.post(url, {"keyId": key, "projectId": "p"}).json()["scan_id"]
+            for url, key in (("/api/prowler/scan/async/gcp/db/", key_id), ("/api/prowler/scan/async/gcp/", "k"))
+        ]
+        self.assertEqual(set(ScanJob.objects(scan_id__in=scan_ids).scalar("host")), {HOST})
+        for job in ScanJob.objects(scan_id__in=scan_ids):
+            os.remove(job.params["key_path"])
+
+    def test_expired_leases_are_requeued_until_attempts_run_out(self):
+        from datetime import datetime, timedelta
+        from .executor import claim_next, enqueue, requeue_expired, run_job
+
+        job = enqueue("gcp_scan", "GCP", {"key_path": "/nonexistent"})
+        past = datetime.utcnow() - timedelta(seconds=1)
+        with self.settings(SCAN_JOB_MAX_ATTEMPTS=2):
+            for attempt in (1, 2):
+                claimed = claim_next(f"worker{attempt}")
+                self.assertEqual((claimed.scan_id, claimed.attempts), (job.scan_id, attempt))
+                ScanJob.objects(scan_id=job.scan_id).update_one(set__lease_expires_at=past)
+                requeue_expired()
+            job.reload()
+        self.assertEqual(job.status, "error")
+
+        # A worker that lost its lease must not overwrite the job.
+        run_job(claimed, "worker2")
+        job.reload()
+        self.assertEqual(job.result, {"error": "Scan worker stopped responding"})
+
+
+class ScanProgressTests(MongoTestCase):
+    """Tests for progress parsed from Prowler output."""
+
+    documents = (ScanJob,)
+
+    def test_runner_streams_progress_from_prowler_output(self):
+        from .prowler_runner import _run
+
+        script = (
+            "import sys\n"
+            "print('Executing 4 checks, please wait...', flush=True)\n"
+            "for i, svc in enumerate(['s3', 's3', 'iam', 'ec2'], 1):\n"
+            "    sys.stdout.write(f'\\r\\x1b[2K-> Scanning {svc} service |##| {i}/4 [{i * 25}%] in 1s')\n"
+            "    sys.stdout.flush()\n"
+            "print()\n"
+            "print('oops', file=sys.stderr)\n"
+        )
+        updates = []
+        code, output = _run(["python", "-c", script], os.environ.copy(), lambda *a: updates.append(a))
+
+        self.assertEqual(code, 0)
+        self.assertIn("oops", output)
+        self.assertEqual(updates[0], (0, 4, None))
+        self.assertEqual(updates[-1], (4, 4, "ec2"))
+        self.assertIn((3, 4, "iam"), updates)
+
+    def test_job_progress_coalesces_writes(self):
+        from .executor import JobProgress
+
+        job = ScanJob(scan_id="s", provider="AWS", progress=10).save()
+        with self.settings(SCAN_PROGRESS_INTERVAL=3600):
+            progress = JobProgress(job)
+            for done in range(1, 1001):
+                progress(done, 1000, "s3")
+            progress.flush()
+            progress.flush()
+
+        self.assertEqual(progress.writes, 2)
+        job.reload()
+        self.assertEqual((job.progress, job.checks_done, job.checks_total, job.current_service), (89, 1000, 1000, "s3"))
+
+    @override_settings(SCAN_EXECUTOR_AUTOSTART=False)
+    def test_async_aws_scan_runs_prowler_with_progress(self):
+        from .executor import ScanExecutor
+
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as tmp_json:
+            json.dump([{"AwsAccountId": "123"}], tmp_json)
+        self.addCleanup(os.remove, tmp_json.name)
+
+        def fake_run(access_key, secret_key, region, checks=None, progress=None):
+            self.assertEqual((access_key, secret_key, region), ("AKIA", "secret", "eu-west-1"))
+            progress(1, 2, "s3")
+            return tmp_json.name
+
+        with patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "", "AWS_SECRET_ACCESS_KEY": ""}):
+            resp = Client().post(
+                "/api/prowler/scan/async/aws/",
+                {"accessKey": "AKIA", "secretKey": "secret", "region": "eu-west-1"},
+            )
+            scan_id = resp.json()["scan_id"]
+            credentials_path = ScanJob.objects.get(scan_id=scan_id).params["credentials_path"]
+            with patch("cloudscan.tasks.run_prowler_aws", side_effect=fake_run):
+                ScanExecutor().run_once()
+
+        self.assertFalse(os.path.exists(credentials_path))
+        body = Client().get(f"/api/prowler/scan/status/{scan_id}/").json()
+        self.assertEqual(body["progress"], 100)
+        self.assertEqual(body["result"]["findingsCount"], 1)
+        self.assertEqual((body["checksDone"], body["checksTotal"], body["service"]), (1, 2, "s3"))
+
+
+class ShardedScanTests(MongoTestCase):
+    """Tests for region-sharded AWS scans."""
+
+    documents = (AWSScan, Finding)
+
+    def _fake_run(self, calls):
+        import threading
+
+        lock = threading.Lock()
+        active = {"now": 0, "max": 0}
+
+        def fake_run(access_key, secret_key, region, checks=None, progress=None, services=None, shard=None, timestamp=None):
+            with lock:
+                calls.append((region, services, shard))
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+            try:
+                if region == "ap-south-1":
+                    raise Exception("throttled")
+                progress(1, 1, "iam")
+                findings = [
+                    {"AwsAccountId": "1", "Id": "global-iam"},
+                    {"AwsAccountId": "1", "Id": f"{region}-{services}"},
+                ]
+                with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as tmp:
+                    json.dump(findings, tmp)
+                self.addCleanup(os.remove, tmp.name)
+                return tmp.name
+            finally:
+                with lock:
+                    active["now"] -= 1
+
+        return fake_run, active
+
+    def test_sharded_scan_merges_shards_and_keeps_partial_result(self):
+        calls = []
+        fake_run, active = self._fake_run(calls)
+        with patch("cloudscan.prowler_runner.run_prowler_aws", side_effect=fake_run):
+            resp = Client().post("/api/prowler/scan/aws", {
+                "accessKey": "AKIA",
+                "secretKey": "secret",
+                "region": "us-east-1,eu-west-1,ap-south-1",
+                "services": "s3,ec2",
+                "sharded": "true",
+                "parallelism": "2",
+            })
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual(len(calls), 6)
+        self.assertEqual(len({shard for _, _, shard in calls}), 6)
+        self.assertLessEqual(active["max"], 2)
+        # One global finding plus one per successful (region, service) shard.
+        self.assertEqual(body["findingsCount"], 5)
+        self.assertEqual({e["region"] for e in body["failedShards"]}, {"ap-south-1"})
+        self.assertEqual(len(AWSScan.objects.get(id=body["scanId"]).shardErrors), 2)
+
+    def test_all_regions_use_configured_list(self):
+        from .prowler_runner import aws_shards
+
+        with self.settings(AWS_SCAN_REGIONS=["us-east-1", "eu-west-1"]):
+            self.assertEqual(aws_shards("all"), [("us-east-1", None), ("eu-west-1", None)])
+            self.assertEqual(aws_shards("all", ["s3"]), [("us-east-1", "s3"), ("eu-west-1", "s3")])
+
+    def test_service_shards_with_checks_filter_the_check_list(self):
+        from .prowler_runner import run_prowler_aws_sharded
+
+        commands = []
+
+        def fake_run(prowler_cmd, env, progress):
+            commands.append(prowler_cmd)
+            return 0, ""
+
+        with patch("cloudscan.prowler_runner._run", side_effect=fake_run), patch("os.path.exists", return_value=True):
+            run_prowler_aws_sharded("a", "b", "us-east-1", checks="s3_a,iam_b, s3_c", services=["s3", "ec2"])
+            self.assertEqual(len(commands), 1)
+            self.assertEqual(commands[0][-3:], ["-c", "s3_a", "s3_c"])
+            self.assertNotIn("--services", commands[0])
+
+            run_prowler_aws_sharded("a", "b", "us-east-1", services=["ec2"])
+            self.assertEqual(commands[1][-2:], ["--services", "ec2"])
+            with self.assertRaisesRegex(ValueError, "None of the checks"):
+                run_prowler_aws_sharded("a", "b", "us-east-1", checks="iam_b", services=["s3"])
+
+        resp = Client().post("/api/prowler/scan/aws", {
+            "accessKey": "AKIA", "secretKey": "secret", "checks": "iam_b", "services": "s3", "sharded": "true",
+        })
+        self.assertEqual(resp.status_code, 400)
+
+    def test_failure_of_every_shard_is_an_error(self):
+        from .prowler_runner import run_prowler_aws_sharded
+
+        with patch("cloudscan.prowler_runner.run_prowler_aws", side_effect=Exception("denied")):
+            with self.assertRaisesRegex(Exception, "All 1 Prowler shards failed: denied"):
+                run_prowler_aws_sharded("a", "b", "us-east-1")
+
+
+@override_settings(SCAN_EXECUTOR_AUTOSTART=False)
+class MultiProjectScanTests(MongoTestCase):
+    """Tests for fanning a GCP scan out across projects."""
+
+    documents = (ScanJob, GCPScan, Finding)
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as tmp_key:
+            tmp_key.write("{}")
+        self.key_path = tmp_key.name
+        ScanJob(scan_id="key", provider="GCP", status="uploaded", result={"key_path": self.key_path}).save()
+
+    def _fake_run(self, key_path, project_id=None, checks=None, group=None, progress=None):
+        if project_id == "bad":
+            raise Exception("permission denied")
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False) as tmp_csv:
+            writer = csv.DictWriter(tmp_csv, fieldnames=["ACCOUNT_UID", "PROJECT_ID"], delimiter=";")
+            writer.writeheader()
+            writer.writerow({"ACCOUNT_UID": project_id, "PROJECT_ID": project_id})
+            writer.writerow({"ACCOUNT_UID": project_id, "PROJECT_ID": project_id})
+        self.addCleanup(os.remove, tmp_csv.name)
+        return tmp_csv.name
+
+    def test_projects_run_under_parent_with_rollup(self):
+        from .executor import ScanExecutor
+
+        resp = self.client.post(
+            "/api/prowler/scan/async/gcp/multi/", {"keyId": "key", "projects": "p1,bad,p2", "maxParallel": 2}
+        )
+        parent_id = resp.json()["scan_id"]
+        statuses = sorted(ScanJob.objects(parent_id=parent_id).scalar("status"))
+        self.assertEqual(statuses, ["pending", "queued", "queued"])
+
+        executor = ScanExecutor()
+        with patch("cloudscan.tasks.run_prowler_gcp", side_effect=self._fake_run):
+            executor.run_once()
+            status = self.client.get(f"/api/prowler/scan/status/db/{parent_id}/").json()
+            self.assertEqual(status["status"], "running")
+            self.assertEqual(status["progress"], 33)
+            self.assertEqual([p["status"] for p in status["projects"]], ["completed", "queued", "queued"])
+            while executor.run_once():
+                pass
+
+        status = self.client.get(f"/api/prowler/scan/status/db/{parent_id}/").json()
+        self.assertEqual((status["status"], status["progress"]), ("completed", 100))
+        summary = status["result"]
+        self.assertEqual((summary["projects"], summary["completed"], summary["failed"]), (3, 2, 1))
+        self.assertEqual(summary["findingsCount"], 4)
+        self.assertEqual(summary["errors"], [{"projectId": "bad", "error": "permission denied"}])
+        self.assertEqual(sorted(GCPScan.objects.scalar("projectId")), ["p1", "p2"])
+        self.assertFalse(os.path.exists(self.key_path))
+
+        history = self.client.get("/api/prowler/scanlist/db/").json()["data"]
+        self.assertEqual([row["scan_id"] for row in history if row["status"] != "uploaded"], [parent_id])
+
+    def test_all_projects_uses_key_listing(self):
+        with patch("cloudscan.async_views.fetch_project_ids", return_value=["a", "b"]):
+            resp = self.client.post("/api/prowler/scan/async/gcp/multi/", {"keyId": "key", "projects": "all"})
+        self.assertEqual(resp.json()["projects"], ["a", "b"])
+        self.assertEqual(ScanJob.objects(parent_id=resp.json()["scan_id"]).count(), 2)
+        os.remove(self.key_path)
+
+    def test_invalid_requests(self):
+        for data in ({"keyId": "key"}, {"keyId": "key", "projects": "p", "maxParallel": "0"}):
+            self.assertEqual(self.client.post("/api/prowler/scan/async/gcp/multi/", data).status_code, 400, data)
+        resp = self.client.post("/api/prowler/scan/async/gcp/multi/", {"keyId": "nope", "projects": "p"})
+        self.assertEqual(resp.status_code, 404)
+        with patch("cloudscan.async_views.fetch_project_ids", side_effect=Exception("denied")):
+            resp = self.client.post("/api/prowler/scan/async/gcp/multi/", {"keyId": "key", "projects": "all"})
+        self.assertEqual(resp.status_code, 500)
+        # Nothing was started, so the key can still be used.
+        self.assertEqual(ScanJob.objects(scan_id="key", status="uploaded").count(), 1)
+        os.remove(self.key_path)
+
+    def test_concurrent_runs_write_separate_reports(self):
+        from .prowler_runner import run_prowler_gcp
+
+        names = []
+
+        def fake_run(prowler_cmd, env, progress):
+            names.append(prowler_cmd[prowler_cmd.index("--output-filename") + 1])
+            return 0, ""
+
+        with patch("cloudscan.prowler_runner._run", side_effect=fake_run), \
+                patch("cloudscan.prowler_runner.time.time", return_value=1700000000.0), \
+                patch("os.path.exists", return_value=True):
+            paths = {run_prowler_gcp(self.key_path, project_id=p) for p in ("p1", "p2")}
+        self.assertEqual(len(paths), 2)
+        self.assertTrue(all(name.startswith("gcp-scan-1700000000000-") for name in names))
+        os.remove(self.key_path)
+
+    def test_key_is_consumed(self):
+        resp = self.client.post("/api/prowler/scan/async/gcp/multi/", {"keyId": "key", "projects": "p1"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(ScanJob.objects(scan_id="key").count(), 0)
+        for url, data in (
+            ("/api/prowler/scan/async/gcp/multi/", {"keyId": "key", "projects": "p1"}),
+            ("/api/prowler/scan/async/gcp/db/", {"keyId": "key", "projectId": "p1"}),
+        ):
+            self.assertIn(self.client.post(url, data).status_code, (400, 404), url)
+        os.remove(self.key_path)
+
+
+class IncrementalScanTests(MongoTestCase):
+    """Tests for incremental rescans that carry fresh checks forward."""
+
+    documents = (AWSScan, GCPScan, Finding)
+
+    def _report(self, checks):
+        findings = [
+            {
+                "AwsAccountId": "1",
+                "Id": check,
+                "GeneratorId": f"prowler-{check}",
+                "Compliance": {"Status": "FAILED"},
+            }
+            for check in checks
+        ]
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as tmp:
+            json.dump(findings, tmp)
+        self.addCleanup(os.remove, tmp.name)
+        return tmp.name
+
+    def _base_scan(self):
+        from datetime import datetime, timedelta
+        from .ingest import ingest_aws
+
+        base, _ = ingest_aws(self._report(["s3_public", "iam_root_mfa", "ec2_open_ports"]), "us-east-1")
+        # ec2 results are two days old, past the default one-day max-age.
+        stale = datetime.now() - timedelta(days=2)
+        Finding.objects(scan=base.id, checkId="ec2_open_ports").update(set__observedAt=stale)
+        return AWSScan.objects.get(id=base.id), stale
+
+    def _rescan(self, **data):
+        body = {"accessKey": "AKIA", "secretKey": "secret", "region": "us-east-1", "incremental": "true"}
+        body.update(data)
+        return Client().post("/api/prowler/scan/aws", body)
+
+    def test_rescan_reruns_requested_and_stale_checks_only(self):
+        base, stale = self._base_scan()
+        with patch("cloudscan.views.run_prowler_aws") as mock_run:
+            mock_run.return_value = self._report(["iam_root_mfa", "ec2_open_ports"])
+            resp = self._rescan(accountId="1", checks="iam_root_mfa")
+
+        self.assertEqual(resp.status_code, 200)
+        mock_run.assert_called_once_with("AKIA", "secret", "us-east-1", checks="ec2_open_ports,iam_root_mfa")
+        info = resp.json()["incremental"]
+        self.assertEqual(info["baseScanId"], str(base.id))
+        self.assertEqual(info["rerunChecks"], ["ec2_open_ports", "iam_root_mfa"])
+        self.assertEqual(info["carriedForward"], 1)
+
+        scan = AWSScan.objects.get(id=resp.json()["scanId"])
+        self.assertEqual((scan.findingsCount, scan.failedCount), (3, 3))
+        self.assertEqual(scan.baseScan, base.id)
+        carried = Finding.objects.get(scan=scan.id, carriedForward=True)
+        self.assertEqual(carried.checkId, "s3_public")
+        self.assertEqual(carried.observedAt, base.date.replace(microsecond=base.date.microsecond // 1000 * 1000))
+        fresh = Finding.objects.get(scan=scan.id, checkId="ec2_open_ports")
+        self.assertFalse(fresh.carriedForward)
+        self.assertGreater(fresh.observedAt, stale)
+
+    @override_settings(CHECK_MAX_AGE_SECONDS=7 * 86400)
+    def test_fresh_scan_is_copied_without_running_prowler(self):
+        base, stale = self._base_scan()
+        with patch("cloudscan.views.run_prowler_aws") as mock_run:
+            resp = self._rescan(baseScanId=str(base.id))
+
+        mock_run.assert_not_called()
+        self.assertEqual(resp.json()["incremental"]["rerunChecks"], [])
+        scan = AWSScan.objects.get(id=resp.json()["scanId"])
+        self.assertEqual((scan.accountId, scan.findingsCount), ("1", 3))
+        self.assertEqual(
+            Finding.objects.get(scan=scan.id, checkId="ec2_open_ports").observedAt,
+            stale.replace(microsecond=stale.microsecond // 1000 * 1000),
+        )
+
+    @override_settings(CHECK_MAX_AGE_OVERRIDES={"iam": 0}, CHECK_MAX_AGE_SECONDS=7 * 86400)
+    def test_max_age_policy_and_services(self):
+        from .incremental import plan_rescan
+
+        base, _ = self._base_scan()
+        self.assertEqual(plan_rescan(base), ({"iam_root_mfa"}, {"s3_public", "ec2_open_ports"}))
+        rerun, _ = plan_rescan(base, services=["s3"])
+        self.assertEqual(rerun, {"iam_root_mfa", "s3_public"})
+
+    def test_legacy_embedded_scan_can_be_the_base(self):
+        from datetime import datetime
+        from .incremental import rescan
+
+        base = GCPScan(
+            date=datetime.now(),
+            projectId="proj",
+            findings=[
+                {"CHECK_ID": "compute_public_ip", "STATUS": "FAIL", "PROJECT_ID": "proj"},
+                {"CHECK_ID": "iam_sa_keys", "STATUS": "PASS", "PROJECT_ID": "proj"},
+            ],
+        )
+        base.save()
+
+        def run(checks):
+            raise AssertionError("nothing is stale")
+
+        scan, count, info = rescan(GCPScan, run, projectId="proj")
+        self.assertEqual((count, info["carriedForward"]), (2, 2))
+        self.assertEqual(scan.failedCount, 1)
+        self.assertEqual(Finding.objects(scan=scan.id, carriedForward=True).count(), 2)
+
+    def test_without_previous_scan_runs_a_full_scan(self):
+        with patch("cloudscan.views.run_prowler_aws") as mock_run:
+            mock_run.return_value = self._report(["s3_public"])
+            resp = self._rescan(accountId="1")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNone(resp.json()["incremental"])
+        mock_run.assert_called_once_with("AKIA", "secret", "us-east-1", checks=None)
+
+        self.assertEqual(self._rescan(baseScanId="64b000000000000000000000").status_code, 404)
+        self.assertEqual(self._rescan(sharded="true").status_code, 400)
+
+
+class GCPProjectListingTests(TestCase):
+    """Tests for the cached in-process GCP project listing."""
+
+    def setUp(self):
+        from .gcp_projects import clear_cache
+
+        clear_cache()
+        self.addCleanup(clear_cache)
+
+    def _key(self, content):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as tmp:
+            tmp.write(content)
+        self.addCleanup(os.remove, tmp.name)
+        return tmp.name
+
+    def test_same_key_is_listed_once(self):
+        from .gcp_projects import fetch_project_ids
+
+        with patch("cloudscan.gcp_projects.list_projects", return_value=["a", "b"]) as mock_list:
+            self.assertEqual(fetch_project_ids(self._key('{"k": 1}')), ["a", "b"])
+            # A re-upload lands in a new temp file with the same contents.
+            self.assertEqual(fetch_project_ids(self._key('{"k": 1}')), ["a", "b"])
+            fetch_project_ids(self._key('{"k": 2}'))
+        self.assertEqual(mock_list.call_count, 2)
+
+    @override_settings(GCP_PROJECTS_CACHE_SECONDS=0)
+    def test_expired_entries_and_errors_are_not_reused(self):
+        from .gcp_projects import fetch_project_ids
+
+        key = self._key('{"k": 1}')
+        with patch("cloudscan.gcp_projects.list_projects", side_effect=[Exception("denied"), ["a"], ["b"]]):
+            with self.assertRaises(Exception):
+                fetch_project_ids(key)
+            self.assertEqual(fetch_project_ids(key), ["a"])
+            self.assertEqual(fetch_project_ids(key), ["b"])
+
+    def test_concurrent_lookups_of_one_key_share_a_call(self):
+        import threading
+        from .gcp_projects import fetch_project_ids
+
+        key = self._key('{"k": 1}')
+        release = threading.Event()
+        calls = []
+
+        def slow_list(path):
+            calls.append(path)
+            release.wait(5)
+            return ["a"]
+
+        results = []
+        with patch("cloudscan.gcp_projects.list_projects", side_effect=slow_list):
+            threads = [threading.Thread(target=lambda: results.append(fetch_project_ids(key))) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            while not calls:
+                release.wait(0.01)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [["a"]] * 4)
+
+
+class ScanDiffTests(MongoTestCase):
+    """Tests for fingerprint-based scan diffs."""
+
+    documents = (AWSScan, GCPScan, Finding, FindingChunk)
+
+    def _aws_scan(self, resources):
+        from .ingest import ingest_aws
+
+        findings = [
+            {
+                "AwsAccountId": "1",
+                "Id": f"{resource}-{status}",
+                "GeneratorId": "prowler-s3_bucket_public",
+                "Region": "us-east-1",
+                "Resources": [{"Id": resource}],
+                "Compliance": {"Status": status},
+            }
+            for resource, status in resources
+        ]
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as tmp:
+            json.dump(findings, tmp)
+        self.addCleanup(os.remove, tmp.name)
+        return ingest_aws(tmp.name, "us-east-1")[0]
+
+    def test_fingerprint_ignores_volatile_fields(self):
+        from .findings import finding_fields
+
+        first = {"GeneratorId": "prowler-iam_x", "Resources": [{"Id": "r"}], "Region": "eu", "AwsAccountId": "1", "Id": "a"}
+        second = dict(first, Id="b", Compliance={"Status": "PASSED"})
+        self.assertEqual(finding_fields("AWS", first)["fingerprint"], finding_fields("AWS", second)["fingerprint"])
+        self.assertNotEqual(
+            finding_fields("AWS", first)["fingerprint"],
+            finding_fields("AWS", dict(first, Region="us"))["fingerprint"],
+        )
+
+    def test_diff_endpoint(self):
+        base = self._aws_scan([("a", "FAILED"), ("b", "FAILED"), ("c", "FAILED")])
+        head = self._aws_scan([("b", "PASSED"), ("c", "FAILED"), ("d", "FAILED")])
+        resp = Client().get("/api/prowler/scan/aws/diff/", {"base": str(base.id), "head": str(head.id)})
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual(body["counts"], {"new": 1, "resolved": 1, "unchanged": 2})
+        self.assertEqual([f["Resources"][0]["Id"] for f in body["new"]], ["d"])
+        self.assertEqual([f["Resources"][0]["Id"] for f in body["resolved"]], ["a"])
+        self.assertNotIn("unchanged", body)
+
+        resp = Client().get("/api/prowler/scan/aws/diff/", {
+            "base": str(base.id), "head": str(head.id), "include": "unchanged", "limit": "1",
+        })
+        self.assertEqual(len(resp.json()["unchanged"]), 1)
+
+    def test_legacy_scans_and_missing_fingerprints(self):
+        from datetime import datetime
+
+        base = GCPScan(date=datetime.now(), projectId="p", findings=[
+            {"CHECK_ID": "iam_x", "RESOURCE_UID": "r1", "PROJECT_ID": "p"},
+            {"CHECK_ID": "iam_x", "RESOURCE_UID": "r2", "PROJECT_ID": "p"},
+        ])
+        base.save()
+        head = GCPScan(date=datetime.now(), projectId="p", storage="collection")
+        head.save()
+        Finding(scan=head.id, provider="GCP", data={"CHECK_ID": "iam_x", "RESOURCE_UID": "r2", "PROJECT_ID": "p"}).save()
+
+        resp = Client().get("/api/prowler/scan/gcp/diff/", {"base": str(base.id), "head": str(head.id)})
+        self.assertEqual(resp.json()["counts"], {"new": 0, "resolved": 1, "unchanged": 1})
+        self.assertIsNotNone(Finding.objects.get(scan=head.id).fingerprint)
+
+    def test_missing_fingerprints_of_compressed_scans(self):
+        from .columnar import write_chunk
+
+        base = self._aws_scan([("a", "FAILED"), ("b", "FAILED")])
+        head = self._aws_scan([("b", "FAILED"), ("c", "FAILED")])
+        # A scan split before fingerprints existed, then compressed.
+        collection = Finding._get_collection()
+        rows = list(collection.find({"scan": head.id}).sort("_id", 1))
+        write_chunk(head.id, 0, [row["data"] for row in rows])
+        for i, row in enumerate(rows):
+            collection.update_one(
+                {"_id": row["_id"]}, {"$set": {"chunk": 0, "row": i}, "$unset": {"data": "", "fingerprint": ""}}
+            )
+        AWSScan.objects(id=head.id).update_one(set__storage="compressed")
+
+        resp = Client().get("/api/prowler/scan/aws/diff/", {"base": str(base.id), "head": str(head.id)})
+        self.assertEqual(resp.json()["counts"], {"new": 1, "resolved": 1, "unchanged": 1})
+        self.assertEqual([f["Resources"][0]["Id"] for f in resp.json()["new"]], ["c"])
+
+    def test_invalid_requests(self):
+        scan = self._aws_scan([("a", "FAILED")])
+        for params, code in (
+            ({"base": str(scan.id)}, 400),
+            ({"base": str(scan.id), "head": str(scan.id), "include": "bogus"}, 400),
+            ({"base": str(scan.id), "head": "nope"}, 404),
+        ):
+            self.assertEqual(Client().get("/api/prowler/scan/aws/diff/", params).status_code, code, params)
+
+
+class ScanSummaryTests(MongoTestCase):
+    """Tests for precomputed scan summaries."""
+
+    documents = (AWSScan, GCPScan, Finding)
+
+    def _csv(self, rows):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="") as tmp:
+            writer = csv.DictWriter(tmp, fieldnames=list(rows[0]), delimiter=";")
+            writer.writeheader()
+            writer.writerows(rows)
+        self.addCleanup(os.remove, tmp.name)
+        return tmp.name
+
+    def test_summary_is_stored_at_ingest(self):
+        from .ingest import ingest_gcp
+
+        row = {"PROJECT_ID": "p", "SEVERITY": "High", "STATUS": "FAIL", "SERVICE_NAME": "iam", "REGION": "global"}
+        scan, _ = ingest_gcp(self._csv([row, row, dict(row, STATUS="PASS", SEVERITY="low")]))
+        scan.reload()
+        self.assertEqual(scan.summary, [
+            {"severity": "high", "status": "FAIL", "service": "iam", "region": "global", "count": 2},
+            {"severity": "low", "status": "PASS", "service": "iam", "region": "global", "count": 1},
+        ])
+
+        with patch("cloudscan.summary.aggregate_summary") as mock_aggregate:
+            resp = Client().get(f"/api/prowler/GCPfinding/{scan.id}/summary/")
+        mock_aggregate.assert_not_called()
+        summary = resp.json()["summary"]
+        self.assertEqual(summary["total"], 3)
+        self.assertEqual(summary["bySeverity"], {"high": 2, "low": 1})
+        self.assertEqual(summary["byStatus"], {"FAIL": 2, "PASS": 1})
+        self.assertEqual(Client().get("/api/prowler/GCP_Scan/summary/").json()["scanId"], str(scan.id))
+
+    def test_older_scans_are_aggregated_once(self):
+        from datetime import datetime
+
+        legacy = AWSScan(date=datetime.now(), findings=[
+            {"GeneratorId": "prowler-s3_x", "Severity": {"Label": "HIGH"}, "Compliance": {"Status": "FAILED"}, "Region": "eu"},
+        ])
+        legacy.save()
+        stored = AWSScan(date=datetime.now(), storage="collection")
+        stored.save()
+        for status in ("FAIL", "PASS", "PASS"):
+            Finding(scan=stored.id, provider="AWS", severity="low", status=status, service="ec2", region="us").save()
+
+        body = Client().get(f"/api/prowler/AWSfinding/{legacy.id}/summary/").json()["summary"]
+        self.assertEqual(body["byService"], {"s3": 1})
+        body = Client().get(f"/api/prowler/AWSfinding/{stored.id}/summary/").json()["summary"]
+        self.assertEqual(body["byStatus"], {"FAIL": 1, "PASS": 2})
+        self.assertEqual(len(AWSScan.objects.get(id=stored.id).summary), 2)
+        self.assertEqual(Client().get("/api/prowler/AWSfinding/nope/summary/").status_code, 404)
+
+
+@override_settings(SCAN_EVENTS_POLL_SECONDS=0.01)
+class ScanEventsTests(MongoTestCase):
+    """Tests for the Server-Sent Events status stream."""
+
+    documents = (ScanJob,)
+
+    def test_hub_publishes_changes_once(self):
+        from .events import JobEventHub
+
+        ScanJob(scan_id="a", provider="AWS", status="running", progress=10).save()
+        hub = JobEventHub()
+        sub = hub.subscribe(["a"])
+        event, data = sub.get(timeout=2)
+        self.assertEqual((event, data["progress"]), ("progress", 10))
+        self.assertIsNone(sub.get(timeout=0.1))
+
+        ScanJob.objects(scan_id="a").update_one(set__progress=50, set__current_service="s3")
+        hub.notify()
+        event, data = sub.get(timeout=2)
+        self.assertEqual((data["progress"], data["service"]), (50, "s3"))
+
+        # A late subscriber gets the current state straight away.
+        late = hub.subscribe(["a"])
+        self.assertEqual(late.get(timeout=0)[1]["progress"], 50)
+        sub.close()
+        late.close()
+        self.assertEqual(hub._subscribers, {})
+
+    def test_stream_ends_when_every_scan_is_done(self):
+        ScanJob(scan_id="a", provider="AWS", status="completed", progress=100, result={"scanId": "x"}).save()
+        ScanJob(scan_id="b", provider="AWS", status="running", progress=40).save()
+
+        resp = Client().get("/api/prowler/scan/events/", {"ids": "a,b,zzz"})
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        frames = []
+        for chunk in resp.streaming_content:
+            frames.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+            if len(frames) == 4:
+                ScanJob.objects(scan_id="b").update_one(set__status="error", set__result={"error": "boom"})
+                from .events import notify
+                notify()
+        events = [f for f in frames if f.startswith("event:")]
+        self.assertIn('event: done\ndata: {"scanId": "a"', "".join(events))
+        self.assertIn("event: missing", "".join(events))
+        self.assertTrue(events[-1].startswith("event: done") and '"boom"' in events[-1])
+
+    async def test_asgi_stream_delivers_events_live(self):
+        import asyncio
+        from django.test import AsyncClient
+        from .events import get_hub, notify
+
+        ScanJob(scan_id="a", provider="AWS", status="running", progress=10).save()
+        resp = await AsyncClient().get("/api/prowler/scan/events/", {"ids": "a"})
+        self.assertTrue(resp.is_async)
+        stream = aiter(resp.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        frame = (await asyncio.wait_for(anext(stream), 2)).decode()
+        self.assertTrue(frame.startswith("event: progress") and '"progress": 10' in frame)
+
+        ScanJob.objects(scan_id="a").update_one(set__status="completed", set__progress=100)
+        notify()
+        frame = (await asyncio.wait_for(anext(stream), 2)).decode()
+        self.assertTrue(frame.startswith("event: done"))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertEqual(get_hub()._subscribers, {})
+
+    def test_missing_ids(self):
+        self.assertEqual(Client().get("/api/prowler/scan/events/").status_code, 400)
+
+
+class FindingsCachingTests(MongoTestCase):
+    """Tests for ETags, conditional GET and compression of findings."""
+
+    documents = (AWSScan, Finding)
+
+    def setUp(self):
+        from datetime import datetime
+
+        super().setUp()
+        self.scan = AWSScan(date=datetime.now(), storage="collection", findingsCount=50)
+        self.scan.save()
+        for i in range(50):
+            Finding(scan=self.scan.id, provider="AWS", status="FAIL", data={"Id": f"finding-{i}", "Title": "x" * 40}).save()
+
+    def test_scan_being_ingested_is_not_cached(self):
+        AWSScan.objects(id=self.scan.id).update_one(unset__findingsCount=True)
+        url = f"/api/prowler/AWSfinding/{self.scan.id}/"
+        resp = Client().get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(resp.has_header("ETag"))
+        self.assertEqual(resp["Cache-Control"], "no-cache")
+        self.assertEqual(Client().get(url, HTTP_IF_NONE_MATCH="*").status_code, 200)
+
+        AWSScan.objects(id=self.scan.id).update_one(set__findingsCount=50)
+        self.assertIn("immutable", Client().get(url)["Cache-Control"])
+
+    def test_conditional_get_returns_304(self):
+        url = f"/api/prowler/AWSfinding/{self.scan.id}/"
+        resp = Client().get(url)
+        etag = resp["ETag"]
+        self.assertIn("immutable", resp["Cache-Control"])
+        self.assertEqual(len(resp.json()["findings"]), 50)
+
+        resp = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp["ETag"], etag)
+        # Other query parameters are a different representation.
+        self.assertEqual(Client().get(url, {"limit": 5}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        AWSScan.objects(id=self.scan.id).update_one(inc__version=1)
+        self.assertEqual(Client().get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_latest_scan_must_revalidate(self):
+        resp = Client().get("/api/prowler/AWS_Scan/")
+        self.assertEqual(resp["Cache-Control"], "no-cache")
+        self.assertEqual(Client().get("/api/prowler/AWS_Scan/", HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+
+    def test_large_payloads_are_compressed(self):
+        import gzip
+        from . import caching
+
+        url = f"/api/prowler/AWSfinding/{self.scan.id}/"
+        with patch.object(caching, "brotli", None):
+            resp = Client().get(url, HTTP_ACCEPT_ENCODING="br;q=1.0, gzip;q=0.5")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        self.assertEqual(len(json.loads(gzip.decompress(resp.content))["findings"]), 50)
+        # The compressed variant still validates against the same findings.
+        self.assertEqual(Client().get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+
+        small = Client().get(url, {"limit": 1}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(small.has_header("Content-Encoding"))
+        self.assertEqual(
+            Client().get(url, HTTP_ACCEPT_ENCODING="gzip;q=0, identity").has_header("Content-Encoding"),
+            False,
+        )
+
+
+class CompressedStorageTests(MongoTestCase):
+    """Tests for compressed, dictionary-encoded findings storage."""
+
+    documents = (AWSScan, Finding, FindingChunk)
+
+    def _report(self, count):
+        findings = [
+            {
+                "AwsAccountId": "1",
+                "Id": f"f-{i}",
+                "GeneratorId": "prowler-s3_bucket_public",
+                "Severity": {"Label": "HIGH" if i % 2 else "LOW", "Normalized": 70},
+                "Compliance": {"Status": "FAILED" if i % 3 else "PASSED"},
+                "Resources": [{"Id": f"bucket-{i}"}],
+                **({"Note": None} if i == 0 else {}),
+            }
+            for i in range(count)
+        ]
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as tmp:
+            json.dump(findings, tmp)
+        self.addCleanup(os.remove, tmp.name)
+        return tmp.name, findings
+
+    def test_chunks_round_trip(self):
+        from .columnar import CODEC_ZLIB, decode_chunk, encode_chunk
+
+        rows = [{"a": "x", "n": 1.5, "b": [True, None, {"c": "x"}]}, {"d": {"e": "x"}, "a": "y"}]
+        payload, codec = encode_chunk(rows, CODEC_ZLIB)
+        self.assertEqual(decode_chunk(payload, codec), rows)
+        self.assertEqual(decode_chunk(payload, codec, keys={"a"}), [{"a": "x"}, {"a": "y"}])
+
+    @override_settings(FINDINGS_STORAGE="compressed", FINDINGS_CHUNK_SIZE=4)
+    def test_endpoints_read_compressed_scans(self):
+        from .ingest import ingest_aws
+
+        path, findings = self._report(10)
+        scan, count = ingest_aws(path, "us-east-1")
+        self.assertEqual((scan.storage, count), ("compressed", 10))
+        self.assertEqual(FindingChunk.objects(scan=scan.id).count(), 3)
+        self.assertFalse(Finding._get_collection().find_one({"scan": scan.id, "data": {"$exists": True}}))
+
+        resp = Client().get(f"/api/prowler/AWSfinding/{scan.id}/", {"status": "FAIL", "sort": "severity", "limit": 3})
+        self.assertEqual([f["Id"] for f in resp.json()["findings"]], ["f-1", "f-5", "f-7"])
+        resp = Client().get("/api/prowler/xls/", {"id": str(scan.id)})
+        self.assertEqual(resp.json()["findings"], findings)
+
+        other, _ = ingest_aws(self._report(12)[0], "us-east-1")
+        diff = Client().get("/api/prowler/scan/aws/diff/", {"base": str(scan.id), "head": str(other.id)}).json()
+        self.assertEqual(diff["counts"], {"new": 2, "resolved": 0, "unchanged": 10})
+        self.assertEqual({f["Id"] for f in diff["new"]}, {"f-10", "f-11"})
+
+    def _plain_updates(self):
+        """Point findings at their chunk with one ``update_one`` each.
+
+        mongomock's ``bulk_write`` rejects the ``UpdateOne`` requests
+        pymongo 4.19 builds, so the bulk path is not exercised here.
+        """
+        def point_to_chunk(collection, seq, batch):
+            for row, doc in enumerate(batch):
+                collection.update_one({"_id": doc["_id"]}, {"$set": {"chunk": seq, "row": row}})
+
+        return patch("cloudscan.management.commands.compress_findings.point_to_chunk", point_to_chunk)
+
+    def test_compress_findings_command(self):
+        from django.core.management import call_command
+        from .ingest import ingest_aws
+
+        path, findings = self._report(5)
+        scan, _ = ingest_aws(path, "us-east-1")
+        with self.settings(FINDINGS_CHUNK_SIZE=2), self._plain_updates():
+            call_command("compress_findings", stdout=io.StringIO())
+
+        scan.reload()
+        self.assertEqual((scan.storage, scan.version), ("compressed", 1))
+        self.assertEqual(FindingChunk.objects(scan=scan.id).count(), 3)
+        self.assertEqual(list(Finding.objects(scan=scan.id, chunk=2).scalar("row")), [0])
+        resp = Client().get(f"/api/prowler/AWSfinding/{scan.id}/")
+        self.assertEqual(resp.json()["findings"], findings)
+
+    def test_compress_findings_resumes_interrupted_run(self):
+        from django.core.management import call_command
+        from .columnar import write_chunk
+        from .ingest import ingest_aws
+
+        path, findings = self._report(5)
+        scan, _ = ingest_aws(path, "us-east-1")
+        ingesting, _ = ingest_aws(self._report(3)[0], "us-east-1")
+        AWSScan.objects(id=ingesting.id).update_one(unset__findingsCount=True)
+        # A run that died after chunking and unsetting the first two findings,
+        # and after writing the next chunk but before pointing findings at it.
+        collection = Finding._get_collection()
+        rows = list(collection.find({"scan": scan.id}).sort("_id", 1))
+        write_chunk(scan.id, 0, [row["data"] for row in rows[:2]])
+        write_chunk(scan.id, 1, [row["data"] for row in rows[2:4]])
+        for i, row in enumerate(rows[:2]):
+            collection.update_one({"_id": row["_id"]}, {"$set": {"chunk": 0, "row": i}, "$unset": {"data": ""}})
+
+        with self.settings(FINDINGS_CHUNK_SIZE=2), self._plain_updates():
+            call_command("compress_findings", stdout=io.StringIO())
+
+        self.assertEqual(sorted(FindingChunk.objects(scan=scan.id).scalar("seq")), [0, 1, 2])
+        self.assertEqual(Client().get(f"/api/prowler/AWSfinding/{scan.id}/").json()["findings"], findings)
+        self.assertEqual(AWSScan.objects.get(id=ingesting.id).storage, "collection")
+        self.assertEqual(FindingChunk.objects(scan=ingesting.id).count(), 0)
+
+
+class BenchmarkTests(MongoTestCase):
+    """Smoke tests for the synthetic-report benchmark suite."""
+
+    documents = (AWSScan, GCPScan, Finding)
+
+    def test_generated_reports_ingest(self):
+        from .benchmarks import write_asff, write_gcp_csv
+        from .ingest import ingest_aws, ingest_gcp
+
+        with tempfile.TemporaryDirectory() as tmp:
+            write_asff(os.path.join(tmp, "r.json"), 25)
+            write_gcp_csv(os.path.join(tmp, "r.csv"), 25)
+            _, aws_count = ingest_aws(os.path.join(tmp, "r.json"), "all")
+            gcp, gcp_count = ingest_gcp(os.path.join(tmp, "r.csv"))
+        self.assertEqual((aws_count, gcp_count), (25, 25))
+        self.assertEqual(gcp.projectId, "benchmark-project")
+
+    def test_run_reports_every_stage_and_cleans_up(self):
+        from .benchmarks import STAGES, compare, run_benchmarks
+
+        report = run_benchmarks([20], memory=False)
+        self.assertEqual([row["stage"] for row in report["results"]], list(STAGES))
+        self.assertEqual(AWSScan.objects.count() + GCPScan.objects.count() + Finding.objects.count(), 0)
+
+        slower = {"results": [dict(row, seconds=row["seconds"] * 2) for row in report["results"]]}
+        _, regressions = compare(slower, report, threshold=0.5)
+        self.assertEqual(len(regressions), len(STAGES))
+        _, regressions = compare(report, slower, threshold=0.5)
+        self.assertEqual(regressions, [])
+
+
+class MetricsTests(MongoTestCase):
+    """Tests for hot-path histograms and the Prometheus endpoint."""
+
+    documents = (AWSScan, Finding)
+
+    def setUp(self):
+        from . import metrics
+
+        super().setUp()
+        for metric in metrics.REGISTRY:
+            metric.clear()
+
+    def test_histogram_exposition(self):
+        from .metrics import Histogram, render
+
+        registry = []
+        hist = Histogram("demo_seconds", "Demo.", ["stage"], buckets=(1, 5), registry=registry)
+        hist.observe(0.5, stage='a"b')
+        hist.observe(3, stage='a"b')
+        lines = render(registry).splitlines()
+        self.assertEqual(lines[:2], ["# HELP demo_seconds Demo.", "# TYPE demo_seconds histogram"])
+        self.assertIn('demo_seconds_bucket{stage="a\\"b",le="1"} 1', lines)
+        self.assertIn('demo_seconds_bucket{stage="a\\"b",le="5"} 2', lines)
+        self.assertIn('demo_seconds_bucket{stage="a\\"b",le="+Inf"} 2', lines)
+        self.assertIn('demo_seconds_sum{stage="a\\"b"} 3.5', lines)
+        self.assertIn('demo_seconds_count{stage="a\\"b"} 2', lines)
+
+    def test_ingest_and_requests_are_measured(self):
+        from .ingest import store_findings
+
+        scan = AWSScan(provider="AWS", storage="collection").save()
+        store_findings(scan, [{"Id": str(i), "Severity": {"Label": "LOW"}} for i in range(3)])
+        Client().get(f"/api/prowler/AWSfinding/{scan.id}/")
+
+        resp = Client().get("/metrics/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = resp.content.decode()
+        self.assertIn('cloudscan_stage_duration_seconds_count{stage="parse"} 1', body)
+        self.assertIn('cloudscan_stage_duration_seconds_count{stage="save"} 1', body)
+        self.assertIn('cloudscan_stage_duration_seconds_count{stage="serialize"} 1', body)
+        self.assertIn('cloudscan_findings_per_scan_sum{provider="AWS"} 3', body)
+        self.assertIn(
+            'cloudscan_http_request_duration_seconds_count{method="GET",'
+            'route="api/prowler/AWSfinding/<str:scan_id>/",status="200"} 1',
+            body,
+        )
+
+    def test_mongo_listener_records_commands(self):
+        from types import SimpleNamespace
+        from .metrics import MONGO_SECONDS, MongoCommandListener
+
+        MongoCommandListener().succeeded(SimpleNamespace(duration_micros=1500, command_name="find"))
+        self.assertIn('cloudscan_mongo_command_duration_seconds_sum{command="find",outcome="ok"} 0.0015',
+                      "\n".join(MONGO_SECONDS.collect()))
+
+
+class _AsyncCursor:
+    """Async view of a mongomock cursor, shaped like pymongo's async cursors."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, count):
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.cursor)
+
+
+class _AsyncCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return _AsyncCursor(self.collection.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+    async def aggregate(self, pipeline):
+        return _AsyncCursor(self.collection.aggregate(pipeline))
+
+    async def count_documents(self, query):
+        return self.collection.count_documents(query)
+
+
+class _AsyncDatabase:
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, name):
+        return _AsyncCollection(self.db[name])
+
+
+class AsyncReadTests(MongoTestCase):
+    """The ``aio/`` endpoints answer like their sync counterparts."""
+
+    documents = (AWSScan, GCPScan, Finding, FindingChunk, ScanJob)
+
+    def setUp(self):
+        from datetime import datetime
+        from mongoengine.connection import get_db
+        from .ingest import store_findings
+
+        super().setUp()
+        patcher = patch("cloudscan.async_reads.get_database", return_value=_AsyncDatabase(get_db()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        raw = [
+            {"Id": str(i), "Severity": {"Label": ["HIGH", "LOW"][i % 2]}, "Compliance": {"Status": "FAILED"}}
+            for i in range(5)
+        ]
+        self.scan = AWSScan(provider="AWS", accountId="1", date=datetime(2024, 1, 2), storage="collection").save()
+        store_findings(self.scan, raw)
+        with override_settings(FINDINGS_CHUNK_SIZE=2):
+            self.packed = AWSScan(provider="AWS", accountId="2", date=datetime(2024, 1, 1), storage="compressed").save()
+            store_findings(self.packed, raw)
+
+    def _both(self, path):
+        sync = self.client.get(f"/api/prowler/{path}")
+        aio = self.client.get(f"/api/prowler/aio/{path}")
+        self.assertEqual(aio.status_code, sync.status_code)
+        self.assertEqual(aio.json(), sync.json())
+        return aio
+
+    def test_findings_pages_match_sync_views(self):
+        for scan in (self.scan, self.packed):
+            first = self._both(f"AWSfinding/{scan.id}/?limit=2&sort=severity").json()
+            self.assertEqual([f["Id"] for f in first["findings"]], ["0", "2"])
+            self._both(f"AWSfinding/{scan.id}/?limit=2&sort=severity&after={first['next']}")
+        self._both("AWS_Scan/?severity=low")
+        self._both("AWSfinding/nope/")
+        self._both(f"AWSfinding/{self.scan.id}/?sort=bogus")
+
+    def test_findings_etag_and_cache_headers(self):
+        resp = self.client.get(f"/api/prowler/aio/AWSfinding/{self.scan.id}/")
+        self.assertIn("immutable", resp["Cache-Control"])
+        again = self.client.get(f"/api/prowler/aio/AWSfinding/{self.scan.id}/", HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get("/api/prowler/aio/AWS_Scan/")["Cache-Control"], "no-cache")
+
+    def test_history_and_status_match_sync_views(self):
+        first = self._both("scanlist/history/?limit=1").json()
+        self.assertEqual(first["data"][0]["accountId"], "1")
+        self._both(f"scanlist/history/?limit=1&after={first['next']}")
+        self._both("GCPscanlist/history/")
+        ScanJob(scan_id="job-1", provider="AWS", status="running", progress=40, checks_done=4, checks_total=10).save()
+        self._both("scan/status/job-1/")
+        self._both("scan/status/missing/")
+
+    async def test_async_client(self):
+        from django.test import AsyncClient
+
+        resp = await AsyncClient().get(f"/api/prowler/aio/AWSfinding/{self.scan.id}/?limit=3")
+        self.assertEqual(len(resp.json()["findings"]), 3)
+
+    def test_one_pooled_client_per_event_loop(self):
+        import asyncio
+        from .asyncdb import get_client
+
+        async def clients():
+            return get_client(), get_client()
+
+        with override_settings(MONGODB_URI="mongodb://localhost:27017/testdb", ASYNC_MONGO_MAX_POOL_SIZE=7):
+            first, second = asyncio.run(clients())
+            other, _ = asyncio.run(clients())
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertEqual(first.options.pool_options.max_pool_size, 7)
+
+
+class IndexTests(MongoTestCase):
+    """Declared indexes serve every known query shape."""
+
+    db_name = "indexdb"
+
+    def setUp(self):
+        from mongoengine.connection import get_db
+        from .indexes import MODELS
+
+        for model in MODELS:
+            get_db().drop_collection(model._get_collection_name())
+
+    def test_serves(self):
+        from .indexes import serves, shape
+
+        history = shape(AWSScan, "history", ["accountId"], [("date", -1), ("_id", -1)])
+        self.assertTrue(serves((("accountId", 1), ("date", -1), ("_id", -1)), history))
+        self.assertTrue(serves((("accountId", 1), ("date", 1), ("_id", 1)), history))
+        self.assertFalse(serves((("accountId", 1), ("date", -1), ("_id", 1)), history))
+        self.assertFalse(serves((("date", -1), ("_id", -1)), history))
+        leases = shape(ScanJob, "leases", ["status"], ranges=["lease_expires_at"])
+        self.assertTrue(serves((("status", 1), ("lease_expires_at", 1)), leases))
+        self.assertFalse(serves((("status", 1),), leases))
+
+    def test_declared_indexes_cover_every_shape(self):
+        from .indexes import audit
+
+        for report in audit():
+            self.assertEqual(report["uncovered"], [], report["model"])
+            self.assertEqual([row["keys"] for row in report["unused"]], [], report["model"])
+
+    def test_command_builds_missing_and_reports_undeclared(self):
+        from django.core.management import CommandError, call_command
+        from mongoengine.connection import get_db
+
+        get_db()["scan_jobs"].create_index([("kind", 1)])
+        with self.assertRaises(CommandError):
+            call_command("ensure_indexes", "--check", stdout=io.StringIO())
+        out = io.StringIO()
+        call_command("ensure_indexes", stdout=out)
+        self.assertIn("AWSScan: built index (accountId asc, date desc, _id desc)", out.getvalue())
+        self.assertIn("unused: (kind asc) [kind_1]: serves no known query", out.getvalue())
+        call_command("ensure_indexes", "--check", stdout=io.StringIO())
+        self.assertIn("accountId_1_date_-1__id_-1", get_db()["a_w_s_scan"].index_information())
+
+
+class BackfillTests(MongoTestCase):
+    """Tests for importing report files from the output directory."""
+
+    documents = (AWSScan, GCPScan, Finding, ImportedReport)
+
+    def setUp(self):
+        from .benchmarks import write_asff, write_gcp_csv
+
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = self.tmp.name
+        write_asff(os.path.join(self.dir, "aws-scan-1700000000000.asff.json"), 10)
+        write_asff(os.path.join(self.dir, "aws-scan-1700000001000-0-eu-west-1.asff.json"), 4, seed=1)
+        write_gcp_csv(os.path.join(self.dir, "gcp-scan-1700000002000.csv"), 6)
+        # Same content under another name is imported once.
+        write_gcp_csv(os.path.join(self.dir, "gcp-scan-1700000003000.csv"), 6)
+        with open(os.path.join(self.dir, "aws-scan-1700000004000.asff.json"), "w") as f:
+            f.write("[{")
+        with open(os.path.join(self.dir, "notes.txt"), "w") as f:
+            f.write("ignored")
+
+    def test_imports_new_reports_once(self):
+        from datetime import datetime
+        from .backfill import backfill
+
+        # Workers write through their own client, which cannot reach an
+        # in-process mongomock database, so reports are imported inline.
+        stats = backfill(self.dir, workers=1)
+        self.assertEqual((stats["files"], stats["imported"], stats["skipped"], stats["failed"]), (5, 3, 1, 1))
+        self.assertEqual(stats["findings"], 20)
+        self.assertEqual(AWSScan.objects.count(), 2)
+        gcp = GCPScan.objects.get()
+        self.assertEqual((gcp.findingsCount, gcp.projectId), (6, "benchmark-project"))
+        self.assertEqual(gcp.date, datetime.fromtimestamp(1700000002))
+
+        again = backfill(self.dir, workers=1)
+        self.assertEqual((again.get("imported", 0), again["skipped"], again["failed"]), (0, 4, 1))
+        self.assertEqual(Finding.objects.count(), 20)
+
+    def test_shard_reports_merge_into_one_scan(self):
+        from .backfill import backfill
+        from .benchmarks import write_asff
+        from .ingest import iter_asff
+
+        paths = [os.path.join(self.dir, f"aws-scan-1700000005000-{shard}.asff.json") for shard in ("0-us-east-1", "1-eu-west-1")]
+        write_asff(paths[0], 5)
+        write_asff(paths[1], 7, seed=1)
+        ids = {finding["Id"] for path in paths for finding in iter_asff(path)}
+
+        stats = backfill(self.dir, workers=1, after=1700000004000)
+        self.assertEqual((stats["files"], stats["imported"]), (2, 2))
+        scan = AWSScan.objects.get()
+        self.assertEqual(scan.findingsCount, len(ids))
+        self.assertEqual(Finding.objects(scan=scan.id).count(), len(ids))
+        self.assertEqual(backfill(self.dir, workers=1, after=1700000004000)["skipped"], 2)
+
+    def test_failed_report_leaves_no_scan(self):
+        from .backfill import backfill
+
+        with self.settings(INGEST_BATCH_SIZE=1):
+            with open(os.path.join(self.dir, "aws-scan-1700000006000.asff.json"), "w") as f:
+                f.write('[{"Id": "a", "AwsAccountId": "1"}, {"Id": "b", ')
+            stats = backfill(self.dir, workers=1, after=1700000005000)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual((AWSScan.objects.count(), Finding.objects.count()), (0, 0))
+
+    def test_reports_ingested_by_scans_are_skipped(self):
+        from .backfill import backfill
+        from .ingest import ingest_gcp
+
+        ingest_gcp(os.path.join(self.dir, "gcp-scan-1700000002000.csv"))
+        stats = backfill(self.dir, workers=1, after=1700000000000)
+        self.assertEqual((stats["files"], stats["imported"], stats["skipped"]), (4, 1, 2))
+
+    def test_command_reports_throughput_and_failures(self):
+        from django.core.management import CommandError, call_command
+
+        out = io.StringIO()
+        call_command("backfill_reports", self.dir, "--dry-run", stdout=out)
+        self.assertIn("4 of 5 reports would be imported", out.getvalue())
+        self.assertEqual(AWSScan.objects.count(), 0)
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command("backfill_reports", self.dir, "--workers", "1", stdout=out)
+        self.assertIn("findings/s", out.getvalue())
+        self.assertIn("failed aws-scan-1700000004000.asff.json", out.getvalue())
+
+
+class FindingsCacheTests(MongoTestCase):
+    """Tests for the in-memory columnar findings cache, using numpy."""
+
+    numpy = True
+
+    documents = (GCPScan, Finding)
+
+    def setUp(self):
+        from . import findings_cache
+        from .findings_cache import FINDINGS_CACHE
+
+        if not self.numpy:
+            patcher = patch.object(findings_cache, "np", None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        elif findings_cache.np is None:
+            self.skipTest("numpy is not installed")
+        super().setUp()
+        FINDINGS_CACHE.clear()
+        self.addCleanup(FINDINGS_CACHE.clear)
+        self.client = Client()
+        self.rows = [
+            {
+                "CHECK_ID": f"check{i % 4}",
+                "SEVERITY": ("low", "critical", "high")[i % 3],
+                "STATUS": "FAIL" if i % 2 else "PASS",
+                "SERVICE_NAME": "iam" if i < 7 else "compute",
+                "RESOURCE_UID": f"r{i}",
+            }
+            for i in range(11)
+        ]
+
+    def _ingested_scan(self):
+        from .ingest import ingest_gcp
+
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False, newline="") as tmp:
+            writer = csv.DictWriter(tmp, fieldnames=list(self.rows[0]), delimiter=";")
+            writer.writeheader()
+            writer.writerows(self.rows)
+        self.addCleanup(os.remove, tmp.name)
+        scan, _ = ingest_gcp(tmp.name, "proj")
+        return GCPScan.objects.exclude("findings").get(id=scan.id)
+
+    def _scans(self):
+        scans = [self._ingested_scan()]
+        with self.settings(FINDINGS_STORAGE="compressed", FINDINGS_CHUNK_SIZE=4):
+            scans.append(self._ingested_scan())
+        legacy = GCPScan(projectId="proj", findings=self.rows).save()
+        scans.append(GCPScan.objects.exclude("findings").get(id=legacy.id))
+        return scans
+
+    def test_pages_match_the_database(self):
+        from .findings import page_cursor, page_findings
+        from .findings_cache import ScanColumns, scan_rows
+        from .models import DOCUMENT_STORAGES
+
+        cases = [
+            ({}, "id"),
+            ({"status": ["FAIL"]}, "id"),
+            ({}, "severity"),
+            ({"severity": ["critical", "high"], "service": ["iam"]}, "severity"),
+            ({"checkId": ["nope"]}, "id"),
+        ]
+        for scan in self._scans():
+            columns = ScanColumns(scan_rows(scan), positional=scan.storage not in DOCUMENT_STORAGES)
+            self.assertEqual(columns.count, 11)
+            for filters, sort in cases:
+                for limit in (None, 1, 4):
+                    after = None
+                    while True:
+                        expected = page_findings(scan, filters, limit, after, sort)
+                        actual = columns.page(filters, limit, page_cursor(sort, after), sort)
+                        self.assertEqual(actual, expected, (scan.storage, filters, sort, limit, after))
+                        after = expected[1]
+                        if not after:
+                            break
+
+    def test_admitted_on_second_request_and_evicted_over_budget(self):
+        from .findings_cache import FINDINGS_CACHE
+
+        first, second = self._ingested_scan(), self._ingested_scan()
+        self.client.get(f"/api/prowler/GCPfinding/{first.id}/", {"limit": 2})
+        self.assertEqual(len(FINDINGS_CACHE), 0)
+        resp = self.client.get(f"/api/prowler/GCPfinding/{first.id}/", {"limit": 2, "status": "FAIL"})
+        self.assertEqual([f["RESOURCE_UID"] for f in resp.json()["findings"]], ["r1", "r3"])
+        self.assertEqual(len(FINDINGS_CACHE), 1)
+
+        budget = FINDINGS_CACHE.get(first).nbytes + 1
+        with self.settings(FINDINGS_MEMORY_CACHE_BYTES=budget):
+            for _ in range(2):
+                self.client.get(f"/api/prowler/GCPfinding/{second.id}/", {"limit": 2})
+        self.assertIsNone(FINDINGS_CACHE.get(first))
+        self.assertIsNotNone(FINDINGS_CACHE.get(second))
+        self.assertLessEqual(FINDINGS_CACHE.nbytes, budget)
+
+        with self.settings(FINDINGS_MEMORY_CACHE_BYTES=0):
+            self.assertIsNone(FINDINGS_CACHE.load(first))
+
+    def test_concurrent_requests_share_one_load(self):
+        import threading
+        import time
+        from . import findings_cache
+        from .findings_cache import FINDINGS_CACHE
+
+        scan = self._ingested_scan()
+        self.assertIsNone(FINDINGS_CACHE.load(scan))
+        loads = []
+
+        def slow_rows(scan):
+            loads.append(scan.id)
+            time.sleep(0.05)
+            return scan_rows(scan)
+
+        scan_rows = findings_cache.scan_rows
+        results = []
+        with patch.object(findings_cache, "scan_rows", slow_rows):
+            threads = [threading.Thread(target=lambda: results.append(FINDINGS_CACHE.load(scan))) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(columns is results[0] for columns in results))
+        self.assertEqual(results[0].count, 11)
+
+    def test_oversize_scans_are_not_built(self):
+        from . import findings_cache
+        from .findings_cache import FINDINGS_CACHE
+
+        scan = self._ingested_scan()
+        with self.settings(FINDINGS_MEMORY_CACHE_BYTES=11 * findings_cache.MIN_FINDING_BYTES - 1):
+            with patch.object(findings_cache, "scan_rows") as rows:
+                for _ in range(3):
+                    self.assertIsNone(FINDINGS_CACHE.load(scan))
+        self.assertFalse(rows.called)
+
+        # Scans without a count stop loading once they outgrow the budget.
+        legacy = self._scans()[2]
+        with self.settings(FINDINGS_MEMORY_CACHE_BYTES=200):
+            for _ in range(3):
+                self.assertIsNone(FINDINGS_CACHE.load(legacy))
+            self.assertEqual(len(FINDINGS_CACHE), 0)
+        with self.assertRaises(findings_cache.TooLarge):
+            findings_cache.ScanColumns(findings_cache.scan_rows(legacy), positional=True, max_bytes=200)
+
+    def test_scans_being_ingested_are_not_cached(self):
+        from .findings_cache import FINDINGS_CACHE
+
+        scan = self._ingested_scan()
+        scan.findingsCount = None
+        for _ in range(3):
+            self.assertIsNone(FINDINGS_CACHE.load(scan))
+
+    def test_group_endpoint_with_and_without_cache(self):
+        from .findings_cache import FINDINGS_CACHE
+
+        scan = self._ingested_scan()
+        url = f"/api/prowler/GCPfinding/{scan.id}/groups/"
+        params = {"by": "checkId,severity", "status": "FAIL", "top": 2}
+        from_db = self.client.get(url, params).json()
+        self.assertEqual(len(FINDINGS_CACHE), 0)
+        from_cache = self.client.get(url, params).json()
+        self.assertEqual(len(FINDINGS_CACHE), 1)
+        self.assertEqual(from_cache, from_db)
+        self.assertEqual(from_db["total"], 5)
+        self.assertEqual(from_db["groups"], [
+            {"checkId": "check1", "severity": "critical", "count": 1},
+            {"checkId": "check1", "severity": "high", "count": 1},
+        ])
+        resp = self.client.get(url, {"by": "checkId", "status": "FAIL"})
+        self.assertEqual(resp.json()["groups"], [{"checkId": "check1", "count": 3}, {"checkId": "check3", "count": 2}])
+
+        legacy = self._scans()[2]
+        resp = self.client.get(f"/api/prowler/GCPfinding/{legacy.id}/groups/", {"by": "service"})
+        self.assertEqual(resp.json()["groups"], [{"service": "iam", "count": 7}, {"service": "compute", "count": 4}])
+        latest = self.client.get("/api/prowler/GCP_Scan/groups/", {"by": "status"}).json()
+        self.assertEqual(latest["total"], 11)
+        for params in ({}, {"by": "nope"}, {"by": "status", "top": "0"}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+
+class PurePythonFindingsCacheTests(FindingsCacheTests):
+    """The findings cache tests without numpy."""
+
+    numpy = False
+
+
+class SearchTests(MongoTestCase):
+    """Tests for the full-text search index and endpoint."""
+
+    documents = (AWSScan, GCPScan, Finding, SearchPosting)
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+
+    def _aws_scan(self, account="111122223333"):
+        from .ingest import ingest_aws
+
+        findings = [
+            {
+                "AwsAccountId": account,
+                "GeneratorId": "prowler-s3_bucket_public_access",
+                "Title": "Check if S3 buckets are public",
+                "Resources": [{"Id": "arn:aws:s3:::payroll-exports"}],
+            },
+            {
+                "AwsAccountId": account,
+                "GeneratorId": "prowler-iam_root_mfa_enabled",
+                "Title": "Ensure MFA is enabled for the root account",
+                "Description": "Protects the payroll administrators too.",
+                "Resources": [{"Id": "arn:aws:iam::111122223333:root"}],
+            },
+            {
+                "AwsAccountId": account,
+                "GeneratorId": "prowler-s3_bucket_versioning",
+                "Title": "Check S3 bucket versioning",
+                "Remediation": {"Recommendation": {"Text": "Enable versioning on payrolls buckets."}},
+                "Resources": [{"Id": "arn:aws:s3:::logs"}],
+            },
+        ]
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".asff.json", delete=False) as tmp:
+            json.dump(findings, tmp)
+        self.addCleanup(os.remove, tmp.name)
+        scan, _ = ingest_aws(tmp.name, "all")
+        return scan
+
+    def _gcp_scan(self):
+        from .ingest import ingest_gcp
+
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False, newline="") as tmp:
+            tmp.write("ACCOUNT_UID;CHECK_ID;CHECK_TITLE;RESOURCE_UID;STATUS\n")
+            tmp.write("proj;iam_sa_no_admin;Service accounts have no admin;payroll-sa@proj;FAIL\n")
+        self.addCleanup(os.remove, tmp.name)
+        scan, _ = ingest_gcp(tmp.name, "proj")
+        return scan
+
+    def _search(self, **params):
+        resp = self.client.get("/api/prowler/search/", params)
+        self.assertEqual(resp.status_code, 200, resp.content)
+        return resp.json()
+
+    def test_terms_are_ranked_by_field(self):
+        aws = self._aws_scan()
+        body = self._search(q="payroll", provider="aws")
+        self.assertIsNone(body["next"])
+        hits = body["hits"]
+        self.assertEqual([hit["resource"] for hit in hits], ["arn:aws:s3:::payroll-exports", "arn:aws:iam::111122223333:root"])
+        self.assertEqual(hits[0]["scanId"], str(aws.id))
+        self.assertEqual((hits[0]["checkId"], hits[0]["title"]), ("s3_bucket_public_access", "Check if S3 buckets are public"))
+        self.assertGreater(hits[0]["score"], hits[1]["score"])
+
+        prefixed = self._search(q="payroll*", provider="AWS")["hits"]
+        self.assertEqual(len(prefixed), 3)
+        self.assertEqual(prefixed[2]["resource"], "arn:aws:s3:::logs")
+        self.assertEqual([hit["resource"] for hit in self._search(q="s3 bucket logs")["hits"]], ["arn:aws:s3:::logs"])
+        self.assertEqual(self._search(q="nothing-like-this")["hits"], [])
+
+    def test_rarest_term_bounds_the_candidates(self):
+        self._aws_scan()
+        with self.settings(FINDINGS_SEARCH_MAX_CANDIDATES=1):
+            hits = self._search(q="s3 bucket* logs")["hits"]
+            self.assertEqual([hit["resource"] for hit in hits], ["arn:aws:s3:::logs"])
+            resp = self.client.get("/api/prowler/search/", {"q": "s3*"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("more than 1 findings", resp.json()["error"])
+
+    def test_scopes_and_storages(self):
+        first = self._aws_scan()
+        with self.settings(FINDINGS_STORAGE="compressed"):
+            second = self._aws_scan(account="999988887777")
+        gcp = self._gcp_scan()
+
+        self.assertEqual(len(self._search(q="payroll*")["hits"]), 7)
+        self.assertEqual(len(self._search(q="payroll*", provider="GCP")["hits"]), 1)
+        by_scan = self._search(q="payroll*", scanId=str(second.id))["hits"]
+        self.assertEqual({hit["scanId"] for hit in by_scan}, {str(second.id)})
+        self.assertEqual(by_scan[0]["resource"], "arn:aws:s3:::payroll-exports")
+        by_account = self._search(q="payroll*", accountId="111122223333")["hits"]
+        self.assertEqual({hit["scanId"] for hit in by_account}, {str(first.id)})
+        self.assertEqual(self._search(q="payroll", scanId=str(gcp.id))["hits"][0]["resource"], "payroll-sa@proj")
+
+    def test_pagination_and_errors(self):
+        self._aws_scan()
+        self._aws_scan()
+        everything = self._search(q="payroll*")["hits"]
+        walked, after = [], None
+        while True:
+            body = self._search(q="payroll*", limit=2, **({"after": after} if after else {}))
+            walked += body["hits"]
+            after = body["next"]
+            if not after:
+                break
+        self.assertEqual(walked, everything)
+        self.assertEqual(len(everything), 6)
+
+        for params in (
+            {}, {"q": "  "}, {"q": "payroll", "after": "garbage"}, {"q": "x", "provider": "azure"}, {"q": "s*"},
+        ):
+            self.assertEqual(self.client.get("/api/prowler/search/", params).status_code, 400, params)
+        resp = self.client.get("/api/prowler/search/", {"q": "payroll", "scanId": "64b000000000000000000000"})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_build_search_index_command(self):
+        from django.core.management import call_command
+
+        with self.settings(FINDINGS_SEARCH_INDEX=False):
+            scan = self._aws_scan()
+        self.assertEqual(self._search(q="payroll")["hits"], [])
+        out = io.StringIO()
+        call_command("build_search_index", stdout=out)
+        self.assertIn(f"{scan.id}: 3 findings", out.getvalue())
+        self.assertEqual(len(self._search(q="payroll")["hits"]), 2)
+        out = io.StringIO()
+        call_command("build_search_index", stdout=out)
+        self.assertIn("Indexed 0 AWSScan documents", out.getvalue())
+
+
+@override_settings(SCAN_EXECUTOR_AUTOSTART=False, SCAN_EVENTS_POLL_SECONDS=0.01)
+class CoalesceTests(MongoTestCase):
+    """Tests for single-flight coalescing of identical scan requests."""
+
+    documents = (ScanJob, ScanFlight, GCPScan, Finding)
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+
+    def _key(self, content="{}"):
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as tmp_key:
+            tmp_key.write(content)
+        self.addCleanup(lambda: os.path.exists(tmp_key.name) and os.remove(tmp_key.name))
+        return tmp_key.name
+
+    def test_flight_key_normalizes_parameters(self):
+        from .coalesce import flight_key
+
+        key = flight_key("AWS", "AKIA1", None, "s3_b, iam_a")
+        self.assertEqual(key, flight_key("aws", " AKIA1 ", "ALL", ["iam_a", "s3_b", "iam_a"]))
+        self.assertEqual(key, flight_key("AWS", "AKIA1", "all", "iam_a,s3_b", sharding=None))
+        self.assertNotEqual(key, flight_key("AWS", "AKIA2", None, "s3_b, iam_a"))
+        self.assertNotEqual(key, flight_key("AWS", "AKIA1", "eu-west-1", "s3_b, iam_a"))
+        self.assertNotEqual(key, flight_key("AWS", "AKIA1", None, "s3_b, iam_a", incremental={"services": ["s3"]}))
+        self.assertNotEqual(flight_key("GCP", "proj"), flight_key("GCP", "proj", group="cis"))
+
+    def test_async_requests_join_the_queued_job(self):
+        from . import views
+
+        views.TEMP_KEYS["k1"] = first_key = self._key()
+        views.TEMP_KEYS["k2"] = second_key = self._key()
+        first = self.client.post("/api/prowler/scan/async/gcp/", {"keyId": "k1", "projectId": "proj"}).json()
+        second = self.client.post(
+            "/api/prowler/scan/async/gcp/", {"keyId": "k2", "projectId": "proj", "force": "true"}
+        ).json()
+
+        self.assertEqual(second, {"scan_id": first["scan_id"], "coalesced": True})
+        self.assertFalse(first["coalesced"])
+        self.assertEqual(ScanJob.objects.count(), 1)
+        self.assertTrue(os.path.exists(first_key))
+        self.assertFalse(os.path.exists(second_key))
+
+        views.TEMP_KEYS["k3"] = self._key()
+        other = self.client.post("/api/prowler/scan/async/gcp/", {"keyId": "k3", "projectId": "other"}).json()
+        self.assertNotEqual(other["scan_id"], first["scan_id"])
+
+    def test_async_aws_join_writes_no_credentials(self):
+        data = {"accessKey": "AKIA1", "secretKey": "s", "region": "us-east-1", "checks": "a,b"}
+        first = self.client.post("/api/prowler/scan/async/aws/", data).json()
+        second = self.client.post("/api/prowler/scan/async/aws/", dict(data, checks="b, a")).json()
+
+        self.assertEqual(second, {"scan_id": first["scan_id"], "coalesced": True})
+        job = ScanJob.objects.get()
+        self.addCleanup(os.remove, job.params["credentials_path"])
+        self.assertEqual(job.scan_id, first["scan_id"])
+
+    def test_fresh_results_are_reused_until_forced_or_expired(self):
+        from datetime import datetime, timedelta
+        from .coalesce import run_coalesced
+
+        calls = []
+
+        def run():
+            calls.append(1)
+            return {"scanId": f"scan{len(calls)}", "findingsCount": 3}
+
+        result, joined = run_coalesced("key", "AWS", run)
+        self.assertEqual((result, joined), ({"scanId": "scan1", "findingsCount": 3}, False))
+        self.assertEqual(run_coalesced("key", "AWS", run), (result, True))
+        self.assertEqual(run_coalesced("key", "AWS", run, force=True)[0]["scanId"], "scan2")
+
+        ScanJob.objects.update(set__updated_at=datetime.utcnow() - timedelta(minutes=10))
+        self.assertEqual(run_coalesced("key", "AWS", run), ({"scanId": "scan3", "findingsCount": 3}, False))
+        with self.settings(SCAN_COALESCE_FRESH_SECONDS=0):
+            self.assertFalse(run_coalesced("key", "AWS", run)[1])
+        self.assertEqual(len(calls), 4)
+
+    def test_sync_request_waits_for_the_running_scan(self):
+        import threading
+        from .coalesce import claim, run_coalesced
+
+        self.assertIsNone(claim("key", "GCP", "job1"))
+        ScanJob(scan_id="job1", provider="GCP", status="running").save()
+
+        def finish():
+            ScanJob.objects(scan_id="job1").update_one(set__status="completed", set__result={"scanId": "s1"})
+
+        timer = threading.Timer(0.05, finish)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        result, joined = run_coalesced("key", "GCP", lambda: self.fail("scan ran twice"))
+        self.assertEqual((result, joined), ({"scanId": "s1"}, True))
+
+    def test_failed_and_stale_flights_are_replaced(self):
+        from datetime import datetime, timedelta
+        from .coalesce import claim, run_coalesced
+
+        with self.assertRaisesMessage(RuntimeError, "boom"):
+            run_coalesced("key", "GCP", lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+        self.assertEqual(ScanJob.objects.get().status, "error")
+        self.assertIsNone(claim("key", "GCP", "job2"))
+
+        # A sync scan that stopped updating its job is considered dead.
+        ScanJob(scan_id="job2", provider="GCP", status="running").save()
+        self.assertEqual(claim("key", "GCP", "job3"), "job2")
+        ScanJob.objects(scan_id="job2").update_one(set__updated_at=datetime.utcnow() - timedelta(hours=4))
+        self.assertIsNone(claim("key", "GCP", "job3"))
+        # Unless a queue worker holds it: expired leases are requeued instead.
+        ScanJob(scan_id="job3", provider="GCP", status="running", kind="gcp_scan",
+                updated_at=datetime.utcnow() - timedelta(hours=4)).save()
+        self.assertEqual(claim("key", "GCP", "job4"), "job3")
+
+    def test_gcp_requests_with_different_keys_do_not_coalesce(self):
+        from .coalesce import key_fingerprint
+
+        alice = json.dumps({"client_email": "alice@a.iam.gserviceaccount.com", "private_key_id": "1"})
+        bob = json.dumps({"client_email": "bob@b.iam.gserviceaccount.com", "private_key_id": "2"})
+        self.assertEqual(key_fingerprint(self._key(alice)), key_fingerprint(self._key(alice + "\n")))
+        self.assertNotEqual(key_fingerprint(self._key(alice)), key_fingerprint(self._key(bob)))
+
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".csv", delete=False) as tmp_csv:
+            tmp_csv.write("ACCOUNT_UID;REGION\nid;region\n")
+        self.addCleanup(os.remove, tmp_csv.name)
+
+        def scan(content):
+            upload = SimpleUploadedFile("key.json", content.encode(), content_type="application/json")
+            return self.client.post("/api/prowler/scan/gcp/", {"keyFile": upload}).json()
+
+        with patch("cloudscan.views.run_prowler_gcp", return_value=tmp_csv.name) as mock_run:
+            first, second, third = scan(alice), scan(bob), scan(alice)
+        self.assertEqual(mock_run.call_count, 2)
+        self.assertNotEqual(first["scanId"], second["scanId"])
+        self.assertFalse(second["coalesced"])
+        self.assertEqual((third["scanId"], third["coalesced"]), (first["scanId"], True))
+
+    def test_joined_requests_keep_the_joined_jobs_key(self):
+        from .coalesce import discard_key
+
+        first_key = self._key()
+        ScanJob(scan_id="key1", provider="GCP", status="uploaded", result={"key_path": first_key}).save()
+        data = {"keyId": "key1", "projectId": "proj"}
+        scan_id = self.client.post("/api/prowler/scan/async/gcp/db/", data).json()["scan_id"]
+
+        # The upload is consumed, so a retry cannot delete the job's key.
+        self.assertEqual(self.client.post("/api/prowler/scan/async/gcp/db/", data).status_code, 400)
+        discard_key(first_key, scan_id)
+        self.assertTrue(os.path.exists(first_key))
+
+        second_key = self._key()
+        ScanJob(scan_id="key2", provider="GCP", status="uploaded", result={"key_path": second_key}).save()
+        body = self.client.post("/api/prowler/scan/async/gcp/db/", dict(data, keyId="key2")).json()
+        self.assertEqual(body, {"scan_id": scan_id, "coalesced": True})
+        self.assertFalse(os.path.exists(second_key))
+        discard_key(second_key, scan_id)  # Already gone.
@@ -5,6 +5,7 @@ from .views import (
     prowler_scan_gcp,
     prowler_scan_aws,
     scan_status,
+    scan_events,
     api_prowler_scanlist,
     api_prowler_gcp_scanlist,
     LatestAWSFindings,
@@ -13,14 +14,23 @@ from .views import (
     GCPFinding,
     AWSScanHistory,
     GCPScanHistory,
+    AWSScanDiff,
+    GCPScanDiff,
+    AWSScanSummary,
+    GCPScanSummary,
+    AWSFindingGroups,
+    GCPFindingGroups,
+    FindingSearch,
     AWSScanFindingsExcel,
     GCPScanFindingsExcel,
     upload_gcp_key,
     home,
 )
+from . import async_reads
 from .async_views import (
     UploadKeyView,
     StartGCPScanView,
+    StartGCPMultiScanView,
     JobStatusView,
     JobHistoryView,
 )
@@ -39,9 +49,11 @@ urlpatterns = [
     path('scan/async/gcp/', prowler_scan_gcp, name='prowler-scan-gcp'),
     path('scan/async/aws/', prowler_scan_aws, name='prowler-scan-aws'),
     path('scan/async/gcp/db/', StartGCPScanView.as_view(), name='scan-gcp-db'),
+    path('scan/async/gcp/multi/', StartGCPMultiScanView.as_view(), name='scan-gcp-multi'),
 
     # Scan status (for progress polling)
     path('scan/status/<str:scan_id>/', scan_status, name='scan-status'),
+    path('scan/events/', scan_events, name='scan-events'),
     path('scan/status/db/<str:scan_id>/', JobStatusView.as_view(), name='scan-status-db'),
 
     # Scanlists
@@ -54,8 +66,28 @@ urlpatterns = [
     path('GCP_Scan/', LatestGCPFindings.as_view(), name='gcp-latest'),
     path('AWSfinding/<str:scan_id>/', AWSFinding.as_view(), name='aws-finding'),
     path('GCPfinding/<str:scan_id>/', GCPFinding.as_view(), name='gcp-finding'),
+    path('AWS_Scan/summary/', AWSScanSummary.as_view(), name='aws-latest-summary'),
+    path('GCP_Scan/summary/', GCPScanSummary.as_view(), name='gcp-latest-summary'),
+    path('AWSfinding/<str:scan_id>/summary/', AWSScanSummary.as_view(), name='aws-summary'),
+    path('GCPfinding/<str:scan_id>/summary/', GCPScanSummary.as_view(), name='gcp-summary'),
+    path('AWS_Scan/groups/', AWSFindingGroups.as_view(), name='aws-latest-groups'),
+    path('GCP_Scan/groups/', GCPFindingGroups.as_view(), name='gcp-latest-groups'),
+    path('AWSfinding/<str:scan_id>/groups/', AWSFindingGroups.as_view(), name='aws-groups'),
+    path('GCPfinding/<str:scan_id>/groups/', GCPFindingGroups.as_view(), name='gcp-groups'),
     path('scanlist/history/', AWSScanHistory.as_view(), name='aws-scan-history'),
     path('GCPscanlist/history/', GCPScanHistory.as_view(), name='gcp-scan-history'),
+    path('scan/aws/diff/', AWSScanDiff.as_view(), name='aws-scan-diff'),
+    path('scan/gcp/diff/', GCPScanDiff.as_view(), name='gcp-scan-diff'),
+    path('search/', FindingSearch.as_view(), name='finding-search'),
+
+    # Async (ASGI) versions of the dashboard reads
+    path('aio/AWS_Scan/', async_reads.latest_aws_findings, name='aio-aws-latest'),
+    path('aio/GCP_Scan/', async_reads.latest_gcp_findings, name='aio-gcp-latest'),
+    path('aio/AWSfinding/<str:scan_id>/', async_reads.aws_findings, name='aio-aws-finding'),
+    path('aio/GCPfinding/<str:scan_id>/', async_reads.gcp_findings, name='aio-gcp-finding'),
+    path('aio/scanlist/history/', async_reads.aws_scan_history, name='aio-aws-scan-history'),
+    path('aio/GCPscanlist/history/', async_reads.gcp_scan_history, name='aio-gcp-scan-history'),
+    path('aio/scan/status/<str:scan_id>/', async_reads.scan_status, name='aio-scan-status'),
 
     # Excel downloads
     path('xls/', AWSScanFindingsExcel.as_view(), name='aws-xls'),
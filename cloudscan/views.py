@@ -2,40 +2,80 @@ import json
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .prowler_runner import run_prowler_aws, run_prowler_gcp
-from .models import AWSScan, GCPScan
-from datetime import datetime
-import csv
+from .prowler_runner import run_prowler_aws, run_prowler_aws_sharded, run_prowler_gcp, service_checks
+from .models import AWSScan, GCPScan, ScanJob
+from .ingest import ingest_aws, ingest_gcp
+from .findings import SCAN_MODELS, get_scan, load_findings, page_size, parse_filters, parse_group_by
+from .findings_cache import FINDINGS_CACHE, cached_page
+from .export import FORMATS, export_response, parse_columns
+from .history import scan_history
+from .diff import CHANGES, diff_scans
+from .summary import group_counts, group_rows, scan_summary
+from .search import DEFAULT_PAGE_SIZE, search
+from .events import get_hub
+from .caching import cached_json_response, findings_etag, not_modified, not_modified_response
+from .executor import COMPLETED, ERROR, HOST, enqueue
+from .coalesce import claim, discard_key, enqueue_coalesced, flight_key, key_fingerprint, run_coalesced
+from .incremental import rescan
+from .gcp_projects import fetch_project_ids
+import asyncio
 import os
 import tempfile
-import subprocess
+import time
 from uuid import uuid4
-from threading import Thread
-from time import sleep
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
-# In-memory store for async scan progress and results
-SCAN_JOBS = {}
 # Temporary storage mapping key IDs to uploaded service account files
 TEMP_KEYS = {}
 
-def fetch_project_ids(key_path):
-    import os, subprocess, json
-    env = os.environ.copy()
-    env["GOOGLE_APPLICATION_CREDENTIALS"] = key_path
-    result = subprocess.run(
-        ["gcloud", "projects", "list", "--format=json"],
-        capture_output=True,
-        text=True,
-        env=env,
-    )
-    if result.returncode != 0:
-        raise Exception(result.stderr.strip())
-    data = json.loads(result.stdout)
-    return [p.get("projectId") for p in data]
+
+def _truthy(value):
+    return str(value or "").lower() in ("1", "true", "yes", "on")
+
+
+def _is_asgi(request):
+    """Return whether a Django or DRF request came through an ASGI server."""
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+def _sharding_params(data):
+    """Return ``run_prowler_aws_sharded`` options, or ``None`` if not sharded.
+
+    ``sharded`` enables region sharding, ``services`` (comma-separated) also
+    splits by service and ``parallelism`` caps concurrent Prowler processes.
+    Service shards only run the ``checks`` of their service.
+    """
+    if not _truthy(data.get("sharded")):
+        return None
+    services = [svc.strip() for svc in (data.get("services") or "").split(",") if svc.strip()]
+    if services and data.get("checks") and not service_checks(data.get("checks"), services):
+        raise ValueError("None of the checks belong to the requested services")
+    parallelism = data.get("parallelism")
+    if parallelism not in (None, ""):
+        try:
+            parallelism = int(parallelism)
+        except (TypeError, ValueError) as exc:
+            raise ValueError("parallelism must be an integer") from exc
+        if parallelism < 1:
+            raise ValueError("parallelism must be positive")
+    return {"services": services or None, "parallelism": parallelism or None}
 
 
+def _incremental_params(data):
+    """Return incremental rescan options, or ``None`` for a full scan.
+
+    ``incremental`` enables reuse of the previous scan's fresh checks;
+    ``baseScanId`` picks that scan explicitly and ``services``
+    (comma-separated) forces their checks to be rerun.
+    """
+    if not _truthy(data.get("incremental")):
+        return None
+    services = [svc.strip() for svc in (data.get("services") or "").split(",") if svc.strip()]
+    return {"base_scan_id": data.get("baseScanId") or None, "services": services or None}
+
 
 class ScanAWS(APIView):
     def post(self, request):
@@ -46,18 +86,47 @@ class ScanAWS(APIView):
         if not access_key or not secret_key:
             return Response({"error": "Missing AWS credentials"}, status=400)
         try:
-            json_path = run_prowler_aws(access_key, secret_key, region, checks=checks)
-            with open(json_path) as f:
-                findings = json.load(f)
-            scan = AWSScan(
-                date=datetime.now(),
-                provider="AWS",
-                accountId=findings[0].get("AwsAccountId", "unknown"),
-                region=region,
-                findings=findings
-            )
-            scan.save()
-            return Response({"message": "✅ AWS Scan completed", "findingsCount": len(findings), "scanId": str(scan.id)})
+            sharding = _sharding_params(request.data)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        incremental = _incremental_params(request.data)
+        if incremental and sharding:
+            return Response({"error": "Incremental scans cannot be sharded"}, status=400)
+        key = flight_key(
+            "AWS", access_key, region, checks,
+            sharding=sharding, incremental=incremental, accountId=request.data.get("accountId"),
+        )
+
+        def run_scan():
+            info = None
+            if sharding:
+                json_paths, errors = run_prowler_aws_sharded(
+                    access_key, secret_key, region, checks=checks, **sharding
+                )
+                scan, count = ingest_aws(json_paths, region, shard_errors=errors)
+            elif incremental:
+                def run(run_checks):
+                    return ingest_aws(run_prowler_aws(access_key, secret_key, region, checks=run_checks), region)
+
+                scan, count, info = rescan(
+                    AWSScan, run, checks, **incremental,
+                    accountId=request.data.get("accountId"), region=region,
+                )
+            else:
+                json_path = run_prowler_aws(access_key, secret_key, region, checks=checks)
+                scan, count = ingest_aws(json_path, region)
+            return {
+                "findingsCount": count,
+                "scanId": str(scan.id),
+                "failedShards": scan.shardErrors,
+                "incremental": info,
+            }
+
+        try:
+            result, joined = run_coalesced(key, "AWS", run_scan, force=_truthy(request.data.get("force")))
+            return Response({"message": "✅ AWS Scan completed", **result, "coalesced": joined})
+        except LookupError as e:
+            return Response({"error": str(e)}, status=404)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
@@ -80,25 +149,33 @@ class ScanGCP(APIView):
                 gcp_key_path = temp_key.name
             temp_key_created = True
 
-        try:
+        def run(run_checks):
             csv_path = run_prowler_gcp(
-                gcp_key_path, checks=checks, group=group, project_id=project_id
+                gcp_key_path, checks=run_checks, group=group, project_id=project_id
+            )
+            return ingest_gcp(csv_path, project_id)
+
+        incremental = _incremental_params(request.data)
+
+        def run_scan():
+            info = None
+            if incremental:
+                scan, count, info = rescan(GCPScan, run, checks, **incremental, projectId=project_id)
+            else:
+                scan, count = run(checks)
+            return {"findingsCount": count, "scanId": str(scan.id), "incremental": info}
+
+        try:
+            key = flight_key(
+                "GCP", project_id, checks=checks, group=group,
+                credential=key_fingerprint(gcp_key_path), incremental=incremental,
             )
-            findings = []
-            with open(csv_path, newline='') as csvfile:
-                reader = csv.DictReader(csvfile, delimiter=';')
-                for row in reader:
-                    findings.append(row)
-            scan = GCPScan(
-                date=datetime.now(),
-                provider="GCP",
-                accountId=findings[0].get("ACCOUNT_UID", "unknown"),
-                projectId=findings[0].get("PROJECT_ID", project_id or "unknown"),
-                region=findings[0].get("REGION", "global"),
-                findings=findings
+            result, joined = run_coalesced(
+                key, "GCP", run_scan, project_id=project_id, force=_truthy(request.data.get("force"))
             )
-            scan.save()
-            return Response({"message": "✅ GCP Scan completed", "findingsCount": len(findings), "scanId": str(scan.id)})
+            return Response({"message": "✅ GCP Scan completed", **result, "coalesced": joined})
+        except LookupError as e:
+            return Response({"error": str(e)}, status=404)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
         finally:
@@ -157,31 +234,33 @@ def scan_gcp(request):
     elif key_id:
         remove_after = True
 
-    try:
+    def run(run_checks):
         csv_path = run_prowler_gcp(
-            gcp_key_path, checks=checks, group=group, project_id=project_id
+            gcp_key_path, checks=run_checks, group=group, project_id=project_id
         )
-        findings = []
-        with open(csv_path, newline="") as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=";")
-            for row in reader:
-                findings.append(row)
-        scan = GCPScan(
-            date=datetime.now(),
-            provider="GCP",
-            accountId=findings[0].get("ACCOUNT_UID", "unknown"),
-            projectId=findings[0].get("PROJECT_ID", project_id or "unknown"),
-            region=findings[0].get("REGION", "global"),
-            findings=findings,
+        return ingest_gcp(csv_path, project_id)
+
+    incremental = _incremental_params(request.POST)
+
+    def run_scan():
+        info = None
+        if incremental:
+            scan, count, info = rescan(GCPScan, run, checks, **incremental, projectId=project_id)
+        else:
+            scan, count = run(checks)
+        return {"findingsCount": count, "scanId": str(scan.id), "incremental": info}
+
+    try:
+        key = flight_key(
+            "GCP", project_id, checks=checks, group=group,
+            credential=key_fingerprint(gcp_key_path), incremental=incremental,
         )
-        scan.save()
-        return JsonResponse(
-            {
-                "message": "✅ GCP Scan completed",
-                "findingsCount": len(findings),
-                "scanId": str(scan.id),
-            }
+        result, joined = run_coalesced(
+            key, "GCP", run_scan, project_id=project_id, force=_truthy(request.POST.get("force"))
         )
+        return JsonResponse({"message": "✅ GCP Scan completed", **result, "coalesced": joined})
+    except LookupError as e:
+        return JsonResponse({"error": str(e)}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
     finally:
@@ -197,132 +276,360 @@ def home(request):
 
 # Additional API views used by the React frontend
 
+def findings_cache_control(immutable):
+    if immutable:
+        return f"private, max-age={settings.FINDINGS_CACHE_SECONDS}, immutable"
+    return "no-cache"
+
+
+def _findings_page(request, scan, immutable=True):
+    """Return one page of ``scan``'s findings honouring the query parameters.
+
+    Supports ``limit``/``after`` cursor pagination, ``sort`` (``id`` or
+    ``severity``) and comma-separated ``severity``, ``status``, ``service``,
+    ``region`` and ``checkId`` filters. Without ``limit`` every matching
+    finding is returned.
+
+    Responses carry an ETag and are answered with 304 when it still matches.
+    ``immutable`` pages (a scan requested by ID) may also be cached by the
+    client; the latest-scan endpoints must revalidate, as must every page
+    of a scan still being ingested.
+    """
+    params = request.query_params
+    etag = findings_etag(scan, params)
+    cache_control = findings_cache_control(immutable and etag is not None)
+    if not_modified(request, etag):
+        return not_modified_response(etag, cache_control)
+    try:
+        findings, next_cursor = cached_page(
+            scan,
+            parse_filters(params),
+            limit=page_size(params.get("limit")),
+            after=params.get("after"),
+            sort=params.get("sort", "id"),
+        )
+    except ValueError as exc:
+        return Response({"error": str(exc)}, status=400)
+    return cached_json_response(request, {"findings": findings, "next": next_cursor}, etag, cache_control)
+
+
 class LatestAWSFindings(APIView):
     """Return findings from the most recent AWS scan."""
 
     def get(self, request):
-        scan = AWSScan.objects.order_by('-date').first()
+        scan = AWSScan.objects.exclude("findings").order_by('-date').first()
         if not scan:
-            return Response({"findings": []})
-        return Response({"findings": scan.findings})
+            return Response({"findings": [], "next": None})
+        return _findings_page(request, scan, immutable=False)
 
 
 class LatestGCPFindings(APIView):
     """Return findings from the most recent GCP scan."""
 
     def get(self, request):
-        scan = GCPScan.objects.order_by('-date').first()
+        scan = GCPScan.objects.exclude("findings").order_by('-date').first()
         if not scan:
-            return Response({"findings": []})
-        return Response({"findings": scan.findings})
+            return Response({"findings": [], "next": None})
+        return _findings_page(request, scan, immutable=False)
 
 
 class AWSFinding(APIView):
     """Return findings for a specific AWS scan."""
 
     def get(self, request, scan_id):
-        try:
-            scan = AWSScan.objects.get(id=scan_id)
-        except AWSScan.DoesNotExist:
+        scan = get_scan(AWSScan, id=scan_id)
+        if not scan:
             return Response({"error": "Scan not found"}, status=404)
-        return Response({"findings": scan.findings})
+        return _findings_page(request, scan)
 
 
 class GCPFinding(APIView):
     """Return findings for a specific GCP scan."""
 
     def get(self, request, scan_id):
-        try:
-            scan = GCPScan.objects.get(id=scan_id)
-        except GCPScan.DoesNotExist:
+        scan = get_scan(GCPScan, id=scan_id)
+        if not scan:
             return Response({"error": "Scan not found"}, status=404)
-        return Response({"findings": scan.findings})
+        return _findings_page(request, scan)
+
+
+def _summary(model, scan_id=None):
+    """Return the stored rollups of a scan, or of the latest one."""
+    if scan_id:
+        scan = get_scan(model, id=scan_id)
+        if not scan:
+            return Response({"error": "Scan not found"}, status=404)
+    else:
+        scan = model.objects.exclude("findings").order_by('-date').first()
+        if not scan:
+            return Response({"scanId": None, "summary": None})
+    return Response({"scanId": str(scan.id), "summary": scan_summary(scan)})
+
+
+def _finding_groups(request, model, scan_id=None):
+    """Count a scan's findings per ``by`` fields, largest groups first.
+
+    ``by`` is a comma-separated list of ``severity``, ``status``,
+    ``service``, ``region`` and ``checkId``; the findings filters apply
+    and ``top`` keeps only the largest groups. Answered from
+    ``FINDINGS_CACHE`` when the scan is loaded there.
+    """
+    params = request.query_params
+    try:
+        by = parse_group_by(params.get("by"))
+        top = page_size(params.get("top"))
+    except ValueError as exc:
+        return Response({"error": str(exc)}, status=400)
+    if scan_id:
+        scan = get_scan(model, id=scan_id)
+        if not scan:
+            return Response({"error": "Scan not found"}, status=404)
+    else:
+        scan = model.objects.exclude("findings").order_by('-date').first()
+        if not scan:
+            return Response({"scanId": None, "total": 0, "groups": []})
+    filters = parse_filters(params)
+    columns = FINDINGS_CACHE.load(scan)
+    counts = columns.group_counts(by, filters) if columns else group_counts(scan, by, filters)
+    groups = group_rows(by, counts)
+    return Response({
+        "scanId": str(scan.id),
+        "total": sum(counts.values()),
+        "groups": groups[:top] if top else groups,
+    })
+
+
+class AWSFindingGroups(APIView):
+    """Return AWS finding counts grouped by the ``by`` fields."""
+
+    def get(self, request, scan_id=None):
+        return _finding_groups(request, AWSScan, scan_id)
+
+
+class GCPFindingGroups(APIView):
+    """Return GCP finding counts grouped by the ``by`` fields."""
+
+    def get(self, request, scan_id=None):
+        return _finding_groups(request, GCPScan, scan_id)
+
+
+class FindingSearch(APIView):
+    """Search finding resource IDs, titles, descriptions and remediation.
+
+    ``q`` holds the words to match; ``word*`` matches by prefix. Results can
+    be narrowed with ``scanId``, ``accountId`` and ``provider``, and are
+    paginated with ``limit`` (default ``DEFAULT_PAGE_SIZE``) and ``after``.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        provider = (params.get("provider") or "").upper() or None
+        if provider and provider not in SCAN_MODELS:
+            return Response({"error": f"Unknown provider {provider!r}"}, status=400)
+        scan_id = params.get("scanId") or None
+        if scan_id:
+            models = [SCAN_MODELS[provider]] if provider else list(SCAN_MODELS.values())
+            scan = next(filter(None, (get_scan(model, id=scan_id) for model in models)), None)
+            if not scan:
+                return Response({"error": "Scan not found"}, status=404)
+            scan_id = scan.id
+        try:
+            hits, next_cursor = search(
+                params.get("q"),
+                scan_id=scan_id,
+                account_id=params.get("accountId") or None,
+                provider=provider,
+                limit=page_size(params.get("limit")) or DEFAULT_PAGE_SIZE,
+                after=params.get("after"),
+            )
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        return Response({"hits": hits, "next": next_cursor})
+
+
+class AWSScanSummary(APIView):
+    """Return finding counts by severity, status, service and region."""
+
+    def get(self, request, scan_id=None):
+        return _summary(AWSScan, scan_id)
+
+
+class GCPScanSummary(APIView):
+    """Return finding counts by severity, status, service and region."""
+
+    def get(self, request, scan_id=None):
+        return _summary(GCPScan, scan_id)
+
+
+AWS_HISTORY_FIELDS = ["date", "provider", "region", "accountId", "findingsCount", "failedCount"]
+GCP_HISTORY_FIELDS = ["date", "provider", "region", "accountId", "projectId", "findingsCount", "failedCount"]
+
+
+def history_data(rows, fields):
+    """Serialize history rows to the ``fields`` the dashboard reads."""
+    return [
+        dict({"_id": str(row["_id"])}, **{field: row.get(field) for field in fields})
+        for row in rows
+    ]
+
+
+def _scan_history(request, model, fields):
+    """Return one page of scan metadata for the history endpoints.
+
+    Accepts ``limit``/``after`` cursor pagination plus ``accountId``,
+    ``projectId`` (comma-separated) and ``from``/``to`` ISO date filters.
+    """
+    params = request.query_params
+    try:
+        rows, next_cursor = scan_history(
+            model, params, limit=page_size(params.get("limit")), after=params.get("after")
+        )
+    except ValueError as exc:
+        return Response({"error": str(exc)}, status=400)
+    return Response({"data": history_data(rows, fields), "next": next_cursor})
 
 
 class AWSScanHistory(APIView):
     """Return a list of all AWS scans with basic info."""
 
     def get(self, request):
-        scans = AWSScan.objects.order_by('-date')
-        data = [
-            {
-                "_id": str(scan.id),
-                "date": scan.date,
-                "provider": scan.provider,
-                "region": scan.region,
-                "accountId": scan.accountId,
-            }
-            for scan in scans
-        ]
-        return Response({"data": data})
+        return _scan_history(request, AWSScan, AWS_HISTORY_FIELDS)
 
 
 class GCPScanHistory(APIView):
     """Return a list of all GCP scans with basic info."""
 
     def get(self, request):
-        scans = GCPScan.objects.order_by('-date')
-        data = [
-            {
-                "_id": str(scan.id),
-                "date": scan.date,
-                "provider": scan.provider,
-                "region": scan.region,
-                "accountId": scan.accountId,
-                "projectId": scan.projectId,
-            }
-            for scan in scans
-        ]
-        return Response({"data": data})
+        return _scan_history(request, GCPScan, GCP_HISTORY_FIELDS)
+
+
+def _scan_diff(request, model):
+    """Diff the ``base`` and ``head`` scans named in the query parameters.
+
+    ``include`` (comma-separated, default ``new,resolved``) selects which
+    changes list their findings; ``limit`` caps each list. Counts always
+    cover every change.
+    """
+    params = request.query_params
+    base_id, head_id = params.get("base"), params.get("head")
+    if not base_id or not head_id:
+        return Response({"error": "base and head are required"}, status=400)
+    include = [c.strip() for c in (params.get("include") or "new,resolved").split(",") if c.strip()]
+    unknown = [c for c in include if c not in CHANGES]
+    if unknown:
+        return Response({"error": f"Unknown change {unknown[0]!r}"}, status=400)
+    try:
+        limit = page_size(params.get("limit"))
+    except ValueError as exc:
+        return Response({"error": str(exc)}, status=400)
+    base = get_scan(model, id=base_id)
+    head = get_scan(model, id=head_id)
+    if not base or not head:
+        return Response({"error": "Scan not found"}, status=404)
+    diff = diff_scans(base, head, include=include, limit=limit)
+    return Response(dict(diff, base=str(base.id), head=str(head.id)))
+
+
+class AWSScanDiff(APIView):
+    """Return new, resolved and unchanged findings between two AWS scans."""
+
+    def get(self, request):
+        return _scan_diff(request, AWSScan)
+
+
+class GCPScanDiff(APIView):
+    """Return new, resolved and unchanged findings between two GCP scans."""
+
+    def get(self, request):
+        return _scan_diff(request, GCPScan)
+
+
+def _export_findings(request, model, params):
+    """Return a scan's findings as JSON, or stream them as CSV/XLSX.
+
+    ``format`` selects ``json`` (default), ``csv`` or ``xlsx``; ``columns``
+    picks dotted finding paths to export and ``gzip`` compresses the file.
+    """
+    scan_id = params.get("id")
+    if not scan_id:
+        return Response({"error": "Missing id"}, status=400)
+    fmt = (params.get("format") or "json").lower()
+    if fmt != "json" and fmt not in FORMATS:
+        return Response({"error": f"Unsupported format {fmt!r}"}, status=400)
+    scan = get_scan(model, id=scan_id)
+    if not scan:
+        return Response({"error": "Scan not found"}, status=404)
+    if fmt == "json":
+        return Response({"findings": load_findings(scan)})
+    compress = _truthy(params.get("gzip"))
+    return export_response(
+        scan, fmt, columns=parse_columns(params.get("columns")), compress=compress, asynchronous=_is_asgi(request)
+    )
 
 
 class AWSScanFindingsExcel(APIView):
     """Return findings for an AWS scan (used for Excel export)."""
 
+    def get(self, request):
+        return _export_findings(request, AWSScan, request.query_params)
+
     def post(self, request):
-        scan_id = request.data.get("id")
-        if not scan_id:
-            return Response({"error": "Missing id"}, status=400)
-        try:
-            scan = AWSScan.objects.get(id=scan_id)
-        except AWSScan.DoesNotExist:
-            return Response({"error": "Scan not found"}, status=404)
-        return Response({"findings": scan.findings})
+        return _export_findings(request, AWSScan, request.data)
 
 
 class GCPScanFindingsExcel(APIView):
     """Return findings for a GCP scan (used for Excel export)."""
 
+    def get(self, request):
+        return _export_findings(request, GCPScan, request.query_params)
+
     def post(self, request):
-        scan_id = request.data.get("id")
-        if not scan_id:
-            return Response({"error": "Missing id"}, status=400)
-        try:
-            scan = GCPScan.objects.get(id=scan_id)
-        except GCPScan.DoesNotExist:
-            return Response({"error": "Scan not found"}, status=404)
-        return Response({"findings": scan.findings})
+        return _export_findings(request, GCPScan, request.data)
 
 # --- Async scan helpers and API endpoints ---
 
-def _simulate_progress(scan_id):
-    """Simulate progress updates for demonstration purposes."""
-    for i in range(1, 11):
-        SCAN_JOBS[scan_id]["progress"] = i * 10
-        sleep(0.5)
-    SCAN_JOBS[scan_id]["result"] = {"status": "completed"}
-
-
 @csrf_exempt
 def prowler_scan_aws(request):
     """Start an async AWS scan and return a scan_id."""
     if request.method != "POST":
         return JsonResponse({"error": "Only POST allowed"}, status=405)
 
+    env_credentials = os.getenv("AWS_ACCESS_KEY_ID") and os.getenv("AWS_SECRET_ACCESS_KEY")
+    access_key = request.POST.get("accessKey")
+    secret_key = request.POST.get("secretKey")
+    if not env_credentials and (not access_key or not secret_key):
+        return JsonResponse({"error": "Missing AWS credentials"}, status=400)
+
+    try:
+        sharding = _sharding_params(request.POST)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    incremental = _incremental_params(request.POST)
+    if incremental and sharding:
+        return JsonResponse({"error": "Incremental scans cannot be sharded"}, status=400)
+    if incremental:
+        incremental["accountId"] = request.POST.get("accountId")
+    params = {
+        "region": request.POST.get("region", "all"),
+        "checks": request.POST.get("checks"),
+        "sharding": sharding,
+        "incremental": incremental,
+    }
+    key = flight_key(
+        "AWS", os.getenv("AWS_ACCESS_KEY_ID") if env_credentials else access_key,
+        params["region"], params["checks"], sharding=sharding, incremental=incremental,
+    )
     scan_id = str(uuid4())
-    SCAN_JOBS[scan_id] = {"progress": 0}
-    Thread(target=_simulate_progress, args=(scan_id,), daemon=True).start()
-    return JsonResponse({"scan_id": scan_id})
+    joined = claim(key, "AWS", scan_id, force=_truthy(request.POST.get("force")))
+    if joined:
+        return JsonResponse({"scan_id": joined, "coalesced": True})
+    if not env_credentials:
+        # Keep request credentials out of MongoDB; the job deletes this file.
+        with tempfile.NamedTemporaryFile("w", delete=False, suffix=".json") as creds:
+            json.dump({"accessKey": access_key, "secretKey": secret_key}, creds)
+        params["credentials_path"] = creds.name
+    job = enqueue("aws_scan", "AWS", params, scan_id=scan_id, host=HOST if "credentials_path" in params else None)
+    return JsonResponse({"scan_id": job.scan_id, "coalesced": False})
 
 
 @csrf_exempt
@@ -340,45 +647,113 @@ def prowler_scan_gcp(request):
     if not key_path:
         return JsonResponse({"error": "Invalid keyId"}, status=400)
 
-    scan_id = str(uuid4())
-    SCAN_JOBS[scan_id] = {"progress": 0}
+    # The job owns the key file from here on and deletes it when done.
+    TEMP_KEYS.pop(key_id, None)
+    params = {
+        "key_path": key_path,
+        "checks": request.POST.get("checks"),
+        "remove_key": True,
+        "incremental": _incremental_params(request.POST),
+    }
+    key = flight_key(
+        "GCP", project_id, checks=params["checks"],
+        credential=key_fingerprint(key_path), incremental=params["incremental"],
+    )
+    scan_id, joined = enqueue_coalesced(
+        key, "gcp_scan", "GCP", params, project_id=project_id, force=_truthy(request.POST.get("force")), host=HOST
+    )
+    if joined:
+        discard_key(key_path, scan_id)
+    return JsonResponse({"scan_id": scan_id, "coalesced": joined})
 
-    def run_scan():
-        progress_thread = Thread(target=_simulate_progress, args=(scan_id,), daemon=True)
-        progress_thread.start()
-        try:
-            csv_path = run_prowler_gcp(key_path, project_id=project_id)
-            findings = []
-            with open(csv_path, newline="") as csvfile:
-                reader = csv.DictReader(csvfile, delimiter=";")
-                for row in reader:
-                    findings.append(row)
-            scan = GCPScan(
-                date=datetime.now(),
-                provider="GCP",
-                accountId=findings[0].get("ACCOUNT_UID", "unknown"),
-                projectId=project_id,
-                region=findings[0].get("REGION", "global"),
-                findings=findings,
-            )
-            scan.save()
-            SCAN_JOBS[scan_id]["result"] = {"scanId": str(scan.id), "findingsCount": len(findings)}
-        except Exception as e:
-            SCAN_JOBS[scan_id]["result"] = {"error": str(e)}
-        finally:
-            os.remove(key_path)
-            TEMP_KEYS.pop(key_id, None)
 
-    Thread(target=run_scan, daemon=True).start()
-    return JsonResponse({"scan_id": scan_id})
+STATUS_FIELDS = ("progress", "status", "result", "checks_done", "checks_total", "current_service")
+
+
+def status_data(job):
+    """Return the progress payload of the scan status endpoints."""
+    return {
+        "progress": job.progress,
+        "result": job.result if job.status in (COMPLETED, ERROR) else None,
+        "checksDone": job.checks_done,
+        "checksTotal": job.checks_total,
+        "service": job.current_service,
+    }
 
 
 def scan_status(request, scan_id):
     """Return progress info for a running scan."""
-    job = SCAN_JOBS.get(scan_id)
+    job = ScanJob.objects(scan_id=scan_id).only(*STATUS_FIELDS).first()
     if not job:
         return JsonResponse({"error": "Not found"}, status=404)
-    return JsonResponse({"progress": job.get("progress", 0), "result": job.get("result")})
+    return JsonResponse(status_data(job))
+
+
+def _event_frame(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _event_stream(subscription, deadline):
+    """Yield SSE frames until every watched scan finished or ``deadline``."""
+    keepalive = getattr(settings, "SCAN_EVENTS_KEEPALIVE_SECONDS", 15)
+    pending = set(subscription.scan_ids)
+    try:
+        # Browsers reconnect after ``retry`` ms when the stream ends early.
+        yield "retry: 3000\n\n"
+        while pending and time.monotonic() < deadline:
+            item = subscription.get(timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            event, data = item
+            yield _event_frame(event, data)
+            if event in ("done", "missing"):
+                pending.discard(data["scanId"])
+    finally:
+        subscription.close()
+
+
+async def _aevent_stream(scan_ids, deadline):
+    """``_event_stream`` for ASGI servers, waiting on the event loop."""
+    subscription = get_hub().subscribe(scan_ids, loop=asyncio.get_running_loop())
+    keepalive = getattr(settings, "SCAN_EVENTS_KEEPALIVE_SECONDS", 15)
+    pending = set(subscription.scan_ids)
+    try:
+        yield "retry: 3000\n\n"
+        while pending and time.monotonic() < deadline:
+            item = await subscription.get(timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+            if item is None:
+                yield ": keepalive\n\n"
+                continue
+            event, data = item
+            yield _event_frame(event, data)
+            if event in ("done", "missing"):
+                pending.discard(data["scanId"])
+    finally:
+        subscription.close()
+
+
+def scan_events(request):
+    """Stream progress and completion of scans as Server-Sent Events.
+
+    ``ids`` is a comma-separated list of scan IDs. Each scan sends
+    ``progress`` events as it runs and one ``done`` (or ``missing``) event;
+    the stream ends once every scan is done or after
+    ``SCAN_EVENTS_MAX_SECONDS``. Under ASGI the stream is an async
+    iterator, so open streams hold no worker thread.
+    """
+    scan_ids = [i.strip() for i in (request.GET.get("ids") or "").split(",") if i.strip()]
+    if not scan_ids:
+        return JsonResponse({"error": "Missing ids"}, status=400)
+    deadline = time.monotonic() + getattr(settings, "SCAN_EVENTS_MAX_SECONDS", 300)
+    if _is_asgi(request):
+        stream = _aevent_stream(scan_ids, deadline)
+    else:
+        stream = _event_stream(get_hub().subscribe(scan_ids), deadline)
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 def api_prowler_scanlist(request):
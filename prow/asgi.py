@@ -0,0 +1,13 @@
+"""ASGI entry point.
+
+Serve with an ASGI server, e.g. ``uvicorn prow.asgi:application``, so the
+``aio/`` read endpoints run on the event loop.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "prow.settings")
+
+application = get_asgi_application()
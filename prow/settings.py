@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "cloudscan.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",      # << REQUIRED
@@ -60,6 +61,8 @@ TEMPLATES = [
 
 
 
+ASGI_APPLICATION = "prow.asgi.application"
+
 DATABASES = {
     # Django default DB (not used for Mongo)
     'default': {
@@ -71,6 +74,92 @@ DATABASES = {
 # MongoDB
 MONGODB_URI = os.getenv("MONGODB_URI")
 
+# Connection pool of the async client used by the ``aio/`` read endpoints,
+# per ASGI process.
+ASYNC_MONGO_MAX_POOL_SIZE = int(os.getenv("ASYNC_MONGO_MAX_POOL_SIZE", "100"))
+ASYNC_MONGO_MIN_POOL_SIZE = int(os.getenv("ASYNC_MONGO_MIN_POOL_SIZE", "0"))
+
+# Number of findings written to MongoDB per batch while ingesting a report.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+
+# Where new scans keep raw findings: "collection" (one document each) or
+# "compressed" (dictionary-encoded, compressed chunks of FINDINGS_CHUNK_SIZE).
+FINDINGS_STORAGE = os.getenv("FINDINGS_STORAGE", "collection")
+FINDINGS_CHUNK_SIZE = int(os.getenv("FINDINGS_CHUNK_SIZE", "1000"))
+
+# Scan executor: number of Prowler scans run at once per process, how long a
+# claimed job's lease lasts without a heartbeat, and how often a job is
+# retried after its worker died. With autostart the API process runs queued
+# jobs itself; otherwise run ``python manage.py run_scan_worker``.
+SCAN_WORKER_CONCURRENCY = int(os.getenv("SCAN_WORKER_CONCURRENCY", "2"))
+SCAN_JOB_LEASE_SECONDS = int(os.getenv("SCAN_JOB_LEASE_SECONDS", "60"))
+SCAN_JOB_MAX_ATTEMPTS = int(os.getenv("SCAN_JOB_MAX_ATTEMPTS", "3"))
+SCAN_EXECUTOR_AUTOSTART = os.getenv("SCAN_EXECUTOR_AUTOSTART", "true").lower() in ("1", "true", "yes")
+
+# Minimum seconds between progress writes to a running ScanJob.
+SCAN_PROGRESS_INTERVAL = float(os.getenv("SCAN_PROGRESS_INTERVAL", "2"))
+
+# Scan event streams: how often the shared poller reads watched jobs, how
+# often idle streams send a keepalive and how long one stream stays open.
+SCAN_EVENTS_POLL_SECONDS = float(os.getenv("SCAN_EVENTS_POLL_SECONDS", "1"))
+SCAN_EVENTS_KEEPALIVE_SECONDS = float(os.getenv("SCAN_EVENTS_KEEPALIVE_SECONDS", "15"))
+SCAN_EVENTS_MAX_SECONDS = float(os.getenv("SCAN_EVENTS_MAX_SECONDS", "300"))
+
+# Identical scan requests share one job: a completed scan is reused for
+# ``SCAN_COALESCE_FRESH_SECONDS`` (0 always rescans), and a synchronous scan
+# whose job has not changed for ``SCAN_COALESCE_STALE_SECONDS`` is assumed dead.
+SCAN_COALESCE_FRESH_SECONDS = float(os.getenv("SCAN_COALESCE_FRESH_SECONDS", "300"))
+SCAN_COALESCE_STALE_SECONDS = float(os.getenv("SCAN_COALESCE_STALE_SECONDS", "10800"))
+
+# Sharded AWS scans: regions scanned for region="all" and how many Prowler
+# processes may run at once for a single scan.
+AWS_SCAN_REGIONS = [
+    r.strip()
+    for r in os.getenv(
+        "AWS_SCAN_REGIONS",
+        "us-east-1,us-east-2,us-west-1,us-west-2,ca-central-1,sa-east-1,"
+        "eu-west-1,eu-west-2,eu-west-3,eu-central-1,eu-north-1,"
+        "ap-south-1,ap-northeast-1,ap-northeast-2,ap-northeast-3,ap-southeast-1,ap-southeast-2",
+    ).split(",")
+    if r.strip()
+]
+AWS_SHARD_PARALLELISM = int(os.getenv("AWS_SHARD_PARALLELISM", "4"))
+
+# Projects of a multi-project GCP scan that are queued at the same time.
+GCP_FANOUT_MAX_PARALLEL = int(os.getenv("GCP_FANOUT_MAX_PARALLEL", "4"))
+
+# How long the projects visible to an uploaded GCP key are cached.
+GCP_PROJECTS_CACHE_SECONDS = int(os.getenv("GCP_PROJECTS_CACHE_SECONDS", "300"))
+
+# Upper bound for the ``limit`` parameter of the findings endpoints.
+FINDINGS_MAX_PAGE_SIZE = int(os.getenv("FINDINGS_MAX_PAGE_SIZE", "1000"))
+
+# Memory each process may spend keeping recently used scans' findings in
+# columnar form for fast filtering and grouping; 0 disables the cache.
+FINDINGS_MEMORY_CACHE_BYTES = int(os.getenv("FINDINGS_MEMORY_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+# Whether ingestion adds findings to the full-text search index.
+FINDINGS_SEARCH_INDEX = os.getenv("FINDINGS_SEARCH_INDEX", "true").lower() in ("1", "true", "yes")
+# Queries whose rarest word matches more findings than this are rejected.
+FINDINGS_SEARCH_MAX_CANDIDATES = int(os.getenv("FINDINGS_SEARCH_MAX_CANDIDATES", "100000"))
+
+# Incremental rescans: how old a check's result may get before it is rerun,
+# in seconds. ``CHECK_MAX_AGE_OVERRIDES`` takes ``check_or_service=seconds``
+# pairs, e.g. ``iam=604800,s3_bucket_public_access=3600``.
+CHECK_MAX_AGE_SECONDS = int(os.getenv("CHECK_MAX_AGE_SECONDS", "86400"))
+CHECK_MAX_AGE_OVERRIDES = {
+    key.strip(): int(value)
+    for key, _, value in (
+        item.partition("=") for item in os.getenv("CHECK_MAX_AGE_OVERRIDES", "").split(",")
+    )
+    if key.strip() and value.strip()
+}
+
+# Findings responses: how long clients may cache a scan fetched by ID, and the
+# smallest body worth compressing.
+FINDINGS_CACHE_SECONDS = int(os.getenv("FINDINGS_CACHE_SECONDS", "86400"))
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+
 STATIC_URL = '/static/'
 
 # Allow cross-origin requests from the React dev server
@@ -2,7 +2,11 @@
 from django.urls import path, include
 from django.contrib import admin
 
+from cloudscan.health import HealthCheckView, MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/prowler/', include('cloudscan.urls')),   # <--- ADD PREFIX HERE
+    path('health/', HealthCheckView.as_view(), name='health'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]